@@ -0,0 +1,89 @@
+"""Add email verification token table
+
+Revision ID: 3f2a9c1d7e84
+Revises: c8e94b9fbfc4
+Create Date: 2026-10-18 10:12:41.503216
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "3f2a9c1d7e84"
+down_revision: Union[str, None] = "c8e94b9fbfc4"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "emailverificationtoken",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("token_hash", sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("expires_at", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("created_at", sa.DateTime(timezone=True), nullable=True),
+        sa.ForeignKeyConstraint(["user_id"], ["user.id"]),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(
+        op.f("ix_emailverificationtoken_token_hash"),
+        "emailverificationtoken",
+        ["token_hash"],
+        unique=True,
+    )
+    op.create_index(
+        op.f("ix_emailverificationtoken_user_id"),
+        "emailverificationtoken",
+        ["user_id"],
+        unique=False,
+    )
+    op.create_index(
+        op.f("ix_emailverificationtoken_expires_at"),
+        "emailverificationtoken",
+        ["expires_at"],
+        unique=False,
+    )
+
+    # Carry outstanding tokens over, hashed, with a fresh 24 hour expiry
+    op.execute(
+        """
+        INSERT INTO emailverificationtoken (token_hash, user_id, expires_at, created_at)
+        SELECT encode(sha256(convert_to(email_verification_token, 'UTF8')), 'hex'),
+               id,
+               now() + interval '24 hours',
+               now()
+        FROM "user"
+        WHERE email_verification_token IS NOT NULL
+        """
+    )
+    op.drop_column("user", "email_verification_token")
+
+
+def downgrade() -> None:
+    # Only token hashes are stored, so outstanding tokens cannot be restored
+    op.add_column(
+        "user",
+        sa.Column(
+            "email_verification_token",
+            sqlmodel.sql.sqltypes.AutoString(),
+            nullable=True,
+        ),
+    )
+    op.drop_index(
+        op.f("ix_emailverificationtoken_expires_at"),
+        table_name="emailverificationtoken",
+    )
+    op.drop_index(
+        op.f("ix_emailverificationtoken_user_id"), table_name="emailverificationtoken"
+    )
+    op.drop_index(
+        op.f("ix_emailverificationtoken_token_hash"),
+        table_name="emailverificationtoken",
+    )
+    op.drop_table("emailverificationtoken")
@@ -0,0 +1,36 @@
+"""Add user timezone
+
+Revision ID: 5e8c2b7a9d41
+Revises: b7d41e9a2c63
+Create Date: 2026-10-18 15:21:09.402877
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "5e8c2b7a9d41"
+down_revision: Union[str, None] = "b7d41e9a2c63"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "user",
+        sa.Column(
+            "timezone",
+            sqlmodel.sql.sqltypes.AutoString(),
+            nullable=False,
+            server_default="UTC",
+        ),
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("user", "timezone")
@@ -0,0 +1,71 @@
+"""Add daily study rollup table
+
+Revision ID: 9a6f3d2e1b57
+Revises: 5e8c2b7a9d41
+Create Date: 2026-10-18 16:02:44.871305
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "9a6f3d2e1b57"
+down_revision: Union[str, None] = "5e8c2b7a9d41"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Rollups of finished blocks, as app.study_rollup recomputes them
+BACKFILL_SQL = """
+INSERT INTO dailystudyrollup (
+    user_id, local_day, study_category_id,
+    total_seconds, block_count, rating_sum, rating_count
+)
+SELECT
+    studyblock.user_id,
+    CAST(timezone("user".timezone, studyblock.start_time) AS DATE),
+    studyblock.study_category_id,
+    sum(trunc(extract(epoch FROM studyblock.end_time - studyblock.start_time))),
+    count(*),
+    coalesce(sum(studyblock.rating), 0),
+    count(studyblock.rating)
+FROM studyblock
+JOIN "user" ON "user".id = studyblock.user_id
+WHERE studyblock.end_time IS NOT NULL
+GROUP BY 1, 2, 3
+"""
+
+
+def upgrade() -> None:
+    op.create_table(
+        "dailystudyrollup",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("local_day", sa.Date(), nullable=False),
+        sa.Column("total_seconds", sa.BigInteger(), nullable=False),
+        sa.Column("block_count", sa.Integer(), nullable=False),
+        sa.Column("rating_sum", sa.Float(), nullable=False),
+        sa.Column("rating_count", sa.Integer(), nullable=False),
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("study_category_id", sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(
+            ["study_category_id"], ["studycategory.id"], ondelete="CASCADE"
+        ),
+        sa.ForeignKeyConstraint(["user_id"], ["user.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint(
+            "user_id",
+            "local_day",
+            "study_category_id",
+            postgresql_nulls_not_distinct=True,
+        ),
+    )
+
+    op.execute(BACKFILL_SQL)
+
+
+def downgrade() -> None:
+    op.drop_table("dailystudyrollup")
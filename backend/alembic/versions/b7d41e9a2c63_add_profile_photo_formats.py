@@ -0,0 +1,35 @@
+"""Add profile photo formats
+
+Revision ID: b7d41e9a2c63
+Revises: 3f2a9c1d7e84
+Create Date: 2026-10-18 14:03:27.118402
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "b7d41e9a2c63"
+down_revision: Union[str, None] = "3f2a9c1d7e84"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "user",
+        sa.Column(
+            "profile_photo_formats",
+            sqlmodel.sql.sqltypes.AutoString(),
+            nullable=True,
+        ),
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("user", "profile_photo_formats")
@@ -0,0 +1,122 @@
+"""Add study block hot query indexes
+
+Also enforces one unfinished block per user. Existing duplicates are closed
+first: every unfinished block but a user's latest gets end_time = start_time,
+a zero duration block counted in the daily rollup. This can't be undone by
+the downgrade.
+
+Revision ID: c2e8f5a17d39
+Revises: 9a6f3d2e1b57
+Create Date: 2026-10-18 16:41:27.193846
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "c2e8f5a17d39"
+down_revision: Union[str, None] = "9a6f3d2e1b57"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _index_valid(name: str) -> bool | None:
+    """
+    Return whether the index is valid, or None if it doesn't exist.
+    """
+    return (
+        op.get_bind()
+        .execute(
+            sa.text(
+                "SELECT pg_index.indisvalid FROM pg_index "
+                "JOIN pg_class ON pg_class.oid = pg_index.indexrelid "
+                "WHERE pg_class.relname = :name"
+            ),
+            {"name": name},
+        )
+        .scalar()
+    )
+
+
+def _create_index_concurrently(name: str, *args, **kwargs) -> None:
+    # A failed concurrent build leaves an INVALID index behind. Drop it so a
+    # re-run builds it again instead of treating it as done.
+    if _index_valid(name) is False:
+        op.drop_index(name, table_name="studyblock", postgresql_concurrently=True)
+    op.create_index(name, "studyblock", *args, postgresql_concurrently=True, **kwargs)
+    if not _index_valid(name):
+        raise RuntimeError(f"Index {name} was not built; re-run the migration")
+
+
+def upgrade() -> None:
+    # The old check-then-insert could race, so close all but each user's
+    # latest unfinished block before enforcing uniqueness. They are closed
+    # with zero duration and counted in the rollup like any finished block.
+    op.execute(
+        """
+        WITH closed AS (
+            UPDATE studyblock SET end_time = start_time
+            WHERE end_time IS NULL AND id NOT IN (
+                SELECT DISTINCT ON (user_id) id
+                FROM studyblock
+                WHERE end_time IS NULL
+                ORDER BY user_id, start_time DESC, id DESC
+            )
+            RETURNING user_id, start_time, study_category_id, rating
+        )
+        INSERT INTO dailystudyrollup (
+            user_id, local_day, study_category_id,
+            total_seconds, block_count, rating_sum, rating_count
+        )
+        SELECT
+            closed.user_id,
+            CAST(timezone("user".timezone, closed.start_time) AS DATE),
+            closed.study_category_id,
+            0,
+            count(*),
+            coalesce(sum(closed.rating), 0),
+            count(closed.rating)
+        FROM closed
+        JOIN "user" ON "user".id = closed.user_id
+        GROUP BY 1, 2, 3
+        ON CONFLICT (user_id, local_day, study_category_id) DO UPDATE SET
+            block_count = dailystudyrollup.block_count + excluded.block_count,
+            rating_sum = dailystudyrollup.rating_sum + excluded.rating_sum,
+            rating_count = dailystudyrollup.rating_count + excluded.rating_count
+        """
+    )
+
+    # Build without blocking writes; CONCURRENTLY can't run in a transaction
+    with op.get_context().autocommit_block():
+        _create_index_concurrently(
+            "ix_studyblock_user_id_start_time",
+            ["user_id", sa.text("start_time DESC")],
+        )
+        # Fails if an old app instance opened a second block since the
+        # cleanup above; re-running repeats the cleanup
+        _create_index_concurrently(
+            "uq_studyblock_user_id_open",
+            ["user_id"],
+            unique=True,
+            postgresql_where=sa.text("end_time IS NULL"),
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            "uq_studyblock_user_id_open",
+            table_name="studyblock",
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
+        op.drop_index(
+            "ix_studyblock_user_id_start_time",
+            table_name="studyblock",
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
@@ -1,35 +1,42 @@
 import random
 
 import httpx
-from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, logger
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 from fastapi.security import OAuth2AuthorizationCodeBearer
 from pydantic import EmailStr
 from redis.asyncio import Redis
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 
 from ..database import get_session
-from ..dependencies import get_redis
+from ..dependencies import get_http_client, get_redis, get_session_store
 from ..email.email_service import send_email, send_verification_email
 from ..models.user import User as UserModel
-from ..uploads.upload_services import get_profile_photo_urls
+from ..routers.utils import get_current_user_id
+from ..user_cache import cache_user_snapshot, invalidate_user_snapshot
 from .auth_schemas import (
     EmailVerificationRequest,
     LoginRequest,
     PasswordChangeRequest,
     RegistrationRequest,
-    ResendVerificationEmailRequest,
     SocialProvider,
 )
 from .auth_utils import (
-    create_session,
-    delete_session,
-    generate_verification_token,
-    get_user_id_from_session,
+    create_verification_token,
     hash_password,
+    set_session_cookie,
+    verify_and_update_password,
     verify_email_token,
     verify_password,
 )
+from .oauth_providers import (
+    OAuthError,
+    exchange_github_code,
+    fetch_github_userinfo,
+    fetch_google_userinfo,
+)
+from .session_store import SessionStore
 
 router = APIRouter()
 
@@ -41,14 +48,22 @@ oauth2_scheme = OAuth2AuthorizationCodeBearer(
 
 async def authenticate_user(
     username: str, password: str, session: AsyncSession
-) -> int | None:
+) -> UserModel | None:
     result = await session.execute(
         select(UserModel).where(UserModel.username == username)
     )
     user = result.scalar_one_or_none()
-    if user and verify_password(password, user.hashed_password):
-        return user.id
-    return None
+    if not user or not user.hashed_password:
+        return None
+    is_valid, new_hash = await verify_and_update_password(
+        password, user.hashed_password
+    )
+    if not is_valid:
+        return None
+    if new_hash:
+        user.hashed_password = new_hash
+        await session.commit()
+    return user
 
 
 @router.post("/login")
@@ -56,34 +71,23 @@ async def login(
     response: Response,
     login_request: LoginRequest,
     redis: Redis = Depends(get_redis),
+    session_store: SessionStore = Depends(get_session_store),
     session: AsyncSession = Depends(get_session),
 ):
-    user_id = await authenticate_user(
+    user = await authenticate_user(
         login_request.username, login_request.password, session
     )
-    if not user_id:
-        raise HTTPException(status_code=401, detail="Incorrect username or password")
-    result = await session.execute(select(UserModel).where(UserModel.id == user_id))
-    user = result.scalar_one_or_none()
     if not user:
-        raise HTTPException(status_code=404, detail="User not found")
+        raise HTTPException(status_code=401, detail="Incorrect username or password")
     if not user.is_email_verified:
         raise HTTPException(status_code=403, detail="Email not verified")
-    session_id = await create_session(redis, user_id, expiry=30 * 24 * 3600)
-    response.set_cookie(
-        key="session_id",
-        value=session_id,
-        httponly=True,
-        secure=True,
-        samesite="lax",
-        max_age=30 * 24 * 3600,
-    )
-    user_data = user.__dict__
-    user_data.pop("hashed_password", None)
-    user_data["profile_photo_urls"] = await get_profile_photo_urls(
-        user.profile_photo_key
-    )
-    return user_data
+    session_id = await session_store.create(user.id)
+    set_session_cookie(response, session_id)
+    return await cache_user_snapshot(redis, user)
+
+
+USERNAME_CANDIDATE_BATCH_SIZE = 20
+USER_CREATE_MAX_ATTEMPTS = 3
 
 
 async def generate_unique_username(session: AsyncSession, first_name: str) -> str:
@@ -93,113 +97,144 @@ async def generate_unique_username(session: AsyncSession, first_name: str) -> st
     if not base_username:
         base_username = "user"
 
+    # Check a batch of random candidates per query rather than one at a time
     while True:
-        random_suffix = "".join([str(random.randint(0, 9)) for _ in range(5)])
-        username = f"{base_username}{random_suffix}"
-
+        candidates = {
+            f"{base_username}{random.randint(0, 99999):05d}"
+            for _ in range(USERNAME_CANDIDATE_BATCH_SIZE)
+        }
         result = await session.execute(
-            select(UserModel).where(UserModel.username == username)
+            select(UserModel.username).where(UserModel.username.in_(candidates))
         )
-        if not result.scalar_one_or_none():
-            return username
+        available = candidates - set(result.scalars().all())
+        if available:
+            return available.pop()
 
 
 async def get_or_create_user(
     session: AsyncSession,
     email: str,
-    username: str,
     first_name: str,
     last_name: str,
     social_provider: SocialProvider,
     social_id: str,
 ) -> UserModel:
-    result = await session.execute(select(UserModel).where(UserModel.email == email))
-    user = result.scalar_one_or_none()
-    if user:
-        user.social_provider = social_provider
-        user.social_id = social_id
-        user.is_email_verified = True
-        user.first_name = first_name
-        user.last_name = last_name
-    else:
-        user = UserModel(
-            email=email,
-            username=username,
-            first_name=first_name,
-            last_name=last_name,
-            social_provider=social_provider,
-            social_id=social_id,
-            is_email_verified=True,
+    for _ in range(USER_CREATE_MAX_ATTEMPTS):
+        result = await session.execute(
+            select(UserModel).where(UserModel.email == email)
         )
-        session.add(user)
-    await session.commit()
-    await session.refresh(user)
-    return user
+        user = result.scalar_one_or_none()
+        if user:
+            user.social_provider = social_provider
+            user.social_id = social_id
+            user.is_email_verified = True
+            user.first_name = first_name
+            user.last_name = last_name
+        else:
+            user = UserModel(
+                email=email,
+                username=await generate_unique_username(session, first_name),
+                first_name=first_name,
+                last_name=last_name,
+                social_provider=social_provider,
+                social_id=social_id,
+                is_email_verified=True,
+            )
+            session.add(user)
+        try:
+            await session.commit()
+        except IntegrityError:
+            # A concurrent sign-in claimed the username or email first
+            await session.rollback()
+            continue
+        await session.refresh(user)
+        return user
+
+    raise HTTPException(
+        status_code=409, detail="Could not create user, please try again"
+    )
+
+
+async def complete_social_login(
+    response: Response,
+    redis: Redis,
+    session_store: SessionStore,
+    session: AsyncSession,
+    user_info: dict,
+    social_provider: SocialProvider,
+):
+    if not user_info["email"]:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Email not provided by {social_provider.value.title()}",
+        )
+
+    # Get or create user, generating a unique username for new users
+    user = await get_or_create_user(
+        session,
+        email=user_info["email"],
+        first_name=user_info["first_name"],
+        last_name=user_info["last_name"],
+        social_provider=social_provider,
+        social_id=user_info["social_id"],
+    )
+
+    # Create session
+    session_id = await session_store.create(user.id)
+    set_session_cookie(response, session_id)
+
+    # Prepare user data for response
+    return await cache_user_snapshot(redis, user)
 
 
 @router.post("/google-login")
 async def google_login(
     response: Response,
     redis: Redis = Depends(get_redis),
+    session_store: SessionStore = Depends(get_session_store),
     session: AsyncSession = Depends(get_session),
+    http_client: httpx.AsyncClient = Depends(get_http_client),
     access_token: str = Query(..., description="Google access token"),
 ):
     try:
-        # Fetch user info from Google
-        async with httpx.AsyncClient() as client:
-            resp = await client.get(
-                "https://www.googleapis.com/oauth2/v3/userinfo",
-                headers={"Authorization": f"Bearer {access_token}"},
-            )
-            resp.raise_for_status()
-            user_info = resp.json()
-
-        # Extract necessary information
-        userid = user_info["sub"]
-        email = user_info["email"]
-        first_name = user_info.get("given_name", "")
-        last_name = user_info.get("family_name", "")
-
-        if not email:
-            raise HTTPException(status_code=400, detail="Email not provided by Google")
-
-        # Generate a unique username
-        username = await generate_unique_username(session, first_name)
-
-        # Get or create user
-        user = await get_or_create_user(
-            session,
-            email=email,
-            username=username,
-            first_name=first_name,
-            last_name=last_name,
-            social_provider=SocialProvider.GOOGLE,
-            social_id=userid,
+        user_info = await fetch_google_userinfo(http_client, access_token)
+        return await complete_social_login(
+            response, redis, session_store, session, user_info, SocialProvider.GOOGLE
         )
 
-        # Create session
-        session_id = await create_session(redis, user.id, expiry=30 * 24 * 3600)
-        response.set_cookie(
-            key="session_id",
-            value=session_id,
-            httponly=True,
-            secure=True,
-            samesite="lax",
-            max_age=30 * 24 * 3600,
+    except HTTPException:
+        raise
+    except httpx.HTTPError as e:
+        raise HTTPException(
+            status_code=400, detail=f"Failed to fetch user info from Google: {str(e)}"
         )
-
-        # Prepare user data for response
-        user_data = user.__dict__
-        user_data.pop("hashed_password", None)
-        user_data["profile_photo_urls"] = await get_profile_photo_urls(
-            user.profile_photo_key
+    except Exception as e:
+        raise HTTPException(
+            status_code=500, detail=f"An unexpected error occurred: {str(e)}"
         )
 
-        return user_data
 
-    except httpx.HTTPError as e:
+@router.post("/github-login")
+async def github_login(
+    response: Response,
+    redis: Redis = Depends(get_redis),
+    session_store: SessionStore = Depends(get_session_store),
+    session: AsyncSession = Depends(get_session),
+    http_client: httpx.AsyncClient = Depends(get_http_client),
+    code: str = Query(..., description="GitHub OAuth authorization code"),
+):
+    try:
+        access_token = await exchange_github_code(http_client, code)
+        user_info = await fetch_github_userinfo(http_client, access_token)
+        return await complete_social_login(
+            response, redis, session_store, session, user_info, SocialProvider.GITHUB
+        )
+
+    except HTTPException:
+        raise
+    except (httpx.HTTPError, OAuthError) as e:
         raise HTTPException(
-            status_code=400, detail=f"Failed to fetch user info from Google: {str(e)}"
+            status_code=400, detail=f"Failed to fetch user info from GitHub: {str(e)}"
         )
     except Exception as e:
         raise HTTPException(
@@ -210,6 +245,7 @@ async def google_login(
 @router.post("/register")
 async def register(
     registration_request: RegistrationRequest,
+    redis: Redis = Depends(get_redis),
     session: AsyncSession = Depends(get_session),
 ):
     result = await session.execute(
@@ -221,21 +257,21 @@ async def register(
     if result.scalar_one_or_none():
         raise HTTPException(status_code=400, detail="Username or email already exists")
 
-    hashed_password = hash_password(registration_request.password)
-    verification_token = await generate_verification_token()
+    hashed_password = await hash_password(registration_request.password)
     new_user = UserModel(
         username=registration_request.username,
         email=registration_request.email,
         hashed_password=hashed_password,
         is_email_verified=False,
-        email_verification_token=verification_token,
     )
 
     session.add(new_user)
+    await session.flush()
+    verification_token = await create_verification_token(session, new_user.id)
     await session.commit()
     await session.refresh(new_user)
 
-    await send_verification_email(new_user.email, verification_token)
+    await send_verification_email(redis, new_user.email, verification_token)
 
     return {
         "id": new_user.id,
@@ -246,9 +282,12 @@ async def register(
 @router.post("/verify-email")
 async def verify_email(
     verification_request: EmailVerificationRequest,
+    redis: Redis = Depends(get_redis),
     session: AsyncSession = Depends(get_session),
 ):
-    if await verify_email_token(session, verification_request.token):
+    user_id = await verify_email_token(session, verification_request.token)
+    if user_id:
+        await invalidate_user_snapshot(redis, user_id)
         return {"message": "Email verified successfully"}
     raise HTTPException(status_code=400, detail="Invalid or expired verification token")
 
@@ -256,7 +295,8 @@ async def verify_email(
 @router.post("/resend-verification-email")
 async def resend_verification_email(
     username: str,
-    session: AsyncSession = Depends(get_session)
+    redis: Redis = Depends(get_redis),
+    session: AsyncSession = Depends(get_session),
 ):
     result = await session.execute(
         select(UserModel).where(UserModel.username == username)
@@ -266,26 +306,38 @@ async def resend_verification_email(
         raise HTTPException(status_code=404, detail="User not found")
     if user.is_email_verified:
         raise HTTPException(status_code=400, detail="Email already verified")
-    
-    verification_token = await generate_verification_token()
-    user.email_verification_token = verification_token
+
+    verification_token = await create_verification_token(session, user.id)
     await session.commit()
-    
-    await send_verification_email(user.email, verification_token)
+
+    await send_verification_email(redis, user.email, verification_token)
     return {"message": "Verification email sent"}
 
 
 @router.post("/logout")
 async def logout(
-    response: Response, request: Request, redis: Redis = Depends(get_redis)
+    response: Response,
+    request: Request,
+    session_store: SessionStore = Depends(get_session_store),
 ):
     session_id = request.cookies.get("session_id")
     if session_id:
-        await delete_session(redis, session_id)
+        await session_store.delete(session_id)
     response.delete_cookie(key="session_id")
     return {"message": "Logged out"}
 
 
+@router.post("/logout-all")
+async def logout_all(
+    response: Response,
+    session_store: SessionStore = Depends(get_session_store),
+    user_id: int = Depends(get_current_user_id),
+):
+    await session_store.delete_all_for_user(user_id)
+    response.delete_cookie(key="session_id")
+    return {"message": "Logged out of all sessions"}
+
+
 @router.post("/validate-session")
 async def validate_session(request: Request):
     user_id = getattr(request.state, "user_id", None)
@@ -294,37 +346,31 @@ async def validate_session(request: Request):
 
 @router.post("/change-password")
 async def change_password(
-    request: Request,
     password_change: PasswordChangeRequest,
-    redis: Redis = Depends(get_redis),
     session: AsyncSession = Depends(get_session),
+    user_id: int = Depends(get_current_user_id),
 ):
-    session_id = request.cookies.get("session_id")
-    if not session_id:
-        raise HTTPException(status_code=401, detail="No session ID found")
-
-    user_id = await get_user_id_from_session(redis, session_id)
-    if not user_id:
-        raise HTTPException(
-            status_code=401, detail="Invalid session or session expired"
-        )
-
     result = await session.execute(select(UserModel).where(UserModel.id == user_id))
     user = result.scalar_one_or_none()
-    if not user or not verify_password(
-        password_change.current_password, user.hashed_password
+    if (
+        not user
+        or not user.hashed_password
+        or not await verify_password(
+            password_change.current_password, user.hashed_password
+        )
     ):
         raise HTTPException(status_code=403, detail="Current password is incorrect")
 
-    user.hashed_password = hash_password(password_change.new_password)
+    user.hashed_password = await hash_password(password_change.new_password)
     await session.commit()
 
     return {"message": "Password changed successfully"}
 
 
 @router.post("/test-email")
-async def test_email(email: EmailStr):
+async def test_email(email: EmailStr, redis: Redis = Depends(get_redis)):
     await send_email(
+        redis,
         email,
         "Deep Work Timer Validation",
         "<h1>This is an email to validate Deep Work Timer</h1>",
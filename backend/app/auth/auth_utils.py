@@ -1,53 +1,135 @@
-import uuid
+import asyncio
+import hashlib
+import secrets
+from concurrent.futures import ThreadPoolExecutor
+from datetime import UTC, datetime, timedelta
+
+from fastapi import HTTPException, Response
 from passlib.context import CryptContext
-from redis.asyncio import Redis
+from sqlalchemy import delete, update
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.future import select
+
+from .. import metrics
+from ..config import settings
+from ..models.email_verification_token import EmailVerificationToken
 from ..models.user import User
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+pwd_context = CryptContext(
+    schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=settings.BCRYPT_ROUNDS
+)
+
+# bcrypt releases the GIL, so a small thread pool keeps it off the event loop
+password_executor = ThreadPoolExecutor(
+    max_workers=settings.PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash"
+)
+_pending_password_jobs = 0
+
+metrics.register_gauge("password_hash.pending", lambda: _pending_password_jobs)
+metrics.register_gauge(
+    "password_hash.queue_depth",
+    lambda: max(0, _pending_password_jobs - settings.PASSWORD_HASH_WORKERS),
+)
 
 
-def hash_password(password: str) -> str:
-    return pwd_context.hash(password)
+async def _run_password_job(func, *args):
+    global _pending_password_jobs
+    if _pending_password_jobs >= settings.PASSWORD_HASH_MAX_PENDING:
+        metrics.increment("password_hash.rejected")
+        raise HTTPException(
+            status_code=503,
+            detail="Server is busy, please try again",
+            headers={"Retry-After": "1"},
+        )
+    _pending_password_jobs += 1
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(password_executor, func, *args)
+    finally:
+        _pending_password_jobs -= 1
 
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+async def hash_password(password: str) -> str:
+    return await _run_password_job(pwd_context.hash, password)
 
 
-async def create_session(
-    redis: Redis, user_id: int, expiry: int = 30 * 24 * 3600
-) -> str:
-    session_id = str(uuid.uuid4())
-    await redis.setex(f"session:{session_id}", expiry, str(user_id))
-    return session_id
+async def verify_password(plain_password: str, hashed_password: str) -> bool:
+    return await _run_password_job(pwd_context.verify, plain_password, hashed_password)
 
 
-async def get_user_id_from_session(redis: Redis, session_id: str) -> int | None:
-    key = f"session:{session_id}"
-    user_id = await redis.get(key)
-    if user_id:
-        await redis.expire(key, 30 * 24 * 3600)
-    return int(user_id) if user_id else None
+async def verify_and_update_password(
+    plain_password: str, hashed_password: str
+) -> tuple[bool, str | None]:
+    """
+    Verify a password, also returning a new hash if the stored one was made
+    with outdated settings (e.g. a lower BCRYPT_ROUNDS).
+    """
+    return await _run_password_job(
+        pwd_context.verify_and_update, plain_password, hashed_password
+    )
+
+
+def set_session_cookie(response: Response, session_id: str) -> None:
+    response.set_cookie(
+        key="session_id",
+        value=session_id,
+        httponly=True,
+        secure=True,
+        samesite="lax",
+        max_age=settings.SESSION_EXPIRY,
+    )
 
 
-async def delete_session(redis, session_id: str) -> None:
-    await redis.delete(f"session:{session_id}")
+def hash_verification_token(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
 
 
-async def generate_verification_token() -> str:
-    return str(uuid.uuid4())
+async def create_verification_token(session: AsyncSession, user_id: int) -> str:
+    """
+    Issue a new email verification token for `user_id`, replacing any
+    outstanding ones. The caller commits the session.
+    """
+    token = secrets.token_urlsafe(32)
+    await session.execute(
+        delete(EmailVerificationToken).where(EmailVerificationToken.user_id == user_id)
+    )
+    session.add(
+        EmailVerificationToken(
+            token_hash=hash_verification_token(token),
+            user_id=user_id,
+            expires_at=datetime.now(UTC)
+            + timedelta(seconds=settings.EMAIL_VERIFICATION_TOKEN_TTL),
+        )
+    )
+    return token
+
+
+async def verify_email_token(session: AsyncSession, token: str) -> int | None:
+    """
+    Consume `token`, mark its user as verified and return their id.
+    """
+    result = await session.execute(
+        delete(EmailVerificationToken)
+        .where(
+            EmailVerificationToken.token_hash == hash_verification_token(token),
+            EmailVerificationToken.expires_at > datetime.now(UTC),
+        )
+        .returning(EmailVerificationToken.user_id)
+    )
+    user_id = result.scalar_one_or_none()
+    if user_id is None:
+        return None
+    await session.execute(
+        update(User).where(User.id == user_id).values(is_email_verified=True)
+    )
+    await session.commit()
+    return user_id
 
 
-async def verify_email_token(session: AsyncSession, token: str) -> bool:
+async def purge_expired_verification_tokens(session: AsyncSession) -> int:
     result = await session.execute(
-        select(User).where(User.email_verification_token == token)
+        delete(EmailVerificationToken).where(
+            EmailVerificationToken.expires_at <= datetime.now(UTC)
+        )
     )
-    user = result.scalar_one_or_none()
-    if user:
-        user.is_email_verified = True
-        user.email_verification_token = None
-        await session.commit()
-        return True
-    return False
+    await session.commit()
+    return result.rowcount
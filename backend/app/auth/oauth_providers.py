@@ -0,0 +1,117 @@
+import hashlib
+import importlib.util
+
+import httpx
+
+from ..cache import TTLCache
+from ..config import settings
+
+GOOGLE_USERINFO_URL = "https://www.googleapis.com/oauth2/v3/userinfo"
+GITHUB_TOKEN_URL = "https://github.com/login/oauth/access_token"
+GITHUB_USER_URL = "https://api.github.com/user"
+GITHUB_EMAILS_URL = "https://api.github.com/user/emails"
+
+# Short-lived cache of sha256(provider + access token) -> normalized user info
+userinfo_cache = TTLCache(
+    "oauth_userinfo", maxsize=1_000, ttl=settings.OAUTH_USERINFO_CACHE_TTL
+)
+
+
+class OAuthError(Exception):
+    pass
+
+
+def create_http_client() -> httpx.AsyncClient:
+    """
+    Create the pooled client shared by every outbound OAuth provider call.
+    """
+    return httpx.AsyncClient(
+        # HTTP/2 needs the optional h2 package
+        http2=importlib.util.find_spec("h2") is not None,
+        timeout=httpx.Timeout(settings.OAUTH_HTTP_TIMEOUT, connect=2.0),
+        limits=httpx.Limits(
+            max_connections=50, max_keepalive_connections=10, keepalive_expiry=60
+        ),
+    )
+
+
+def _userinfo_cache_key(provider: str, access_token: str) -> str:
+    return hashlib.sha256(f"{provider}:{access_token}".encode()).hexdigest()
+
+
+async def fetch_google_userinfo(client: httpx.AsyncClient, access_token: str) -> dict:
+    cache_key = _userinfo_cache_key("google", access_token)
+    user_info = userinfo_cache.get(cache_key)
+    if user_info is not None:
+        return user_info
+
+    resp = await client.get(
+        GOOGLE_USERINFO_URL,
+        headers={"Authorization": f"Bearer {access_token}"},
+    )
+    resp.raise_for_status()
+    data = resp.json()
+    user_info = {
+        "social_id": data["sub"],
+        "email": data.get("email"),
+        "first_name": data.get("given_name", ""),
+        "last_name": data.get("family_name", ""),
+    }
+    userinfo_cache.set(cache_key, user_info)
+    return user_info
+
+
+async def exchange_github_code(client: httpx.AsyncClient, code: str) -> str:
+    resp = await client.post(
+        GITHUB_TOKEN_URL,
+        headers={"Accept": "application/json"},
+        data={
+            "client_id": settings.GITHUB_CLIENT_ID,
+            "client_secret": settings.GITHUB_CLIENT_SECRET.get_secret_value(),
+            "code": code,
+        },
+    )
+    resp.raise_for_status()
+    data = resp.json()
+    if "access_token" not in data:
+        raise OAuthError(data.get("error_description", "GitHub did not return a token"))
+    return data["access_token"]
+
+
+async def fetch_github_userinfo(client: httpx.AsyncClient, access_token: str) -> dict:
+    cache_key = _userinfo_cache_key("github", access_token)
+    user_info = userinfo_cache.get(cache_key)
+    if user_info is not None:
+        return user_info
+
+    headers = {
+        "Authorization": f"Bearer {access_token}",
+        "Accept": "application/vnd.github+json",
+    }
+    resp = await client.get(GITHUB_USER_URL, headers=headers)
+    resp.raise_for_status()
+    data = resp.json()
+
+    email = data.get("email")
+    if not email:
+        # The profile email is optional, fall back to the primary verified one
+        emails_resp = await client.get(GITHUB_EMAILS_URL, headers=headers)
+        emails_resp.raise_for_status()
+        email = next(
+            (
+                entry["email"]
+                for entry in emails_resp.json()
+                if entry.get("primary") and entry.get("verified")
+            ),
+            None,
+        )
+
+    first_name, _, last_name = (data.get("name") or "").partition(" ")
+    user_info = {
+        "social_id": str(data["id"]),
+        "email": email,
+        "first_name": first_name or data.get("login", ""),
+        "last_name": last_name,
+    }
+    userinfo_cache.set(cache_key, user_info)
+    return user_info
@@ -0,0 +1,310 @@
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import time
+import uuid
+from typing import NamedTuple
+
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+from ..cache import (
+    TTLCache,
+    register_invalidation_handler,
+    register_invalidation_target,
+    register_subscribe_hook,
+)
+from ..config import settings
+
+logger = logging.getLogger(__name__)
+
+SESSION_KEY_PREFIX = "session:"
+USER_SESSIONS_KEY_PREFIX = "user_sessions:"
+REVOKED_SESSIONS_KEY = "revoked_sessions"
+SIGNED_SESSION_VERSION = "v1"
+
+# Per-worker cache of session_id -> user_id, evicted across workers on logout
+session_cache = TTLCache(
+    "session", maxsize=settings.SESSION_CACHE_MAX_SIZE, ttl=settings.SESSION_CACHE_TTL
+)
+register_invalidation_target("session", session_cache)
+
+# Sessions expire on their own, so the per-user index drops the ids of
+# expired ones whenever a new session is added to it.
+# KEYS[1] = session key, KEYS[2] = user sessions key
+# ARGV[1] = session expiry, ARGV[2] = user id, ARGV[3] = session id,
+# ARGV[4] = session key prefix
+_CREATE_SCRIPT = """
+redis.call('SETEX', KEYS[1], ARGV[1], ARGV[2])
+for _, session_id in ipairs(redis.call('SMEMBERS', KEYS[2])) do
+    if redis.call('EXISTS', ARGV[4] .. session_id) == 0 then
+        redis.call('SREM', KEYS[2], session_id)
+    end
+end
+redis.call('SADD', KEYS[2], ARGV[3])
+redis.call('EXPIRE', KEYS[2], ARGV[1])
+"""
+
+# KEYS[1] = session key
+# ARGV[1] = session expiry, ARGV[2] = refresh window, ARGV[3] = user sessions prefix
+_LOOKUP_SCRIPT = """
+local user_id = redis.call('GET', KEYS[1])
+if not user_id then
+    return {false, 0}
+end
+local ttl = redis.call('TTL', KEYS[1])
+if ttl >= 0 and ttl < tonumber(ARGV[2]) then
+    redis.call('EXPIRE', KEYS[1], ARGV[1])
+    redis.call('EXPIRE', ARGV[3] .. user_id, ARGV[1])
+    return {user_id, 1}
+end
+return {user_id, 0}
+"""
+
+# KEYS[1] = session key
+# ARGV[1] = session id, ARGV[2] = user sessions prefix,
+# ARGV[3] = invalidation channel, ARGV[4] = invalidation message
+_DELETE_SCRIPT = """
+local user_id = redis.call('GET', KEYS[1])
+redis.call('DEL', KEYS[1])
+if user_id then
+    redis.call('SREM', ARGV[2] .. user_id, ARGV[1])
+end
+redis.call('PUBLISH', ARGV[3], ARGV[4])
+return user_id
+"""
+
+# KEYS[1] = user sessions key
+# ARGV[1] = session key prefix, ARGV[2] = invalidation channel
+_DELETE_ALL_SCRIPT = """
+local session_ids = redis.call('SMEMBERS', KEYS[1])
+for _, session_id in ipairs(session_ids) do
+    redis.call('DEL', ARGV[1] .. session_id)
+    redis.call('PUBLISH', ARGV[2], 'session:' .. session_id)
+end
+redis.call('DEL', KEYS[1])
+return session_ids
+"""
+
+
+class SessionLookup(NamedTuple):
+    user_id: int | None
+    refreshed: bool = False
+    # Cookie value to send back when `refreshed` is set
+    session_id: str | None = None
+
+
+class SessionStore:
+    """
+    Redis-backed sessions with throttled sliding expiry.
+
+    Each lookup reads the session and, only when its remaining TTL has dropped
+    below `refresh_window`, extends it, all in a single round trip. Session ids
+    are also indexed per user so that every session for a user can be dropped
+    at once.
+    """
+
+    def __init__(
+        self,
+        redis: Redis,
+        expiry: int = settings.SESSION_EXPIRY,
+        refresh_window: int = settings.SESSION_REFRESH_WINDOW,
+    ):
+        self.redis = redis
+        self.expiry = expiry
+        self.refresh_window = refresh_window
+        self._create = redis.register_script(_CREATE_SCRIPT)
+        self._lookup = redis.register_script(_LOOKUP_SCRIPT)
+        self._delete = redis.register_script(_DELETE_SCRIPT)
+        self._delete_all = redis.register_script(_DELETE_ALL_SCRIPT)
+
+    async def create(self, user_id: int) -> str:
+        session_id = str(uuid.uuid4())
+        await self._create(
+            keys=[
+                f"{SESSION_KEY_PREFIX}{session_id}",
+                f"{USER_SESSIONS_KEY_PREFIX}{user_id}",
+            ],
+            args=[self.expiry, user_id, session_id, SESSION_KEY_PREFIX],
+        )
+        return session_id
+
+    async def lookup(self, session_id: str) -> SessionLookup:
+        cached_user_id = session_cache.get(session_id)
+        if cached_user_id is not None:
+            return SessionLookup(cached_user_id, session_id=session_id)
+
+        user_id, refreshed = await self._lookup(
+            keys=[f"{SESSION_KEY_PREFIX}{session_id}"],
+            args=[self.expiry, self.refresh_window, USER_SESSIONS_KEY_PREFIX],
+        )
+        if user_id is None:
+            return SessionLookup(None)
+        session_cache.set(session_id, int(user_id))
+        return SessionLookup(int(user_id), bool(refreshed), session_id)
+
+    async def get_user_id(self, session_id: str) -> int | None:
+        return (await self.lookup(session_id)).user_id
+
+    async def delete(self, session_id: str) -> None:
+        session_cache.delete(session_id)
+        await self._delete(
+            keys=[f"{SESSION_KEY_PREFIX}{session_id}"],
+            args=[
+                session_id,
+                USER_SESSIONS_KEY_PREFIX,
+                settings.CACHE_INVALIDATION_CHANNEL,
+                f"session:{session_id}",
+            ],
+        )
+
+    async def delete_all_for_user(self, user_id: int) -> list[str]:
+        session_ids = await self._delete_all(
+            keys=[f"{USER_SESSIONS_KEY_PREFIX}{user_id}"],
+            args=[SESSION_KEY_PREFIX, settings.CACHE_INVALIDATION_CHANNEL],
+        )
+        session_ids = [session_id.decode() for session_id in session_ids]
+        for session_id in session_ids:
+            session_cache.delete(session_id)
+        return session_ids
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+class SignedSessionStore(SessionStore):
+    """
+    Stateless sessions carried in an HMAC-signed, versioned token.
+
+    The token holds the user id, the id of a regular Redis session, and its
+    issue and expiry times. While the token is fresh it is verified with CPU
+    work only. Once half its lifetime has passed, the backing Redis session is
+    checked and a new token issued; if Redis is unreachable the still-valid
+    token keeps working. Logged out sessions are kept in a small revocation
+    set, mirrored into every worker through cache invalidations.
+    """
+
+    def __init__(
+        self,
+        redis: Redis,
+        secret_key: str,
+        token_ttl: int = settings.SIGNED_SESSION_TTL,
+        **kwargs,
+    ):
+        super().__init__(redis, **kwargs)
+        self.secret_key = secret_key.encode()
+        self.token_ttl = token_ttl
+        self.revoked = TTLCache("revoked_session", maxsize=100_000, ttl=token_ttl)
+        register_invalidation_handler("session", self._mark_revoked)
+        register_subscribe_hook(self.load_revocations)
+
+    def _mark_revoked(self, session_id: str) -> None:
+        self.revoked.set(session_id, True)
+
+    def _sign(self, payload: str) -> str:
+        message = f"{SIGNED_SESSION_VERSION}.{payload}".encode()
+        return _b64encode(hmac.new(self.secret_key, message, hashlib.sha256).digest())
+
+    def issue_token(self, user_id: int, session_id: str) -> str:
+        issued_at = int(time.time())
+        claims = {
+            "uid": user_id,
+            "sid": session_id,
+            "iat": issued_at,
+            "exp": issued_at + self.token_ttl,
+        }
+        payload = _b64encode(json.dumps(claims, separators=(",", ":")).encode())
+        return f"{SIGNED_SESSION_VERSION}.{payload}.{self._sign(payload)}"
+
+    def decode_token(self, token: str) -> dict | None:
+        """
+        Return the token's claims if its signature is valid, ignoring expiry.
+        """
+        try:
+            version, payload, signature = token.split(".")
+        except ValueError:
+            return None
+        if version != SIGNED_SESSION_VERSION:
+            return None
+        # Compare bytes, as compare_digest rejects non-ASCII str arguments
+        if not hmac.compare_digest(signature.encode(), self._sign(payload).encode()):
+            return None
+        try:
+            return json.loads(_b64decode(payload))
+        except ValueError:
+            return None
+
+    async def load_revocations(self) -> None:
+        now = time.time()
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.zremrangebyscore(REVOKED_SESSIONS_KEY, "-inf", now)
+            pipe.zrange(REVOKED_SESSIONS_KEY, 0, -1, withscores=True)
+            _, revoked = await pipe.execute()
+        for session_id, expires_at in revoked:
+            self.revoked.set(session_id.decode(), True, ttl=expires_at - now)
+
+    async def _revoke(self, session_ids: list[str]) -> None:
+        if not session_ids:
+            return
+        for session_id in session_ids:
+            self._mark_revoked(session_id)
+        expires_at = time.time() + self.token_ttl
+        await self.redis.zadd(
+            REVOKED_SESSIONS_KEY,
+            {session_id: expires_at for session_id in session_ids},
+        )
+
+    async def create(self, user_id: int) -> str:
+        session_id = await super().create(user_id)
+        return self.issue_token(user_id, session_id)
+
+    async def lookup(self, token: str) -> SessionLookup:
+        claims = self.decode_token(token)
+        if claims is None or self.revoked.get(claims["sid"]):
+            return SessionLookup(None)
+
+        now = time.time()
+        if now < claims["iat"] + self.token_ttl / 2:
+            return SessionLookup(claims["uid"])
+
+        try:
+            user_id = (await super().lookup(claims["sid"])).user_id
+        except RedisError as e:
+            logger.warning(f"Could not refresh signed session: {e}")
+            if now < claims["exp"]:
+                return SessionLookup(claims["uid"])
+            return SessionLookup(None)
+        if user_id is None:
+            return SessionLookup(None)
+        return SessionLookup(
+            user_id, refreshed=True, session_id=self.issue_token(user_id, claims["sid"])
+        )
+
+    async def delete(self, token: str) -> None:
+        claims = self.decode_token(token)
+        if claims is None:
+            return
+        await super().delete(claims["sid"])
+        await self._revoke([claims["sid"]])
+
+    async def delete_all_for_user(self, user_id: int) -> list[str]:
+        session_ids = await super().delete_all_for_user(user_id)
+        await self._revoke(session_ids)
+        return session_ids
+
+
+def create_session_store(redis: Redis) -> SessionStore:
+    if settings.SESSION_MODE == "signed":
+        if settings.SESSION_SECRET_KEY is None:
+            raise ValueError(
+                "SESSION_SECRET_KEY must be set when SESSION_MODE is signed"
+            )
+        return SignedSessionStore(redis, settings.SESSION_SECRET_KEY.get_secret_value())
+    return SessionStore(redis)
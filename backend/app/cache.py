@@ -0,0 +1,140 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict, defaultdict
+from typing import Any, Awaitable, Callable, Dict, Hashable, List
+
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+from . import metrics
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+class TTLCache:
+    """
+    Bounded, per-worker LRU cache whose entries expire after a fixed TTL.
+    """
+
+    def __init__(self, name: str, maxsize: int, ttl: float):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+
+        metrics.register_gauge(f"cache.{name}.size", lambda: len(self._data))
+        metrics.register_gauge(f"cache.{name}.hits", lambda: self.hits)
+        metrics.register_gauge(f"cache.{name}.misses", lambda: self.misses)
+        metrics.register_gauge(f"cache.{name}.hit_rate", lambda: self.hit_rate)
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._data.get(key, _MISSING)
+        if entry is _MISSING:
+            self.misses += 1
+            return default
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: float | None = None) -> None:
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        self._data[key] = (expires_at, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def delete(self, key: Hashable) -> None:
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+
+# Caches that take part in cross-worker invalidation, keyed by namespace
+_invalidation_targets: Dict[str, List[TTLCache]] = defaultdict(list)
+# Extra callbacks run for each invalidated key, keyed by namespace
+_invalidation_handlers: Dict[str, List[Callable[[str], None]]] = defaultdict(list)
+# Coroutines run every time the invalidation channel is (re)subscribed
+_subscribe_hooks: List[Callable[[], Awaitable[None]]] = []
+
+
+def register_invalidation_target(namespace: str, cache: TTLCache) -> None:
+    _invalidation_targets[namespace].append(cache)
+
+
+def register_invalidation_handler(
+    namespace: str, handler: Callable[[str], None]
+) -> None:
+    _invalidation_handlers[namespace].append(handler)
+
+
+def register_subscribe_hook(hook: Callable[[], Awaitable[None]]) -> None:
+    """
+    Run `hook` after every (re)subscription, e.g. to reload state that
+    invalidation messages would otherwise have kept in sync.
+    """
+    _subscribe_hooks.append(hook)
+
+
+def _invalidate_locally(namespace: str, key: str) -> None:
+    for cache in _invalidation_targets.get(namespace, ()):
+        cache.delete(key)
+    for handler in _invalidation_handlers.get(namespace, ()):
+        handler(key)
+
+
+async def publish_invalidation(redis: Redis, namespace: str, key: str) -> None:
+    """
+    Evict `key` from the local cache and tell every other worker to do the same.
+    """
+    _invalidate_locally(namespace, key)
+    await redis.publish(settings.CACHE_INVALIDATION_CHANNEL, f"{namespace}:{key}")
+
+
+def _handle_invalidation(payload: bytes) -> None:
+    namespace, _, key = payload.decode().partition(":")
+    _invalidate_locally(namespace, key)
+    metrics.increment(f"cache.{namespace}.invalidations")
+
+
+async def listen_for_invalidations(redis: Redis) -> None:
+    """
+    Evict local cache entries as invalidations are published by any worker.
+
+    Runs for the lifetime of the app. If the subscription drops, every
+    registered cache is cleared before resubscribing because messages sent
+    while disconnected are lost.
+    """
+    while True:
+        pubsub = redis.pubsub(ignore_subscribe_messages=True)
+        try:
+            await pubsub.subscribe(settings.CACHE_INVALIDATION_CHANNEL)
+            for hook in _subscribe_hooks:
+                await hook()
+            async for message in pubsub.listen():
+                if message["type"] == "message":
+                    _handle_invalidation(message["data"])
+        except RedisError as e:
+            logger.warning(f"Cache invalidation subscription lost: {e}")
+            for caches in _invalidation_targets.values():
+                for cache in caches:
+                    cache.clear()
+            await asyncio.sleep(1)
+        finally:
+            await pubsub.aclose()
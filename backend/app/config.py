@@ -1,3 +1,5 @@
+from typing import Literal, Optional
+
 from pydantic import AnyHttpUrl, EmailStr, PostgresDsn, SecretStr, computed_field
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
@@ -18,9 +20,64 @@ class Settings(BaseSettings):
     AWS_SECRET_ACCESS_KEY: SecretStr
     AWS_S3_BUCKET_NAME: str
     AWS_REGION: str = "us-west-1"
+    # Point at a local S3 stand-in such as MinIO or moto server
+    AWS_S3_ENDPOINT_URL: Optional[str] = None
+    # Shared by the S3 connection pool and the threads that drive it
+    S3_MAX_POOL_CONNECTIONS: int = 32
+    # Profile photo URLs are signed for PRESIGNED_URL_EXPIRY and reused until
+    # PRESIGNED_URL_REFRESH_MARGIN before they expire. The margin must cover
+    # USER_CACHE_TTL, as cached user snapshots embed these URLs.
+    PRESIGNED_URL_EXPIRY: int = 12 * 3600
+    PRESIGNED_URL_REFRESH_MARGIN: int = 3600
+    PRESIGNED_URL_CACHE_MAX_SIZE: int = 10_000
+
+    # Image processing settings
+    IMAGE_PROCESS_WORKERS: int = 2
+    # Uploads allowed to wait for an image worker before answering 503
+    IMAGE_PROCESS_MAX_PENDING: int = 16
+    # Larger images are refused before decoding, as decompression bombs
+    IMAGE_MAX_PIXELS: int = 50_000_000
+    # Stored originals are downscaled to fit within this many pixels a side
+    IMAGE_ORIGINAL_MAX_DIMENSION: int = 2048
+    PHOTO_JOB_WORKER_CONCURRENCY: int = 2
+    PHOTO_JOB_STATUS_TTL: int = 3600
+    # The orphaned photo reaper leaves variants younger than this alone, as
+    # their upload may not have updated the user yet
+    PHOTO_REAPER_MIN_AGE: int = 3600
+    PHOTO_REAPER_STAGING_MAX_AGE: int = 24 * 3600
 
     # Redis settings
     REDIS_URL: str = "redis://redis:6379"
+    CACHE_INVALIDATION_CHANNEL: str = "cache-invalidation"
+
+    # Session settings
+    SESSION_EXPIRY: int = 30 * 24 * 3600
+    # Sliding expiry is only extended once the remaining TTL drops below this
+    SESSION_REFRESH_WINDOW: int = 29 * 24 * 3600
+    SESSION_CACHE_TTL: int = 60
+    SESSION_CACHE_MAX_SIZE: int = 10_000
+    # "redis" keeps opaque session ids; "signed" issues short-lived HMAC tokens
+    # backed by a Redis session that is only consulted on refresh
+    SESSION_MODE: Literal["redis", "signed"] = "redis"
+    SESSION_SECRET_KEY: Optional[SecretStr] = None
+    SIGNED_SESSION_TTL: int = 15 * 60
+
+    # Password hashing settings
+    BCRYPT_ROUNDS: int = 12
+    PASSWORD_HASH_WORKERS: int = 4
+    # Hash/verify calls allowed to wait for a worker before answering 503
+    PASSWORD_HASH_MAX_PENDING: int = 64
+
+    # User profile snapshot cache. Snapshots embed presigned photo URLs, so the
+    # Redis TTL must stay well below their expiry.
+    USER_CACHE_TTL: int = 600
+    USER_CACHE_L1_TTL: int = 60
+    USER_CACHE_MAX_SIZE: int = 10_000
+
+    # Rate limiting settings
+    RATE_LIMIT_ENABLED: bool = True
+    # Take the client IP from nginx's X-Real-IP header
+    RATE_LIMIT_TRUST_PROXY: bool = True
 
     # CORS settings
     ALLOWED_ORIGINS: list[AnyHttpUrl] = [
@@ -39,6 +96,24 @@ class Settings(BaseSettings):
     BREVO_SENDER_EMAIL: EmailStr = "noreply@deepworktimer.io"
     BREVO_SENDER_NAME: str = "Ethan Cavill"
 
+    # Email delivery settings
+    EMAIL_BACKEND: Literal["brevo", "smtp", "stub"] = "brevo"
+    EMAIL_WORKER_CONCURRENCY: int = 8
+    SMTP_HOST: str = "localhost"
+    SMTP_PORT: int = 587
+    SMTP_USERNAME: Optional[str] = None
+    SMTP_PASSWORD: Optional[SecretStr] = None
+    SMTP_START_TLS: bool = True
+    SMTP_POOL_SIZE: int = 4
+    EMAIL_VERIFICATION_TOKEN_TTL: int = 24 * 3600
+
+    # Bearer token required by /metrics; the endpoint is disabled when unset
+    METRICS_TOKEN: Optional[SecretStr] = None
+
+    # Background worker settings
+    WORKER_MAX_ATTEMPTS: int = 5
+    WORKER_RETRY_BASE_DELAY: float = 5.0
+
     # Frontend URL
     FRONTEND_URL: AnyHttpUrl
 
@@ -46,6 +121,8 @@ class Settings(BaseSettings):
     GITHUB_CLIENT_ID: str
     GITHUB_CLIENT_SECRET: SecretStr
     GOOGLE_CLIENT_ID: str
+    OAUTH_HTTP_TIMEOUT: float = 5.0
+    OAUTH_USERINFO_CACHE_TTL: int = 60
 
     model_config = SettingsConfigDict(env_file=".env", case_sensitive=True)
 
@@ -1,5 +1,6 @@
 from typing import AsyncGenerator
 
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker
 from sqlmodel import SQLModel
@@ -17,6 +18,11 @@ async def get_session() -> AsyncGenerator[AsyncSession, None]:
         yield session
 
 
+def violated_constraint(error: IntegrityError) -> str | None:
+    # asyncpg's exception, with the constraint name, is chained to the DBAPI one
+    return getattr(error.orig.__cause__, "constraint_name", None)
+
+
 async def init_db():
     async with async_engine.begin() as conn:
         await conn.run_sync(SQLModel.metadata.create_all)
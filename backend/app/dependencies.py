@@ -12,3 +12,29 @@ async def get_redis(request: Request):
         The Redis connection.
     """
     return request.app.state.redis
+
+
+async def get_session_store(request: Request):
+    """
+    Dependency function to get the session store.
+
+    Args:
+        request: The request object from which the application state can be accessed.
+
+    Returns:
+        The SessionStore shared by this worker.
+    """
+    return request.app.state.session_store
+
+
+async def get_http_client(request: Request):
+    """
+    Dependency function to get the shared outbound HTTP client.
+
+    Args:
+        request: The request object from which the application state can be accessed.
+
+    Returns:
+        The pooled httpx.AsyncClient created at startup.
+    """
+    return request.app.state.http_client
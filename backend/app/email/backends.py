@@ -0,0 +1,252 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from email.message import EmailMessage as MIMEMessage
+from email.utils import formataddr
+
+import aiosmtplib
+import sib_api_v3_sdk
+
+from .. import metrics
+from ..config import settings
+
+logger = logging.getLogger(__name__)
+
+# Pooled SMTP connections idle for longer than this are checked with a NOOP
+# before reuse, as servers close idle connections without the client noticing
+SMTP_IDLE_CHECK_AFTER = 30.0
+
+
+@dataclass
+class EmailMessage:
+    to_email: str
+    subject: str
+    html_content: str
+    sender_name: str = settings.BREVO_SENDER_NAME
+    sender_email: str = settings.BREVO_SENDER_EMAIL
+
+
+class EmailBackend:
+    """
+    Delivers email messages. Raising from `send` marks the message as failed
+    so the outbox worker can retry it.
+    """
+
+    name = "base"
+
+    async def send(self, message: EmailMessage) -> None:
+        raise NotImplementedError
+
+    async def send_many(self, messages: list[EmailMessage]) -> list[Exception | None]:
+        """
+        Send a batch, returning each message's error, or None if it was sent.
+        """
+        return await asyncio.gather(
+            *(self.send(message) for message in messages), return_exceptions=True
+        )
+
+    async def deliver(self, message: EmailMessage) -> None:
+        """
+        Send `message`, recording per-backend latency and error metrics.
+        """
+        started = time.monotonic()
+        try:
+            await self.send(message)
+        except Exception:
+            metrics.increment(f"email.{self.name}.errors")
+            raise
+        finally:
+            metrics.observe(f"email.{self.name}.seconds", time.monotonic() - started)
+
+    async def deliver_many(
+        self, messages: list[EmailMessage]
+    ) -> list[Exception | None]:
+        """
+        `send_many` with per-backend batch latency and error metrics.
+        """
+        started = time.monotonic()
+        try:
+            errors = await self.send_many(messages)
+        except Exception as e:
+            errors = [e] * len(messages)
+        metrics.observe(f"email.{self.name}.batch_seconds", time.monotonic() - started)
+        metrics.observe(f"email.{self.name}.batch_size", len(messages))
+        failed = sum(error is not None for error in errors)
+        if failed:
+            metrics.increment(f"email.{self.name}.errors", failed)
+        return errors
+
+    async def close(self) -> None:
+        pass
+
+
+class BrevoBackend(EmailBackend):
+    name = "brevo"
+
+    def __init__(self, api_key: str):
+        configuration = sib_api_v3_sdk.Configuration()
+        configuration.api_key["api-key"] = api_key
+        self.api_instance = sib_api_v3_sdk.TransactionalEmailsApi(
+            sib_api_v3_sdk.ApiClient(configuration)
+        )
+
+    async def send(self, message: EmailMessage) -> None:
+        send_smtp_email = sib_api_v3_sdk.SendSmtpEmail(
+            to=[{"email": message.to_email}],
+            html_content=message.html_content,
+            sender={"name": message.sender_name, "email": message.sender_email},
+            subject=message.subject,
+        )
+        # The SDK is synchronous, keep it off the event loop
+        await asyncio.to_thread(self.api_instance.send_transac_email, send_smtp_email)
+
+
+class SMTPBackend(EmailBackend):
+    """
+    Native async SMTP delivery over a small pool of authenticated connections.
+
+    Connections are opened lazily up to `pool_size` and reused across
+    messages. `send_many` spreads a batch over the pool, sending each chunk
+    back to back on one connection so the handshake and AUTH are paid once
+    per connection instead of once per message.
+    """
+
+    name = "smtp"
+
+    def __init__(
+        self,
+        hostname: str,
+        port: int,
+        username: str | None = None,
+        password: str | None = None,
+        start_tls: bool = True,
+        pool_size: int = 4,
+    ):
+        self.hostname = hostname
+        self.port = port
+        self.username = username
+        self.password = password
+        self.start_tls = start_tls
+        self.pool_size = pool_size
+        # Idle connections with the time they were last used
+        self._idle: asyncio.Queue[tuple[aiosmtplib.SMTP, float]] = asyncio.Queue()
+        self._slots = asyncio.Semaphore(pool_size)
+
+        metrics.register_gauge("email.smtp.idle_connections", self._idle.qsize)
+
+    async def _connect(self) -> aiosmtplib.SMTP:
+        client = aiosmtplib.SMTP(
+            hostname=self.hostname,
+            port=self.port,
+            username=self.username,
+            password=self.password,
+            start_tls=self.start_tls,
+        )
+        await client.connect()
+        metrics.increment("email.smtp.connections_opened")
+        return client
+
+    async def _checkout(self) -> aiosmtplib.SMTP:
+        while not self._idle.empty():
+            client, last_used = self._idle.get_nowait()
+            if not client.is_connected:
+                continue
+            if time.monotonic() - last_used < SMTP_IDLE_CHECK_AFTER:
+                return client
+            try:
+                await client.noop()
+                return client
+            except (aiosmtplib.SMTPException, OSError):
+                metrics.increment("email.smtp.stale_connections")
+                client.close()
+        return await self._connect()
+
+    @staticmethod
+    def _to_mime(message: EmailMessage) -> MIMEMessage:
+        mime = MIMEMessage()
+        mime["From"] = formataddr((message.sender_name, message.sender_email))
+        mime["To"] = message.to_email
+        mime["Subject"] = message.subject
+        mime.set_content(message.html_content, subtype="html")
+        return mime
+
+    async def _send_batch(self, messages: list[EmailMessage]) -> list[Exception | None]:
+        errors: list[Exception | None] = []
+        async with self._slots:
+            client = None
+            for message in messages:
+                try:
+                    if client is None:
+                        client = await self._checkout()
+                    await client.send_message(self._to_mime(message))
+                    errors.append(None)
+                except Exception as e:
+                    # Don't reuse a connection in an unknown state, the rest
+                    # of the batch goes out on a fresh one
+                    if client is not None:
+                        client.close()
+                        client = None
+                    errors.append(e)
+            if client is not None:
+                self._idle.put_nowait((client, time.monotonic()))
+        return errors
+
+    async def send(self, message: EmailMessage) -> None:
+        [error] = await self._send_batch([message])
+        if error is not None:
+            raise error
+
+    async def send_many(self, messages: list[EmailMessage]) -> list[Exception | None]:
+        if not messages:
+            return []
+        chunk_size = -(-len(messages) // self.pool_size)
+        chunk_errors = await asyncio.gather(
+            *(
+                self._send_batch(messages[start : start + chunk_size])
+                for start in range(0, len(messages), chunk_size)
+            )
+        )
+        return [error for errors in chunk_errors for error in errors]
+
+    async def close(self) -> None:
+        while not self._idle.empty():
+            client, _ = self._idle.get_nowait()
+            try:
+                await client.quit()
+            except aiosmtplib.SMTPException:
+                client.close()
+
+
+class StubBackend(EmailBackend):
+    """
+    Records messages instead of sending them, for local development and tests.
+    """
+
+    name = "stub"
+
+    def __init__(self):
+        self.sent: list[EmailMessage] = []
+
+    async def send(self, message: EmailMessage) -> None:
+        logger.info(f"Stub email to {message.to_email}: {message.subject}")
+        self.sent.append(message)
+
+
+def create_email_backend() -> EmailBackend:
+    if settings.EMAIL_BACKEND == "stub":
+        return StubBackend()
+    if settings.EMAIL_BACKEND == "smtp":
+        return SMTPBackend(
+            hostname=settings.SMTP_HOST,
+            port=settings.SMTP_PORT,
+            username=settings.SMTP_USERNAME,
+            password=(
+                settings.SMTP_PASSWORD.get_secret_value()
+                if settings.SMTP_PASSWORD
+                else None
+            ),
+            start_tls=settings.SMTP_START_TLS,
+            pool_size=settings.SMTP_POOL_SIZE,
+        )
+    return BrevoBackend(settings.BREVO_API_KEY.get_secret_value())
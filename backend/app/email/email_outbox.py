@@ -0,0 +1,66 @@
+import asyncio
+import json
+from dataclasses import asdict
+
+from redis.asyncio import Redis
+
+from ..config import settings
+from ..stream_worker import RedisStreamWorker, enqueue
+from .backends import EmailBackend, EmailMessage
+
+
+class EmailOutboxWorker(RedisStreamWorker):
+    """
+    Sends the emails queued by `enqueue_email` through an `EmailBackend`.
+
+    Entries handled at the same time are sent as one `deliver_many` batch:
+    the first waits `batch_linger` seconds for the others read by the same
+    poll. Each entry still fails, retries and dead-letters on its own.
+    """
+
+    queue = "email_outbox"
+
+    def __init__(
+        self,
+        redis: Redis,
+        backend: EmailBackend,
+        batch_linger: float = 0.01,
+        **kwargs,
+    ):
+        kwargs.setdefault("concurrency", settings.EMAIL_WORKER_CONCURRENCY)
+        super().__init__(redis, **kwargs)
+        self.backend = backend
+        self.batch_linger = batch_linger
+        self._batch: list[tuple[EmailMessage, asyncio.Future]] = []
+
+    async def handle(self, fields: dict[str, str]) -> None:
+        sent = asyncio.get_running_loop().create_future()
+        self._batch.append((EmailMessage(**json.loads(fields["message"])), sent))
+        if len(self._batch) == 1:
+            await self._flush()
+        await sent
+
+    async def _flush(self) -> None:
+        batch = None
+        try:
+            await asyncio.sleep(self.batch_linger)
+            batch, self._batch = self._batch, []
+            errors = await self.backend.deliver_many([message for message, _ in batch])
+        except asyncio.CancelledError:
+            # The whole batch's entries are reclaimed and sent again
+            if batch is None:
+                batch, self._batch = self._batch, []
+            for _, sent in batch:
+                sent.cancel()
+            raise
+        for (_, sent), error in zip(batch, errors):
+            if error is None:
+                sent.set_result(None)
+            else:
+                sent.set_exception(error)
+
+
+async def enqueue_email(redis: Redis, message: EmailMessage) -> str:
+    return await enqueue(
+        redis, EmailOutboxWorker.queue, {"message": json.dumps(asdict(message))}
+    )
@@ -1,38 +1,33 @@
-import sib_api_v3_sdk
 from pydantic import EmailStr
-from sib_api_v3_sdk.rest import ApiException
-from ..config import settings
-
-# Configure API key authorization
-configuration = sib_api_v3_sdk.Configuration()
-configuration.api_key["api-key"] = settings.BREVO_API_KEY.get_secret_value()
+from redis.asyncio import Redis
 
-# Create an instance of the API class
-api_instance = sib_api_v3_sdk.TransactionalEmailsApi(
-    sib_api_v3_sdk.ApiClient(configuration)
-)
+from ..config import settings
+from .backends import EmailMessage
+from .email_outbox import enqueue_email
 
 
 async def send_email(
+    redis: Redis,
     to_email: EmailStr,
     subject: str,
     html_content: str,
-    sender_name: str = "Ethan Cavill",
+    sender_name: str = settings.BREVO_SENDER_NAME,
 ):
-    sender = {"name": sender_name, "email": "noreply@deepworktimer.io"}
-    to = [{"email": to_email}]
-    send_smtp_email = sib_api_v3_sdk.SendSmtpEmail(
-        to=to, html_content=html_content, sender=sender, subject=subject
+    """
+    Queue an email on the outbox; delivery happens in the background worker.
+    """
+    await enqueue_email(
+        redis,
+        EmailMessage(
+            to_email=to_email,
+            subject=subject,
+            html_content=html_content,
+            sender_name=sender_name,
+        ),
     )
-    try:
-        api_response = api_instance.send_transac_email(send_smtp_email)
-        print(api_response)
-    except ApiException as e:
-        print(f"Exception when calling SMTPApi->send_transac_email: {e}")
-        raise
 
 
-async def send_verification_email(email: EmailStr, token: str):
+async def send_verification_email(redis: Redis, email: EmailStr, token: str):
     verification_link = f"{settings.FRONTEND_URL}/verify-email?token={token}"
     subject = "Verify your Deep Work Timer email"
     html_content = f"""
@@ -45,4 +40,4 @@ async def send_verification_email(email: EmailStr, token: str):
         </body>
     </html>
     """
-    await send_email(email, subject, html_content)
+    await send_email(redis, email, subject, html_content)
@@ -1,29 +1,66 @@
+import asyncio
+import logging
 from contextlib import asynccontextmanager
 
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from redis.asyncio import Redis
 from starlette.middleware.trustedhost import TrustedHostMiddleware
 
 from .auth.auth_routes import router as auth_router
-from .auth.auth_utils import get_user_id_from_session
+from .auth.auth_utils import set_session_cookie
+from .auth.oauth_providers import create_http_client
+from .auth.session_store import create_session_store
+from .cache import listen_for_invalidations
 from .config import settings
+from .email.backends import create_email_backend
+from .email.email_outbox import EmailOutboxWorker
+from .rate_limit import RateLimiter
 from .routers.daily_goal import router as daily_goal_router
+from .routers.metrics import router as metrics_router
 from .routers.session_counter import router as session_counter_router
 from .routers.study_block import router as study_block_router
 from .routers.study_category import router as study_category_router
 from .routers.time_settings import router as time_settings_router
 from .routers.user import router as user_router
+from .routers.utils import NEXT_CURSOR_HEADER
+from .uploads.photo_jobs import PhotoJobWorker
 from .uploads.upload_routes import router as upload_router
+from .uploads.upload_services import image_executor
+from .uploads.upload_utils import s3_executor
+
+logger = logging.getLogger(__name__)
 
 
 @asynccontextmanager
 async def app_lifespan(app: FastAPI):
     redis_client = Redis.from_url(settings.REDIS_URL)
     app.state.redis = redis_client
+    app.state.session_store = create_session_store(redis_client)
+    app.state.rate_limiter = RateLimiter(redis_client)
+    http_client = create_http_client()
+    app.state.http_client = http_client
+    email_backend = create_email_backend()
+    background_tasks = [
+        asyncio.create_task(listen_for_invalidations(redis_client)),
+        asyncio.create_task(EmailOutboxWorker(redis_client, email_backend).run()),
+        asyncio.create_task(PhotoJobWorker(redis_client).run()),
+    ]
     yield
 
+    for task in background_tasks:
+        task.cancel()
+    # A task that already died must not skip the cleanup below
+    results = await asyncio.gather(*background_tasks, return_exceptions=True)
+    for result in results:
+        if isinstance(result, Exception):
+            logger.error(f"Background task failed: {result!r}")
+    await email_backend.close()
+    await http_client.aclose()
     await redis_client.close()
+    image_executor.shutdown(cancel_futures=True)
+    s3_executor.shutdown()
 
 
 def create_app() -> FastAPI:
@@ -41,33 +78,40 @@ def create_app() -> FastAPI:
         allow_credentials=True,
         allow_methods=["*"],
         allow_headers=["*"],
+        expose_headers=[NEXT_CURSOR_HEADER],
     )
     app.add_middleware(
         TrustedHostMiddleware,
         allowed_hosts=settings.ALLOWED_HOSTS,
     )
 
-    # Authentication middleware
+    # Authentication and rate limiting middleware
     @app.middleware("http")
     async def auth_middleware(request: Request, call_next):
         request.state.user_id = None
+        lookup = None
         session_id = request.cookies.get("session_id")
         if session_id:
-            redis = request.app.state.redis
-            user_id = await get_user_id_from_session(redis, session_id)
-            if user_id:
-                request.state.user_id = int(user_id)
-                response = await call_next(request)
-                response.set_cookie(
-                    key="session_id",
-                    value=session_id,
-                    httponly=True,
-                    secure=True,
-                    samesite="lax",
-                    max_age=30 * 24 * 3600,
+            session_store = request.app.state.session_store
+            lookup = await session_store.lookup(session_id)
+            request.state.user_id = lookup.user_id
+
+        # Reject before any route, DB or password hashing work happens
+        if settings.RATE_LIMIT_ENABLED:
+            rate_limiter = request.app.state.rate_limiter
+            retry_after = await rate_limiter.check(request, request.state.user_id)
+            if retry_after:
+                return JSONResponse(
+                    status_code=429,
+                    content={"detail": "Too many requests"},
+                    headers={"Retry-After": str(retry_after)},
                 )
-                return response
-        return await call_next(request)
+
+        response = await call_next(request)
+        # Only re-issue the cookie when the server-side expiry moved
+        if lookup and lookup.refreshed:
+            set_session_cookie(response, lookup.session_id)
+        return response
 
     # Include routers
     app.include_router(auth_router, prefix="/auth", tags=["Authentication"])
@@ -86,6 +130,9 @@ def create_app() -> FastAPI:
     app.include_router(
         session_counter_router, prefix="/session-counters", tags=["Session Counters"]
     )
+    app.include_router(
+        metrics_router, prefix="/metrics", tags=["Metrics"], include_in_schema=False
+    )
 
     return app
 
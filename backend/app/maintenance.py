@@ -0,0 +1,109 @@
+"""
+Maintenance jobs, run from the backend directory with:
+
+    python -m app.maintenance <command>
+"""
+
+import argparse
+import asyncio
+
+from sqlalchemy.future import select
+
+from .auth.auth_utils import purge_expired_verification_tokens
+from .database import AsyncSessionLocal
+from .models.user import User
+from .study_rollup import check_user_rollups, rebuild_user_rollups
+from .uploads.photo_reaper import reap_orphaned_photos
+from .uploads.upload_utils import s3_executor
+
+
+async def purge_verification_tokens(args: argparse.Namespace) -> None:
+    async with AsyncSessionLocal() as session:
+        deleted = await purge_expired_verification_tokens(session)
+    print(f"Deleted {deleted} expired email verification tokens")
+
+
+async def reap_photos(args: argparse.Namespace) -> None:
+    async with AsyncSessionLocal() as session:
+        stats = await reap_orphaned_photos(session, dry_run=args.dry_run)
+    s3_executor.shutdown()
+    action = "Would delete" if args.dry_run else f"Deleted {stats.deleted} of"
+    print(
+        f"Listed {stats.listed} objects in {stats.seconds:.1f}s. "
+        f"{action} {stats.orphaned} orphans ({stats.orphaned_bytes} bytes), "
+        f"{stats.deleted_per_second:.0f} deletes/s, {stats.errors} errors, "
+        f"{stats.skipped} skipped as re-uploaded"
+    )
+
+
+async def _user_ids(args: argparse.Namespace) -> list[int]:
+    if args.user_id is not None:
+        return [args.user_id]
+    async with AsyncSessionLocal() as session:
+        result = await session.execute(select(User.id).order_by(User.id))
+        return list(result.scalars())
+
+
+async def rebuild_rollups(args: argparse.Namespace) -> None:
+    user_ids = await _user_ids(args)
+    # One transaction per user keeps each user's lock short
+    for user_id in user_ids:
+        async with AsyncSessionLocal() as session:
+            await rebuild_user_rollups(session, user_id)
+            await session.commit()
+    print(f"Rebuilt daily study rollups for {len(user_ids)} users")
+
+
+async def check_rollups(args: argparse.Namespace) -> None:
+    user_ids = await _user_ids(args)
+    mismatches = []
+    for user_id in user_ids:
+        async with AsyncSessionLocal() as session:
+            mismatches.extend(await check_user_rollups(session, user_id))
+    for mismatch in mismatches:
+        print(mismatch)
+    print(f"Checked {len(user_ids)} users, found {len(mismatches)} mismatches")
+    if mismatches:
+        raise SystemExit(1)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="python -m app.maintenance")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    subparsers.add_parser(
+        "purge-verification-tokens",
+        help="Delete expired email verification tokens in bulk",
+    ).set_defaults(func=purge_verification_tokens)
+
+    reap_parser = subparsers.add_parser(
+        "reap-photos",
+        help="Delete S3 photo objects no user references",
+    )
+    reap_parser.add_argument(
+        "--dry-run", action="store_true", help="Only report what would be deleted"
+    )
+    reap_parser.set_defaults(func=reap_photos)
+
+    for name, func, help_text in [
+        (
+            "rebuild-rollups",
+            rebuild_rollups,
+            "Recompute daily study rollups from study blocks",
+        ),
+        (
+            "check-rollups",
+            check_rollups,
+            "Compare daily study rollups against a full recompute",
+        ),
+    ]:
+        rollup_parser = subparsers.add_parser(name, help=help_text)
+        rollup_parser.add_argument("--user-id", type=int, help="Only this user")
+        rollup_parser.set_defaults(func=func)
+
+    args = parser.parse_args()
+    asyncio.run(args.func(args))
+
+
+if __name__ == "__main__":
+    main()
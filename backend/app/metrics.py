@@ -0,0 +1,35 @@
+from collections import defaultdict
+from typing import Callable, Dict
+
+_counters: Dict[str, float] = defaultdict(float)
+_gauges: Dict[str, Callable[[], float]] = {}
+
+
+def increment(name: str, value: float = 1) -> None:
+    _counters[name] += value
+
+
+def observe(name: str, value: float) -> None:
+    """
+    Record one sample, tracked as `{name}.count`, `{name}.sum` and `{name}.max`.
+    """
+    _counters[f"{name}.count"] += 1
+    _counters[f"{name}.sum"] += value
+    _counters[f"{name}.max"] = max(_counters[f"{name}.max"], value)
+
+
+def register_gauge(name: str, callback: Callable[[], float]) -> None:
+    """
+    Register a gauge whose value is computed on demand when metrics are read.
+    """
+    _gauges[name] = callback
+
+
+def snapshot() -> Dict[str, float]:
+    """
+    Return the current value of every counter and gauge in this worker.
+    """
+    data = dict(_counters)
+    for name, callback in _gauges.items():
+        data[name] = callback()
+    return data
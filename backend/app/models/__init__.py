@@ -4,3 +4,5 @@ from .daily_goal import DailyGoal
 from .time_settings import TimeSettings
 from .study_block import StudyBlock
 from .session_counter import SessionCounter
+from .email_verification_token import EmailVerificationToken
+from .daily_study_rollup import DailyStudyRollup
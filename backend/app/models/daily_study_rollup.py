@@ -0,0 +1,51 @@
+from datetime import date
+from typing import TYPE_CHECKING, Optional
+
+from sqlalchemy import BigInteger, Column, ForeignKey, Integer, UniqueConstraint
+from sqlmodel import Field, Relationship, SQLModel
+
+if TYPE_CHECKING:
+    from .user import User
+
+
+class DailyStudyRollup(SQLModel, table=True):
+    """
+    Finished study blocks summed per user, local day and category. Kept in
+    step with `studyblock` by app.study_rollup.
+    """
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    # Day the blocks started on, in the user's timezone
+    local_day: date
+    total_seconds: int = Field(sa_column=Column(BigInteger, nullable=False))
+    block_count: int = Field(default=0)
+    rating_sum: float = Field(default=0)
+    rating_count: int = Field(default=0)
+
+    # Foreign keys
+    user_id: int = Field(
+        sa_column=Column(
+            Integer, ForeignKey("user.id", ondelete="CASCADE"), nullable=False
+        )
+    )
+    study_category_id: Optional[int] = Field(
+        sa_column=Column(
+            Integer, ForeignKey("studycategory.id", ondelete="CASCADE"), nullable=True
+        )
+    )
+
+    # Relationship
+    user: "User" = Relationship(back_populates="daily_study_rollups")
+
+    # Blocks without a category share one row per day
+    __table_args__ = (
+        UniqueConstraint(
+            "user_id",
+            "local_day",
+            "study_category_id",
+            postgresql_nulls_not_distinct=True,
+        ),
+    )
+
+
+DailyStudyRollup.update_forward_refs()
@@ -0,0 +1,25 @@
+from datetime import UTC, datetime
+from typing import TYPE_CHECKING, Optional
+
+from sqlalchemy import Column, DateTime
+from sqlmodel import Field, Relationship, SQLModel
+
+if TYPE_CHECKING:
+    from .user import User
+
+
+class EmailVerificationToken(SQLModel, table=True):
+    id: Optional[int] = Field(default=None, primary_key=True)
+    # Only a SHA-256 of the emailed token is stored
+    token_hash: str = Field(index=True, unique=True)
+    user_id: int = Field(foreign_key="user.id", index=True)
+    expires_at: datetime = Field(
+        sa_column=Column(DateTime(timezone=True), nullable=False, index=True)
+    )
+    created_at: datetime = Field(
+        sa_column=Column(DateTime(timezone=True)),
+        default_factory=lambda: datetime.now(UTC),
+    )
+
+    # Relationship
+    user: "User" = Relationship(back_populates="email_verification_tokens")
@@ -1,7 +1,7 @@
 from datetime import UTC, datetime
 from typing import TYPE_CHECKING, Optional
 
-from sqlalchemy import Column, DateTime
+from sqlalchemy import Column, DateTime, Index, text
 from sqlmodel import Field, Relationship, SQLModel
 
 if TYPE_CHECKING:
@@ -38,5 +38,17 @@ class StudyBlock(SQLModel, table=True):
         back_populates="study_blocks"
     )
 
+    __table_args__ = (
+        # Serves per-user listings, newest first
+        Index("ix_studyblock_user_id_start_time", "user_id", text("start_time DESC")),
+        # A user can have at most one unfinished block
+        Index(
+            "uq_studyblock_user_id_open",
+            "user_id",
+            unique=True,
+            postgresql_where=text("end_time IS NULL"),
+        ),
+    )
+
 
 StudyBlock.update_forward_refs()
@@ -7,6 +7,8 @@ from sqlmodel import Field, Relationship, SQLModel
 
 if TYPE_CHECKING:
     from .daily_goal import DailyGoal
+    from .daily_study_rollup import DailyStudyRollup
+    from .email_verification_token import EmailVerificationToken
     from .session_counter import SessionCounter
     from .study_block import StudyBlock
     from .study_category import StudyCategory
@@ -40,10 +42,13 @@ class User(SQLModel, table=True):
     first_name: Optional[str] = None
     last_name: Optional[str] = None
     gender: Optional[Gender] = None
+    # IANA name, used to bucket study time into the user's local days
+    timezone: str = Field(default="UTC", sa_column_kwargs={"server_default": "UTC"})
     profile_photo_key: Optional[str] = None
+    # Comma separated formats stored besides JPEG for the resized variants
+    profile_photo_formats: Optional[str] = None
     is_active: bool = Field(default=True)
     is_email_verified: bool = Field(default=False)
-    email_verification_token: Optional[str] = None
     created_at: datetime = Field(
         sa_column=Column(DateTime(timezone=True)),
         default_factory=lambda: datetime.now(UTC),
@@ -69,6 +74,13 @@ class User(SQLModel, table=True):
     session_counters: List["SessionCounter"] = Relationship(
         back_populates="user", sa_relationship_kwargs={"cascade": "delete"}
     )
+    email_verification_tokens: List["EmailVerificationToken"] = Relationship(
+        back_populates="user", sa_relationship_kwargs={"cascade": "delete"}
+    )
+    daily_study_rollups: List["DailyStudyRollup"] = Relationship(
+        back_populates="user",
+        sa_relationship_kwargs={"cascade": "delete", "passive_deletes": True},
+    )
 
 
 User.update_forward_refs()
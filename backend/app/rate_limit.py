@@ -0,0 +1,130 @@
+import logging
+import math
+import time
+from dataclasses import dataclass
+from typing import Literal
+
+from fastapi import Request
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+from . import metrics
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class RateLimitPolicy:
+    name: str
+    path_prefix: str
+    limit: int
+    window: int  # seconds
+    # Requests are counted per client IP or per authenticated user. Anonymous
+    # requests to "user" policies fall back to the client IP.
+    identity: Literal["ip", "user"]
+    methods: frozenset[str] | None = None
+
+    def matches(self, request: Request) -> bool:
+        if self.methods is not None and request.method not in self.methods:
+            return False
+        return request.url.path.startswith(self.path_prefix)
+
+
+# First matching policy wins, so more specific prefixes come first
+POLICIES = [
+    RateLimitPolicy("login", "/auth/login", 10, 60, "ip", frozenset({"POST"})),
+    RateLimitPolicy("register", "/auth/register", 5, 600, "ip", frozenset({"POST"})),
+    # The frontend server checks the session on every page navigation, so all
+    # users share its IP here
+    RateLimitPolicy("session-check", "/auth/validate-session", 120, 60, "user"),
+    RateLimitPolicy("auth", "/auth/", 60, 60, "user"),
+    RateLimitPolicy("study-block-query", "/study-blocks/query", 60, 60, "user"),
+    RateLimitPolicy("upload-status", "/upload/profile-photo-jobs/", 120, 60, "user"),
+    RateLimitPolicy("upload", "/upload/", 20, 60, "user"),
+    RateLimitPolicy("api", "/", 600, 60, "user"),
+]
+
+# Sliding window counter: the previous fixed window's count is weighted by how
+# much of it still overlaps the sliding window.
+# KEYS[1] = current window key, KEYS[2] = previous window key
+# ARGV[1] = limit, ARGV[2] = window, ARGV[3] = seconds elapsed in current window
+_SLIDING_WINDOW_SCRIPT = """
+local limit = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local elapsed = tonumber(ARGV[3])
+local current = tonumber(redis.call('GET', KEYS[1]) or '0')
+local previous = tonumber(redis.call('GET', KEYS[2]) or '0')
+
+if previous * (window - elapsed) / window + current + 1 <= limit then
+    redis.call('INCR', KEYS[1])
+    redis.call('EXPIRE', KEYS[1], window * 2)
+    return 0
+end
+
+if current + 1 > limit or previous == 0 then
+    return math.ceil(window - elapsed)
+end
+-- Wait until enough of the previous window has slid out
+local allowed_at = window - (limit - current - 1) * window / previous
+return math.max(1, math.ceil(allowed_at - elapsed))
+"""
+
+
+def get_client_ip(request: Request) -> str:
+    if settings.RATE_LIMIT_TRUST_PROXY:
+        real_ip = request.headers.get("x-real-ip")
+        if real_ip:
+            return real_ip
+    return request.client.host if request.client else "unknown"
+
+
+class RateLimiter:
+    def __init__(self, redis: Redis, policies: list[RateLimitPolicy] = POLICIES):
+        self.redis = redis
+        self.policies = policies
+        self._sliding_window = redis.register_script(_SLIDING_WINDOW_SCRIPT)
+
+    def get_policy(self, request: Request) -> RateLimitPolicy | None:
+        for policy in self.policies:
+            if policy.matches(request):
+                return policy
+        return None
+
+    async def check(self, request: Request, user_id: int | None) -> int | None:
+        """
+        Count the request against its policy.
+
+        Returns:
+            None if the request is allowed, otherwise the number of seconds the
+            client should wait before retrying.
+        """
+        policy = self.get_policy(request)
+        if policy is None:
+            return None
+
+        if policy.identity == "user" and user_id is not None:
+            identity = f"user:{user_id}"
+        else:
+            identity = f"ip:{get_client_ip(request)}"
+
+        now = time.time()
+        window_index = math.floor(now / policy.window)
+        key_prefix = f"rate_limit:{policy.name}:{identity}"
+        try:
+            retry_after = await self._sliding_window(
+                keys=[
+                    f"{key_prefix}:{window_index}",
+                    f"{key_prefix}:{window_index - 1}",
+                ],
+                args=[policy.limit, policy.window, now - window_index * policy.window],
+            )
+        except RedisError as e:
+            # Fail open: losing admission control beats failing every request
+            logger.warning(f"Rate limit check failed: {e}")
+            return None
+
+        if retry_after:
+            metrics.increment(f"rate_limit.{policy.name}.rejected")
+            return int(retry_after)
+        return None
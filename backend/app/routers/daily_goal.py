@@ -1,6 +1,6 @@
-from typing import List
+from typing import List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Response
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlmodel import and_, select, update
@@ -9,7 +9,7 @@ from ..database import get_session
 from ..models.daily_goal import DailyGoal
 from ..schemas.daily_goal import DailyGoal as DailyGoalSchema
 from ..schemas.daily_goal import DailyGoalCreate, DailyGoalUpdate
-from .utils import get_current_user_id
+from .utils import PAGE_LIMIT_QUERY, get_current_user_id, page_rows, paginate_by_id
 
 router = APIRouter()
 
@@ -62,15 +62,16 @@ async def read_daily_goal(
 
 @router.get("/", response_model=List[DailyGoalSchema])
 async def read_daily_goals(
+    response: Response,
     skip: int = 0,
-    limit: int = 10,
+    limit: int = PAGE_LIMIT_QUERY,
+    cursor: Optional[str] = None,
     db: AsyncSession = Depends(get_session),
     user_id: int = Depends(get_current_user_id),
 ):
-    result = await db.execute(
-        select(DailyGoal).where(DailyGoal.user_id == user_id).offset(skip).limit(limit)
-    )
-    return result.scalars().all()
+    query = select(DailyGoal).where(DailyGoal.user_id == user_id).offset(skip)
+    result = await db.execute(paginate_by_id(query, DailyGoal.id, cursor, limit))
+    return page_rows(result.scalars().all(), limit, response, lambda g: (g.id,))
 
 
 @router.patch("/{daily_goal_id}", response_model=DailyGoalSchema)
@@ -0,0 +1,26 @@
+import hmac
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException
+
+from .. import metrics
+from ..config import settings
+
+
+async def require_metrics_token(authorization: Optional[str] = Header(None)) -> None:
+    # Internal counters aren't public; they're disabled without a scrape token
+    if settings.METRICS_TOKEN is None:
+        raise HTTPException(status_code=404, detail="Not Found")
+    expected = f"Bearer {settings.METRICS_TOKEN.get_secret_value()}"
+    if authorization is None or not hmac.compare_digest(
+        authorization.encode(), expected.encode()
+    ):
+        raise HTTPException(status_code=401, detail="Not authenticated")
+
+
+router = APIRouter(dependencies=[Depends(require_metrics_token)])
+
+
+@router.get("/")
+async def read_metrics():
+    return metrics.snapshot()
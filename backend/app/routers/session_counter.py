@@ -1,13 +1,13 @@
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Response
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlmodel import desc, select, update, and_
+from sqlmodel import select, update, and_
 
 from ..database import get_session
 from ..models.session_counter import SessionCounter
 from ..schemas.session_counter import SessionCounter as SessionCounterSchema
 from ..schemas.session_counter import SessionCounterCreate, SessionCounterUpdate
-from .utils import get_current_user_id
+from .utils import PAGE_LIMIT_QUERY, get_current_user_id, page_rows, paginate_by_id
 
 router = APIRouter()
 
@@ -56,19 +56,18 @@ async def read_session_counter(
 
 @router.get("/", response_model=List[SessionCounterSchema])
 async def read_session_counters(
+    response: Response,
     skip: int = 0,
-    limit: int = 10,
+    limit: int = PAGE_LIMIT_QUERY,
+    cursor: Optional[str] = None,
     db: AsyncSession = Depends(get_session),
     user_id: int = Depends(get_current_user_id),
 ):
+    query = select(SessionCounter).where(SessionCounter.user_id == user_id).offset(skip)
     result = await db.execute(
-        select(SessionCounter)
-        .where(SessionCounter.user_id == user_id)
-        .order_by(desc(SessionCounter.id))
-        .offset(skip)
-        .limit(limit)
+        paginate_by_id(query, SessionCounter.id, cursor, limit, descending=True)
     )
-    return result.scalars().all()
+    return page_rows(result.scalars().all(), limit, response, lambda c: (c.id,))
 
 
 @router.patch("/{session_counter_id}", response_model=SessionCounterSchema)
@@ -1,20 +1,42 @@
 from datetime import datetime
 from typing import List
 
-from fastapi import APIRouter, Body, Depends, HTTPException
+from fastapi import APIRouter, Body, Depends, HTTPException, Response
+from redis.asyncio import Redis
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from sqlalchemy import and_, or_
+from sqlalchemy import Date, cast, func, tuple_, union_all
+from sqlalchemy.orm import aliased
 
 
-from ..database import get_session
+from ..database import get_session, violated_constraint
+from ..dependencies import get_redis
 from ..models.study_block import StudyBlock
 from ..schemas.study_block import StudyBlock as StudyBlockSchema
-from ..schemas.study_block import StudyBlockCreate, StudyBlockUpdate, StudyBlockQuery
-from .utils import get_current_user_id
+from ..schemas.study_block import (
+    StudyBlockAggregateQuery,
+    StudyBlockCreate,
+    StudyBlockQuery,
+    StudyBlockUpdate,
+    StudyTimeBucket,
+)
+from ..study_rollup import apply_block_change, block_contribution, lock_rollup_timezone
+from ..user_cache import get_user_snapshot
+from .utils import decode_cursor, get_current_user_id, page_rows
 
 router = APIRouter()
 
+# Partial unique index allowing one unfinished block per user
+OPEN_BLOCK_INDEX = "uq_studyblock_user_id_open"
+
+
+def open_block_exists() -> HTTPException:
+    return HTTPException(
+        status_code=400,
+        detail="An unfinished study block already exists. Please finish or delete it before creating a new one.",
+    )
+
 
 @router.post("/", response_model=StudyBlockSchema)
 async def create_study_block(
@@ -22,22 +44,15 @@ async def create_study_block(
     db: AsyncSession = Depends(get_session),
     user_id: int = Depends(get_current_user_id),
 ):
-    # Check for existing unfinished block
-    query = select(StudyBlock).where(
-        StudyBlock.user_id == user_id, StudyBlock.end_time == None
-    )
-    result = await db.execute(query)
-    existing_unfinished_block = result.scalar_one_or_none()
-    if existing_unfinished_block:
-        raise HTTPException(
-            status_code=400,
-            detail="An unfinished study block already exists. Please finish or delete it before creating a new one.",
-        )
-
-    # Create the new block
     db_study_block = StudyBlock(**study_block.dict(), user_id=user_id)
     db.add(db_study_block)
-    await db.commit()
+    try:
+        await db.commit()
+    except IntegrityError as e:
+        await db.rollback()
+        if violated_constraint(e) != OPEN_BLOCK_INDEX:
+            raise
+        raise open_block_exists()
     await db.refresh(db_study_block)
     return db_study_block
 
@@ -61,42 +76,135 @@ async def read_study_block(
 
 @router.post("/query", response_model=List[StudyBlockSchema])
 async def query_study_blocks(
+    response: Response,
     query: StudyBlockQuery = Body(...),
     db: AsyncSession = Depends(get_session),
     user_id: int = Depends(get_current_user_id),
 ):
-    conditions = [StudyBlock.user_id == user_id]
-    
+    # Continue after the last block of the previous page, newest first
+    after_cursor = []
+    if query.cursor is not None:
+        last_start_time, last_id = decode_cursor(query.cursor, datetime, int)
+        after_cursor.append(
+            tuple_(StudyBlock.start_time, StudyBlock.id)
+            < tuple_(last_start_time, last_id)
+        )
+
+    in_range = [StudyBlock.user_id == user_id, StudyBlock.end_time != None]
     if query.start_time:
-        start_time = datetime.fromisoformat(query.start_time)
-        conditions.append(
-            or_(
-                StudyBlock.start_time >= start_time,
-                StudyBlock.end_time == None
+        in_range.append(StudyBlock.start_time >= query.start_time)
+    if query.end_time:
+        in_range.append(StudyBlock.start_time <= query.end_time)
+
+    # Each branch needs at most a page's worth of rows past the offset, plus
+    # one to tell whether there is a next page
+    page_limit = None if query.limit is None else query.limit + 1
+    window = None if page_limit is None else (query.skip or 0) + page_limit
+    newest_first = (StudyBlock.start_time.desc(), StudyBlock.id.desc())
+    branches = [
+        # Bounded scan of ix_studyblock_user_id_start_time
+        select(StudyBlock)
+        .where(*in_range, *after_cursor)
+        .order_by(*newest_first)
+        .limit(window),
+        # The unfinished block is always included
+        select(StudyBlock).where(
+            StudyBlock.user_id == user_id, StudyBlock.end_time == None, *after_cursor
+        ),
+    ]
+    if query.overlap and query.start_time:
+        # Only one block can be open at a time, so the last block started
+        # before the range is the only one that can run into it
+        last_before = (
+            select(StudyBlock.id)
+            .where(
+                StudyBlock.user_id == user_id,
+                StudyBlock.end_time != None,
+                StudyBlock.start_time < query.start_time,
             )
+            .order_by(*newest_first)
+            .limit(1)
+            .scalar_subquery()
         )
-    if query.end_time:
-        end_time = datetime.fromisoformat(query.end_time)
-        conditions.append(
-            or_(
-                StudyBlock.start_time <= end_time,
-                StudyBlock.end_time == None
+        branches.append(
+            select(StudyBlock).where(
+                StudyBlock.id == last_before,
+                StudyBlock.end_time > query.start_time,
+                *after_cursor,
             )
         )
 
+    blocks = aliased(StudyBlock, union_all(*branches).subquery())
     final_query = (
-        select(StudyBlock)
-        .where(and_(*conditions))
-        .order_by(StudyBlock.start_time.desc())
+        select(blocks)
+        .order_by(blocks.start_time.desc(), blocks.id.desc())
+        .offset(query.skip)
+        .limit(page_limit)
     )
 
-    if query.skip is not None:
-        final_query = final_query.offset(query.skip)
-    if query.limit is not None:
-        final_query = final_query.limit(query.limit)
-
     result = await db.execute(final_query)
-    return result.scalars().all()
+    study_blocks = result.scalars().all()
+    if query.limit is None:
+        return study_blocks
+    return page_rows(
+        study_blocks, query.limit, response, lambda b: (b.start_time, b.id)
+    )
+
+
+@router.post("/aggregate", response_model=List[StudyTimeBucket])
+async def aggregate_study_blocks(
+    query: StudyBlockAggregateQuery = Body(...),
+    redis: Redis = Depends(get_redis),
+    db: AsyncSession = Depends(get_session),
+    user_id: int = Depends(get_current_user_id),
+):
+    """
+    Total focused time of finished blocks per day, week or month, optionally
+    split by category. Blocks count toward the period they started in, in
+    the user's timezone.
+    """
+    snapshot = await get_user_snapshot(redis, db, user_id)
+    if snapshot is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    timezone = snapshot.get("timezone") or "UTC"
+
+    period_start = cast(
+        func.date_trunc(query.bucket, func.timezone(timezone, StudyBlock.start_time)),
+        Date,
+    ).label("period_start")
+    columns = [
+        period_start,
+        func.count().label("block_count"),
+        func.coalesce(
+            func.sum(
+                func.extract("epoch", StudyBlock.end_time - StudyBlock.start_time)
+            ),
+            0,
+        ).label("total_seconds"),
+    ]
+    group_by = [period_start]
+    if query.by_category:
+        columns.append(StudyBlock.study_category_id)
+        group_by.append(StudyBlock.study_category_id)
+
+    conditions = [StudyBlock.user_id == user_id, StudyBlock.end_time != None]
+    if query.start_time:
+        conditions.append(StudyBlock.start_time >= query.start_time)
+    if query.end_time:
+        conditions.append(StudyBlock.start_time < query.end_time)
+
+    result = await db.execute(
+        select(*columns).where(*conditions).group_by(*group_by).order_by(*group_by)
+    )
+    return [
+        StudyTimeBucket(
+            period_start=row.period_start,
+            study_category_id=row.study_category_id if query.by_category else None,
+            total_seconds=round(row.total_seconds),
+            block_count=row.block_count,
+        )
+        for row in result
+    ]
 
 
 @router.patch("/{study_block_id}", response_model=StudyBlockSchema)
@@ -106,21 +214,33 @@ async def update_study_block(
     db: AsyncSession = Depends(get_session),
     user_id: int = Depends(get_current_user_id),
 ):
+    timezone = await lock_rollup_timezone(db, user_id)
     result = await db.execute(
-        select(StudyBlock).where(
-            StudyBlock.id == study_block_id, StudyBlock.user_id == user_id
-        )
+        select(StudyBlock)
+        .where(StudyBlock.id == study_block_id, StudyBlock.user_id == user_id)
+        .with_for_update()
     )
     db_study_block = result.scalar_one_or_none()
     if db_study_block is None:
         raise HTTPException(status_code=404, detail="StudyBlock not found")
+    before = block_contribution(db_study_block, timezone)
 
     update_data = study_block.dict(exclude_unset=True)
 
     for key, value in update_data.items():
         setattr(db_study_block, key, value)
 
-    await db.commit()
+    try:
+        await apply_block_change(
+            db, user_id, before, block_contribution(db_study_block, timezone)
+        )
+        await db.commit()
+    except IntegrityError as e:
+        # Reopening a block with `end_time: null` while another is open
+        await db.rollback()
+        if violated_constraint(e) != OPEN_BLOCK_INDEX:
+            raise
+        raise open_block_exists()
     await db.refresh(db_study_block)
     return db_study_block
 
@@ -131,14 +251,18 @@ async def delete_study_block(
     db: AsyncSession = Depends(get_session),
     user_id: int = Depends(get_current_user_id),
 ):
+    timezone = await lock_rollup_timezone(db, user_id)
     result = await db.execute(
-        select(StudyBlock).where(
-            StudyBlock.id == study_block_id, StudyBlock.user_id == user_id
-        )
+        select(StudyBlock)
+        .where(StudyBlock.id == study_block_id, StudyBlock.user_id == user_id)
+        .with_for_update()
     )
     db_study_block = result.scalar_one_or_none()
     if db_study_block is None:
         return False
+    await apply_block_change(
+        db, user_id, block_contribution(db_study_block, timezone), None
+    )
     await db.delete(db_study_block)
     await db.commit()
     return True
@@ -1,6 +1,6 @@
-from typing import List
+from typing import List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Response
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlmodel import and_, select, update
@@ -12,7 +12,8 @@ from ..schemas.study_category import (
     StudyCategoryUpdate,
     StudyCategory as StudyCategorySchema,
 )
-from .utils import get_current_user_id
+from ..study_rollup import lock_user_rollups, rebuild_user_rollups
+from .utils import PAGE_LIMIT_QUERY, get_current_user_id, page_rows, paginate_by_id
 
 router = APIRouter()
 
@@ -67,18 +68,16 @@ async def read_study_category(
 
 @router.get("/", response_model=List[StudyCategorySchema])
 async def read_study_categories(
+    response: Response,
     skip: int = 0,
-    limit: int = 10,
+    limit: int = PAGE_LIMIT_QUERY,
+    cursor: Optional[str] = None,
     db: AsyncSession = Depends(get_session),
     user_id: int = Depends(get_current_user_id),
 ):
-    result = await db.execute(
-        select(StudyCategory)
-        .where(StudyCategory.user_id == user_id)
-        .offset(skip)
-        .limit(limit)
-    )
-    return result.scalars().all()
+    query = select(StudyCategory).where(StudyCategory.user_id == user_id).offset(skip)
+    result = await db.execute(paginate_by_id(query, StudyCategory.id, cursor, limit))
+    return page_rows(result.scalars().all(), limit, response, lambda c: (c.id,))
 
 
 @router.patch("/{study_category_id}", response_model=StudyCategorySchema)
@@ -136,6 +135,10 @@ async def delete_study_category(
     db_study_category = result.scalar_one_or_none()
     if db_study_category is None:
         return False
+    await lock_user_rollups(db, user_id)
     await db.delete(db_study_category)
+    await db.flush()
+    # Its blocks are now uncategorized and its rollup rows were cascaded away
+    await rebuild_user_rollups(db, user_id)
     await db.commit()
     return True
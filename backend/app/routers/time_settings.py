@@ -1,5 +1,5 @@
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Response
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlmodel import and_, select, update
 
@@ -10,7 +10,7 @@ from ..schemas.time_settings import (
     TimeSettingsUpdate,
     TimeSettings as TimeSettingsSchema,
 )
-from .utils import get_current_user_id
+from .utils import PAGE_LIMIT_QUERY, get_current_user_id, page_rows, paginate_by_id
 
 router = APIRouter()
 
@@ -62,18 +62,16 @@ async def read_time_settings(
 
 @router.get("/", response_model=List[TimeSettingsSchema])
 async def read_time_settings_list(
+    response: Response,
     skip: int = 0,
-    limit: int = 10,
+    limit: int = PAGE_LIMIT_QUERY,
+    cursor: Optional[str] = None,
     db: AsyncSession = Depends(get_session),
     user_id: int = Depends(get_current_user_id),
 ):
-    result = await db.execute(
-        select(TimeSettings)
-        .where(TimeSettings.user_id == user_id)
-        .offset(skip)
-        .limit(limit)
-    )
-    return result.scalars().all()
+    query = select(TimeSettings).where(TimeSettings.user_id == user_id).offset(skip)
+    result = await db.execute(paginate_by_id(query, TimeSettings.id, cursor, limit))
+    return page_rows(result.scalars().all(), limit, response, lambda t: (t.id,))
 
 
 @router.patch("/{time_settings_id}", response_model=TimeSettingsSchema)
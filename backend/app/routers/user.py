@@ -1,29 +1,65 @@
-from typing import List
+from typing import List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, Request, Response
-from redis import Redis
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from redis.asyncio import Redis
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 
-from app.dependencies import get_redis
+from app.dependencies import get_redis, get_session_store
 
-from ..auth.auth_utils import delete_session, hash_password
+from ..auth.auth_utils import hash_password
+from ..auth.session_store import SessionStore
 from ..database import get_session
 from ..models.user import User
 from ..schemas.user import User as UserSchema
 from ..schemas.user import UserCreate, UserUpdate
+from ..study_rollup import rebuild_user_rollups
 from ..uploads.upload_services import get_profile_photo_urls
-from .utils import get_current_user_id
+from ..user_cache import (
+    cache_user_snapshot,
+    get_user_snapshot,
+    invalidate_user_snapshot,
+)
+from .utils import PAGE_LIMIT_QUERY, get_current_user_id, page_rows, paginate_by_id
 
 router = APIRouter()
 
+PHOTO_FORMATS_QUERY = Query(
+    None,
+    description="Comma separated image formats the client can display, e.g. "
+    "avif,webp. Resized photo URLs use the smallest stored match.",
+)
+
+
+def parse_photo_formats(photo_formats: Optional[str]) -> list[str]:
+    if not photo_formats:
+        return []
+    return [image_format.strip().lower() for image_format in photo_formats.split(",")]
+
+
+async def with_photo_formats(snapshot: dict, photo_formats: Optional[str]) -> dict:
+    """
+    Swap the cached JPEG photo URLs for the client's preferred format.
+    """
+    accepted_formats = parse_photo_formats(photo_formats)
+    if not accepted_formats or not snapshot.get("profile_photo_formats"):
+        return snapshot
+    return {
+        **snapshot,
+        "profile_photo_urls": await get_profile_photo_urls(
+            snapshot["profile_photo_key"],
+            snapshot["profile_photo_formats"],
+            accepted_formats,
+        ),
+    }
+
 
 @router.post("/", response_model=UserSchema)
 async def create_user(user: UserCreate, db: AsyncSession = Depends(get_session)):
     result = await db.execute(select(User).where(User.email == user.email))
     if result.scalar_one_or_none():
         raise HTTPException(status_code=400, detail="Email already registered")
-    hashed_password = hash_password(user.password)
+    hashed_password = await hash_password(user.password)
     db_user = User(**user.dict(exclude={"password"}), hashed_password=hashed_password)
     db.add(db_user)
     await db.commit()
@@ -33,46 +69,50 @@ async def create_user(user: UserCreate, db: AsyncSession = Depends(get_session))
 
 @router.get("/me", response_model=UserSchema)
 async def read_current_user(
-    db: AsyncSession = Depends(get_session), user_id: int = Depends(get_current_user_id)
+    photo_formats: Optional[str] = PHOTO_FORMATS_QUERY,
+    redis: Redis = Depends(get_redis),
+    db: AsyncSession = Depends(get_session),
+    user_id: int = Depends(get_current_user_id),
 ):
-    result = await db.execute(select(User).where(User.id == user_id))
-    db_user = result.scalar_one_or_none()
-    if db_user is None:
+    snapshot = await get_user_snapshot(redis, db, user_id)
+    if snapshot is None:
         raise HTTPException(status_code=404, detail="User not found")
-
-    user_dict = db_user.__dict__
-    user_dict["profile_photo_urls"] = await get_profile_photo_urls(
-        db_user.profile_photo_key
-    )
-    return user_dict
+    return await with_photo_formats(snapshot, photo_formats)
 
 
 @router.get("/{user_id}", response_model=UserSchema)
-async def read_user(user_id: int, db: AsyncSession = Depends(get_session)):
-    result = await db.execute(select(User).where(User.id == user_id))
-    db_user = result.scalar_one_or_none()
-    if db_user is None:
+async def read_user(
+    user_id: int,
+    photo_formats: Optional[str] = PHOTO_FORMATS_QUERY,
+    redis: Redis = Depends(get_redis),
+    db: AsyncSession = Depends(get_session),
+):
+    snapshot = await get_user_snapshot(redis, db, user_id)
+    if snapshot is None:
         raise HTTPException(status_code=404, detail="User not found")
-
-    user_dict = db_user.__dict__
-    user_dict["profile_photo_urls"] = await get_profile_photo_urls(
-        db_user.profile_photo_key
-    )
-    return user_dict
+    return await with_photo_formats(snapshot, photo_formats)
 
 
 @router.get("/", response_model=List[UserSchema])
 async def read_users(
-    skip: int = 0, limit: int = 10, db: AsyncSession = Depends(get_session)
+    response: Response,
+    skip: int = 0,
+    limit: int = PAGE_LIMIT_QUERY,
+    cursor: Optional[str] = None,
+    photo_formats: Optional[str] = PHOTO_FORMATS_QUERY,
+    db: AsyncSession = Depends(get_session),
 ):
-    result = await db.execute(select(User).offset(skip).limit(limit))
-    users = result.scalars().all()
+    query = paginate_by_id(select(User).offset(skip), User.id, cursor, limit)
+    result = await db.execute(query)
+    users = page_rows(result.scalars().all(), limit, response, lambda u: (u.id,))
 
     user_list = []
     for user in users:
         user_dict = user.__dict__
         user_dict["profile_photo_urls"] = await get_profile_photo_urls(
-            user.profile_photo_key
+            user.profile_photo_key,
+            user.profile_photo_formats,
+            parse_photo_formats(photo_formats),
         )
         user_list.append(user_dict)
 
@@ -82,6 +122,7 @@ async def read_users(
 @router.patch("/", response_model=UserSchema)
 async def update_current_user(
     user: UserUpdate,
+    redis: Redis = Depends(get_redis),
     db: AsyncSession = Depends(get_session),
     user_id: int = Depends(get_current_user_id),
 ):
@@ -90,22 +131,23 @@ async def update_current_user(
     if db_user is None:
         raise HTTPException(status_code=404, detail="User not found")
     update_data = user.dict(exclude_unset=True)
+    timezone_changed = update_data.get("timezone", db_user.timezone) != db_user.timezone
     for key, value in update_data.items():
         setattr(db_user, key, value)
+    if timezone_changed:
+        # Rollups are keyed by local day, so they shift with the timezone
+        await db.flush()
+        await rebuild_user_rollups(db, user_id)
     await db.commit()
     await db.refresh(db_user)
-    user_dict = db_user.__dict__
-    user_dict["profile_photo_urls"] = await get_profile_photo_urls(
-        db_user.profile_photo_key
-    )
-    return user_dict
+    return await cache_user_snapshot(redis, db_user)
 
 
 @router.delete("/delete-account")
 async def delete_account(
     response: Response,
-    request: Request,
     redis: Redis = Depends(get_redis),
+    session_store: SessionStore = Depends(get_session_store),
     db: AsyncSession = Depends(get_session),
     user_id: int = Depends(get_current_user_id),
 ):
@@ -116,9 +158,8 @@ async def delete_account(
     await db.delete(db_user)
     await db.commit()
 
-    session_id = request.cookies.get("session_id")
-    if session_id:
-        await delete_session(redis, session_id)
+    await session_store.delete_all_for_user(user_id)
+    await invalidate_user_snapshot(redis, user_id)
 
     response.delete_cookie(key="session_id")
 
@@ -1,4 +1,16 @@
-from fastapi import HTTPException, Request
+import base64
+import binascii
+import json
+from datetime import datetime
+from typing import Callable, Sequence, TypeVar
+
+from fastapi import HTTPException, Query, Request, Response
+
+T = TypeVar("T")
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+PAGE_LIMIT_QUERY = Query(10, ge=1, le=1000)
 
 
 async def get_current_user_id(request: Request) -> int:
@@ -6,3 +18,57 @@ async def get_current_user_id(request: Request) -> int:
     if user_id is None:
         raise HTTPException(status_code=401, detail="Not authenticated")
     return user_id
+
+
+def encode_cursor(*values: int | datetime) -> str:
+    payload = [
+        value.isoformat() if isinstance(value, datetime) else value for value in values
+    ]
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+
+
+def decode_cursor(cursor: str, *types: type) -> tuple:
+    """
+    Decode a cursor from `encode_cursor` back into values of `types`,
+    rejecting anything that wasn't produced by it with a 400.
+    """
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if not isinstance(payload, list) or len(payload) != len(types):
+            raise ValueError
+        return tuple(
+            (
+                datetime.fromisoformat(value)
+                if value_type is datetime
+                else value_type(value)
+            )
+            for value_type, value in zip(types, payload)
+        )
+    except (ValueError, TypeError, binascii.Error):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def page_rows(
+    rows: Sequence[T], limit: int, response: Response, key: Callable[[T], tuple]
+) -> list[T]:
+    """
+    Trim the lookahead row from a query run with `limit + 1`, and if it was
+    there, point the client at the next page via the `X-Next-Cursor` header.
+    """
+    rows = list(rows)
+    if limit < len(rows):
+        rows = rows[:limit]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(*key(rows[-1]))
+    return rows
+
+
+def paginate_by_id(query, id_column, cursor: str | None, limit: int, descending=False):
+    """
+    Order `query` by `id_column` and continue after the row `cursor` points
+    at, fetching one row past `limit` for `page_rows`.
+    """
+    if cursor is not None:
+        (last_id,) = decode_cursor(cursor, int)
+        query = query.where(id_column < last_id if descending else id_column > last_id)
+    order = id_column.desc() if descending else id_column
+    return query.order_by(order).limit(limit + 1)
@@ -1,5 +1,5 @@
-from datetime import datetime
-from typing import Optional
+from datetime import date, datetime
+from typing import Literal, Optional
 
 from pydantic import BaseModel, Field
 
@@ -32,7 +32,26 @@ class StudyBlock(StudyBlockBase):
 
 
 class StudyBlockQuery(BaseModel):
-    start_time: Optional[str] = None
-    end_time: Optional[str] = None
+    start_time: Optional[datetime] = None
+    end_time: Optional[datetime] = None
+    # Also return a block that started before `start_time` but ran past it
+    overlap: bool = False
+    # Opaque X-Next-Cursor value from the previous page; prefer it over `skip`
+    cursor: Optional[str] = None
     skip: Optional[int] = Field(default=0, ge=0)
     limit: Optional[int] = Field(default=100, ge=1, le=1000)
+
+
+class StudyBlockAggregateQuery(BaseModel):
+    start_time: Optional[datetime] = None
+    end_time: Optional[datetime] = None
+    bucket: Literal["day", "week", "month"] = "day"
+    by_category: bool = False
+
+
+class StudyTimeBucket(BaseModel):
+    # First local day of the bucket in the user's timezone
+    period_start: date
+    study_category_id: Optional[int] = None
+    total_seconds: int
+    block_count: int
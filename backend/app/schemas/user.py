@@ -1,8 +1,9 @@
 from datetime import date, datetime
 from enum import Enum
 from typing import Dict, Optional
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 
-from pydantic import BaseModel, EmailStr, Field
+from pydantic import BaseModel, EmailStr, Field, field_validator
 
 
 class Gender(str, Enum):
@@ -49,6 +50,19 @@ class UserUpdate(BaseModel):
     last_name: Optional[str] = None
     gender: Optional[Gender] = None
     profile_photo_key: Optional[str] = None
+    timezone: Optional[str] = None
+
+    @field_validator("timezone")
+    @classmethod
+    def validate_timezone(cls, value: Optional[str]) -> Optional[str]:
+        # Only runs when the field is sent, so null means clearing the column
+        if value is None:
+            raise ValueError("Timezone can't be null")
+        try:
+            ZoneInfo(value)
+        except (ZoneInfoNotFoundError, ValueError):
+            raise ValueError("Unknown timezone")
+        return value
 
 
 class User(UserBase):
@@ -57,6 +71,8 @@ class User(UserBase):
     is_active: bool
     is_email_verified: bool
     social_provider: Optional[SocialProvider] = None
+    profile_photo_formats: Optional[str] = None
+    timezone: str = "UTC"
 
     class Config:
         orm_mode = True
@@ -0,0 +1,204 @@
+import asyncio
+import json
+import logging
+import os
+import random
+import socket
+import time
+
+from redis.asyncio import Redis
+from redis.exceptions import RedisError, ResponseError
+
+from . import metrics
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+# Move retries that are due back onto the stream, atomically across workers.
+# KEYS[1] = retry zset, KEYS[2] = stream
+# ARGV[1] = now, ARGV[2] = batch size
+_REQUEUE_DUE_SCRIPT = """
+local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+for _, payload in ipairs(due) do
+    redis.call('XADD', KEYS[2], '*', unpack(cjson.decode(payload)))
+    redis.call('ZREM', KEYS[1], payload)
+end
+return #due
+"""
+
+
+async def enqueue(redis: Redis, queue: str, fields: dict[str, str]) -> str:
+    entry_id = await redis.xadd(f"{queue}:stream", fields)
+    return entry_id.decode()
+
+
+class RedisStreamWorker:
+    """
+    Drains a Redis stream through a consumer group with bounded concurrency.
+
+    Failed entries are retried with exponential backoff through a sorted set
+    of due times and moved to a dead-letter stream after `max_attempts`.
+    Entries left pending by a crashed worker are reclaimed once idle for
+    `claim_idle_ms`. Subclasses implement `handle`.
+    """
+
+    queue: str
+
+    def __init__(
+        self,
+        redis: Redis,
+        concurrency: int,
+        max_attempts: int = settings.WORKER_MAX_ATTEMPTS,
+        retry_base_delay: float = settings.WORKER_RETRY_BASE_DELAY,
+        retry_max_delay: float = 300,
+        claim_idle_ms: int = 60_000,
+    ):
+        self.redis = redis
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+        self.claim_idle_ms = claim_idle_ms
+        self.stream = f"{self.queue}:stream"
+        self.retry_key = f"{self.queue}:retry"
+        self.dead_letter_stream = f"{self.queue}:dead_letter"
+        self.group = f"{self.queue}-workers"
+        self.consumer = f"{socket.gethostname()}-{os.getpid()}"
+        self._requeue_due = redis.register_script(_REQUEUE_DUE_SCRIPT)
+        self._in_flight: set[asyncio.Task] = set()
+        self._last_claim = 0.0
+
+        metrics.register_gauge(f"{self.queue}.in_flight", lambda: len(self._in_flight))
+
+    async def handle(self, fields: dict[str, str]) -> None:
+        raise NotImplementedError
+
+    async def on_dead_letter(self, fields: dict[str, str], error: Exception) -> None:
+        pass
+
+    async def run(self) -> None:
+        group_ready = False
+        try:
+            while True:
+                try:
+                    # Inside the retry loop, so a worker started while Redis
+                    # is unreachable keeps trying instead of exiting
+                    if not group_ready:
+                        await self._ensure_group()
+                        group_ready = True
+                    await self._poll()
+                except RedisError as e:
+                    logger.warning(f"{self.queue} worker lost Redis: {e}")
+                    # A restarted Redis may have lost the group as well
+                    group_ready = False
+                    await asyncio.sleep(1)
+        finally:
+            # Unacknowledged entries are reclaimed by the next worker to start
+            for task in self._in_flight:
+                task.cancel()
+
+    async def _ensure_group(self) -> None:
+        try:
+            await self.redis.xgroup_create(
+                self.stream, self.group, id="0", mkstream=True
+            )
+        except ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    async def _poll(self) -> None:
+        await self._requeue_due(
+            keys=[self.retry_key, self.stream], args=[time.time(), 100]
+        )
+
+        if time.monotonic() - self._last_claim > self.claim_idle_ms / 1000:
+            self._last_claim = time.monotonic()
+            _, claimed, *_ = await self.redis.xautoclaim(
+                self.stream,
+                self.group,
+                self.consumer,
+                min_idle_time=self.claim_idle_ms,
+                count=self.concurrency,
+            )
+            for entry_id, fields in claimed:
+                if fields:
+                    await self._start(entry_id, fields)
+
+        free_slots = self.concurrency - len(self._in_flight)
+        if free_slots <= 0:
+            await asyncio.wait(self._in_flight, return_when=asyncio.FIRST_COMPLETED)
+            return
+
+        response = await self.redis.xreadgroup(
+            self.group,
+            self.consumer,
+            {self.stream: ">"},
+            count=free_slots,
+            block=1000,
+        )
+        for _, entries in response:
+            for entry_id, fields in entries:
+                await self._start(entry_id, fields)
+
+    async def _start(self, entry_id: bytes, fields: dict[bytes, bytes]) -> None:
+        while len(self._in_flight) >= self.concurrency:
+            await asyncio.wait(self._in_flight, return_when=asyncio.FIRST_COMPLETED)
+        task = asyncio.create_task(self._process(entry_id, fields))
+        self._in_flight.add(task)
+        task.add_done_callback(self._in_flight.discard)
+
+    async def _process(self, entry_id: bytes, raw_fields: dict[bytes, bytes]) -> None:
+        fields = {key.decode(): value.decode() for key, value in raw_fields.items()}
+        attempts = int(fields.pop("_attempts", 0)) + 1
+        fields.pop("_retry_of", None)
+        started = time.monotonic()
+        try:
+            await self.handle(fields)
+        except Exception as e:
+            metrics.increment(f"{self.queue}.failed")
+            await self._retry_or_dead_letter(entry_id, fields, attempts, e)
+        else:
+            metrics.increment(f"{self.queue}.processed")
+        finally:
+            metrics.observe(f"{self.queue}.seconds", time.monotonic() - started)
+
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.xack(self.stream, self.group, entry_id)
+            pipe.xdel(self.stream, entry_id)
+            await pipe.execute()
+
+    async def _retry_or_dead_letter(
+        self,
+        entry_id: bytes,
+        fields: dict[str, str],
+        attempts: int,
+        error: Exception,
+    ) -> None:
+        if attempts >= self.max_attempts:
+            logger.error(f"{self.queue} entry {entry_id!r} failed permanently: {error}")
+            metrics.increment(f"{self.queue}.dead_lettered")
+            await self.redis.xadd(
+                self.dead_letter_stream,
+                {**fields, "_attempts": attempts, "_error": str(error)},
+            )
+            await self.on_dead_letter(fields, error)
+            return
+
+        logger.warning(f"{self.queue} entry {entry_id!r} failed, retrying: {error}")
+        metrics.increment(f"{self.queue}.retried")
+        delay = min(self.retry_base_delay * 2 ** (attempts - 1), self.retry_max_delay)
+        delay *= random.uniform(0.8, 1.2)
+        # Flattened field/value list, as XADD takes it; the entry id keeps
+        # otherwise identical payloads distinct in the sorted set
+        payload = [
+            item
+            for key, value in {
+                **fields,
+                "_attempts": str(attempts),
+                "_retry_of": entry_id.decode(),
+            }.items()
+            for item in (key, value)
+        ]
+        await self.redis.zadd(
+            self.retry_key, {json.dumps(payload): time.time() + delay}
+        )
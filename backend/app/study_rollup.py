@@ -0,0 +1,223 @@
+from datetime import date
+from typing import NamedTuple
+from zoneinfo import ZoneInfo
+
+from sqlalchemy import Date, cast, delete, func, insert, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from .models.daily_study_rollup import DailyStudyRollup
+from .models.study_block import StudyBlock
+from .models.user import User
+
+ROLLUP_KEY = ["user_id", "local_day", "study_category_id"]
+
+
+class RollupContribution(NamedTuple):
+    local_day: date
+    study_category_id: int | None
+    seconds: int
+    rating: float | None
+
+
+def block_contribution(block: StudyBlock, timezone: str) -> RollupContribution | None:
+    """
+    What `block` adds to the rollup, or None while it is unfinished.
+    Seconds are truncated per block, matching `_recompute_query`.
+    """
+    if block.end_time is None:
+        return None
+    return RollupContribution(
+        local_day=block.start_time.astimezone(ZoneInfo(timezone)).date(),
+        study_category_id=block.study_category_id,
+        seconds=int((block.end_time - block.start_time).total_seconds()),
+        rating=block.rating,
+    )
+
+
+async def lock_rollup_timezone(session: AsyncSession, user_id: int) -> str:
+    """
+    Read the user's timezone, holding a share lock on the user row so a
+    timezone change and its rollup rebuild can't interleave with our update.
+    """
+    result = await session.execute(
+        select(User.timezone).where(User.id == user_id).with_for_update(read=True)
+    )
+    return result.scalar_one()
+
+
+async def lock_user_rollups(session: AsyncSession, user_id: int) -> None:
+    """
+    Take an exclusive lock on the user row, making block updates wait until
+    the caller's transaction ends. Take it before touching study blocks.
+    """
+    await session.execute(select(User.id).where(User.id == user_id).with_for_update())
+
+
+async def _add(
+    session: AsyncSession, user_id: int, contribution: RollupContribution
+) -> None:
+    rated = contribution.rating is not None
+    stmt = pg_insert(DailyStudyRollup).values(
+        user_id=user_id,
+        local_day=contribution.local_day,
+        study_category_id=contribution.study_category_id,
+        total_seconds=contribution.seconds,
+        block_count=1,
+        rating_sum=contribution.rating or 0,
+        rating_count=int(rated),
+    )
+    await session.execute(
+        stmt.on_conflict_do_update(
+            index_elements=ROLLUP_KEY,
+            set_={
+                "total_seconds": DailyStudyRollup.total_seconds
+                + stmt.excluded.total_seconds,
+                "block_count": DailyStudyRollup.block_count + 1,
+                "rating_sum": DailyStudyRollup.rating_sum + stmt.excluded.rating_sum,
+                "rating_count": DailyStudyRollup.rating_count
+                + stmt.excluded.rating_count,
+            },
+        )
+    )
+
+
+async def _subtract(
+    session: AsyncSession, user_id: int, contribution: RollupContribution
+) -> None:
+    key = [
+        DailyStudyRollup.user_id == user_id,
+        DailyStudyRollup.local_day == contribution.local_day,
+        DailyStudyRollup.study_category_id.is_not_distinct_from(
+            contribution.study_category_id
+        ),
+    ]
+    rated = contribution.rating is not None
+    await session.execute(
+        update(DailyStudyRollup)
+        .where(*key)
+        .values(
+            total_seconds=DailyStudyRollup.total_seconds - contribution.seconds,
+            block_count=DailyStudyRollup.block_count - 1,
+            rating_sum=DailyStudyRollup.rating_sum - (contribution.rating or 0),
+            rating_count=DailyStudyRollup.rating_count - int(rated),
+        )
+    )
+    await session.execute(
+        delete(DailyStudyRollup).where(*key, DailyStudyRollup.block_count <= 0)
+    )
+
+
+async def apply_block_change(
+    session: AsyncSession,
+    user_id: int,
+    before: RollupContribution | None,
+    after: RollupContribution | None,
+) -> None:
+    """
+    Move a block's contribution from `before` to `after` in the caller's
+    transaction. Pass None for a side where the block didn't count.
+    """
+    if before == after:
+        return
+    if before is not None:
+        await _subtract(session, user_id, before)
+    if after is not None:
+        await _add(session, user_id, after)
+
+
+def _recompute_query(user_id: int):
+    local_day = cast(func.timezone(User.timezone, StudyBlock.start_time), Date)
+    return (
+        select(
+            StudyBlock.user_id,
+            local_day.label("local_day"),
+            StudyBlock.study_category_id,
+            func.sum(
+                func.trunc(
+                    func.extract("epoch", StudyBlock.end_time - StudyBlock.start_time)
+                )
+            ).label("total_seconds"),
+            func.count().label("block_count"),
+            func.coalesce(func.sum(StudyBlock.rating), 0).label("rating_sum"),
+            func.count(StudyBlock.rating).label("rating_count"),
+        )
+        .join(User, User.id == StudyBlock.user_id)
+        .where(StudyBlock.user_id == user_id, StudyBlock.end_time != None)
+        .group_by(StudyBlock.user_id, local_day, StudyBlock.study_category_id)
+    )
+
+
+async def rebuild_user_rollups(session: AsyncSession, user_id: int) -> None:
+    """
+    Recompute the user's rollup rows from their study blocks. The caller
+    commits the session.
+    """
+    await lock_user_rollups(session, user_id)
+    await session.execute(
+        delete(DailyStudyRollup).where(DailyStudyRollup.user_id == user_id)
+    )
+    await session.execute(
+        insert(DailyStudyRollup).from_select(
+            [
+                *ROLLUP_KEY,
+                "total_seconds",
+                "block_count",
+                "rating_sum",
+                "rating_count",
+            ],
+            _recompute_query(user_id),
+        )
+    )
+
+
+async def check_user_rollups(session: AsyncSession, user_id: int) -> list[str]:
+    """
+    Compare the user's rollup rows against a full recompute, returning a
+    description of every mismatching (day, category).
+    """
+    expected = {
+        (row.local_day, row.study_category_id): (
+            int(row.total_seconds),
+            row.block_count,
+            float(row.rating_sum),
+            row.rating_count,
+        )
+        for row in await session.execute(_recompute_query(user_id))
+    }
+    result = await session.execute(
+        select(DailyStudyRollup).where(DailyStudyRollup.user_id == user_id)
+    )
+    actual = {
+        (rollup.local_day, rollup.study_category_id): (
+            rollup.total_seconds,
+            rollup.block_count,
+            rollup.rating_sum,
+            rollup.rating_count,
+        )
+        for rollup in result.scalars()
+    }
+
+    mismatches = []
+    for key in sorted(
+        expected.keys() | actual.keys(), key=lambda key: (key[0], key[1] or 0)
+    ):
+        want, have = expected.get(key), actual.get(key)
+        if want is None or have is None or not _rollup_values_match(want, have):
+            local_day, study_category_id = key
+            mismatches.append(
+                f"user {user_id} {local_day} category {study_category_id}: "
+                f"expected {want}, found {have}"
+            )
+    return mismatches
+
+
+def _rollup_values_match(want: tuple, have: tuple) -> bool:
+    # Rating sums are floats built up incrementally, so compare them loosely
+    return (
+        want[0] == have[0]
+        and want[1] == have[1]
+        and abs(want[2] - have[2]) < 1e-6
+        and want[3] == have[3]
+    )
@@ -1 +0,0 @@
-from .upload_routes import router as upload_router
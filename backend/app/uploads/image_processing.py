@@ -0,0 +1,137 @@
+import io
+
+from PIL import Image
+
+try:
+    # Registers AVIF support on Pillow versions without it built in
+    import pillow_avif  # noqa: F401
+except ImportError:
+    pass
+
+# Runs in worker processes, so keep this module free of app imports
+
+# Only these decoders are tried, whatever the file claims to be
+INPUT_FORMATS = ("JPEG", "PNG")
+
+IMAGE_VARIANT_SIZES = {
+    "medium": (300, 300),
+    "thumbnail": (100, 100),
+}
+VARIANT_QUALITY = 85
+MIN_QUALITY = 20
+MAX_QUALITY = 95
+
+# Encoder options for the formats stored besides JPEG, smallest output first
+MODERN_FORMATS = {
+    "avif": {"quality": 55, "speed": 8},
+    "webp": {"quality": 80, "method": 4},
+}
+
+
+def encode_jpeg(img: Image.Image, quality: int) -> bytes:
+    output = io.BytesIO()
+    img.save(output, format="JPEG", quality=quality)
+    return output.getvalue()
+
+
+def available_modern_formats() -> list[str]:
+    Image.init()
+    return [
+        image_format
+        for image_format in MODERN_FORMATS
+        if image_format.upper() in Image.SAVE
+    ]
+
+
+def encode_variant(img: Image.Image, image_format: str) -> bytes:
+    if image_format == "jpeg":
+        return encode_jpeg(img, VARIANT_QUALITY)
+    output = io.BytesIO()
+    img.save(output, format=image_format.upper(), **MODERN_FORMATS[image_format])
+    return output.getvalue()
+
+
+def compress_image(img: Image.Image, max_size: int) -> bytes:
+    """
+    Encode `img` at the highest JPEG quality that fits in `max_size` bytes,
+    binary searching the quality instead of stepping down from the top.
+    """
+    best = encode_jpeg(img, MAX_QUALITY)
+    if len(best) <= max_size:
+        return best
+
+    best = None
+    low, high = MIN_QUALITY, MAX_QUALITY - 1
+    while low <= high:
+        quality = (low + high) // 2
+        data = encode_jpeg(img, quality)
+        if len(data) <= max_size:
+            best = data
+            low = quality + 1
+        else:
+            high = quality - 1
+
+    if best is None:
+        raise ValueError("Unable to compress image to desired size")
+    return best
+
+
+def resize_to_fit(img: Image.Image, size: tuple[int, int]) -> Image.Image:
+    """
+    Downscale preserving aspect ratio, like `Image.thumbnail`, but returning a
+    new image instead of copying the full-size source first.
+    """
+    ratio = min(size[0] / img.width, size[1] / img.height)
+    if ratio >= 1:
+        return img
+    target = (max(1, round(img.width * ratio)), max(1, round(img.height * ratio)))
+    return img.resize(target, Image.Resampling.LANCZOS, reducing_gap=3.0)
+
+
+def open_image(source: bytes | str, max_pixels: int, max_dimension: int) -> Image.Image:
+    """
+    Decode `source` no larger than needed to fit `max_dimension`, refusing
+    images over `max_pixels` before any pixel data is decoded.
+    """
+    img = Image.open(
+        io.BytesIO(source) if isinstance(source, bytes) else source,
+        formats=INPUT_FORMATS,
+    )
+    if img.width * img.height > max_pixels:
+        raise ValueError(f"Image exceeds {max_pixels} pixels")
+
+    target = (max_dimension, max_dimension)
+    if img.format == "JPEG":
+        # libjpeg can decode at 1/2, 1/4 or 1/8 scale, so a large photo never
+        # materializes at full resolution
+        img.draft("RGB", target)
+    if img.mode not in ("RGB", "L"):
+        img = img.convert("RGB")
+    else:
+        img.load()
+    return resize_to_fit(img, target)
+
+
+def process_image(
+    source: bytes | str, max_size: int, max_pixels: int, max_dimension: int
+) -> dict[str, dict[str, bytes]]:
+    """
+    Decode `source`, either the image bytes or a path to them, once and
+    encode the original and every resized variant from that single decode.
+
+    Returns encoded images by variant, then by format. The original is only
+    stored as JPEG; resized variants are also encoded in every available
+    modern format.
+    """
+    img = open_image(source, max_pixels, max_dimension)
+    image_formats = ["jpeg", *available_modern_formats()]
+
+    versions = {"original": {"jpeg": compress_image(img, max_size)}}
+    # Variants are ordered largest first, so each is resized from the last
+    for name, size in IMAGE_VARIANT_SIZES.items():
+        img = resize_to_fit(img, size)
+        versions[name] = {
+            image_format: encode_variant(img, image_format)
+            for image_format in image_formats
+        }
+    return versions
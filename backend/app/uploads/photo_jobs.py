@@ -0,0 +1,123 @@
+import logging
+import uuid
+
+from fastapi import HTTPException
+from redis.asyncio import Redis
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from ..config import settings
+from ..database import AsyncSessionLocal
+from ..models.user import User
+from ..stream_worker import RedisStreamWorker, enqueue
+from ..user_cache import invalidate_user_snapshot
+from .upload_services import (
+    MAX_IMAGE_SIZE,
+    StoredPhoto,
+    invalidate_profile_photo_urls,
+    process_and_upload_image,
+)
+from .upload_utils import S3ObjectTooLarge, delete_from_s3, download_from_s3
+
+logger = logging.getLogger(__name__)
+
+PHOTO_JOB_KEY_PREFIX = "photo_job:"
+
+
+async def set_profile_photo(
+    session: AsyncSession, redis: Redis, user_id: int, photo: StoredPhoto | None
+) -> bool:
+    """
+    Point the user at a new set of photo variants, evicting cached URLs and
+    snapshots for the old ones. Returns False if the user no longer exists.
+    """
+    result = await session.execute(select(User).where(User.id == user_id))
+    user = result.scalar_one_or_none()
+    if not user:
+        return False
+
+    previous_photo_key = user.profile_photo_key
+    user.profile_photo_key = photo.key if photo else None
+    user.profile_photo_formats = photo.formats if photo else None
+    await session.commit()
+    await invalidate_profile_photo_urls(redis, previous_photo_key)
+    await invalidate_user_snapshot(redis, user_id)
+    return True
+
+
+async def _set_job_status(redis: Redis, job_id: str, status: str, **fields) -> None:
+    key = f"{PHOTO_JOB_KEY_PREFIX}{job_id}"
+    await redis.hset(key, mapping={"status": status, **fields})
+    await redis.expire(key, settings.PHOTO_JOB_STATUS_TTL)
+
+
+async def enqueue_photo_job(redis: Redis, user_id: int, file_name: str) -> str:
+    job_id = str(uuid.uuid4())
+    await _set_job_status(redis, job_id, "pending", user_id=str(user_id))
+    await enqueue(
+        redis,
+        PhotoJobWorker.queue,
+        {"job_id": job_id, "user_id": str(user_id), "file_name": file_name},
+    )
+    return job_id
+
+
+async def get_photo_job(redis: Redis, job_id: str) -> dict[str, str] | None:
+    job = await redis.hgetall(f"{PHOTO_JOB_KEY_PREFIX}{job_id}")
+    if not job:
+        return None
+    return {key.decode(): value.decode() for key, value in job.items()}
+
+
+class PhotoJobWorker(RedisStreamWorker):
+    """
+    Turns a photo uploaded straight to storage into the profile photo
+    variants, then swaps it in as the user's profile photo.
+    """
+
+    queue = "photo_jobs"
+
+    def __init__(self, redis: Redis, **kwargs):
+        kwargs.setdefault("concurrency", settings.PHOTO_JOB_WORKER_CONCURRENCY)
+        super().__init__(redis, **kwargs)
+
+    async def handle(self, fields: dict[str, str]) -> None:
+        job_id = fields["job_id"]
+        user_id = int(fields["user_id"])
+        await _set_job_status(self.redis, job_id, "processing")
+
+        try:
+            # The upload URL stays valid after confirming, so the object may
+            # have been replaced since its size was checked
+            file_content = await download_from_s3(
+                fields["file_name"], max_size=MAX_IMAGE_SIZE
+            )
+            photo = await process_and_upload_image(file_content)
+        except S3ObjectTooLarge:
+            await self._fail(fields, "File size exceeds maximum limit of 5MB")
+            return
+        except HTTPException as e:
+            if e.status_code >= 500:
+                raise
+            # Retrying won't make a bad image valid
+            await self._fail(fields, e.detail)
+            return
+
+        async with AsyncSessionLocal() as session:
+            if not await set_profile_photo(session, self.redis, user_id, photo):
+                await _set_job_status(
+                    self.redis, job_id, "failed", error="User not found"
+                )
+                return
+
+        await delete_from_s3(fields["file_name"])
+        await _set_job_status(self.redis, job_id, "done", profile_photo_key=photo.key)
+
+    async def _fail(self, fields: dict[str, str], error: str) -> None:
+        await _set_job_status(self.redis, fields["job_id"], "failed", error=error)
+        await delete_from_s3(fields["file_name"])
+
+    async def on_dead_letter(self, fields: dict[str, str], error: Exception) -> None:
+        await _set_job_status(
+            self.redis, fields["job_id"], "failed", error="Processing failed"
+        )
@@ -0,0 +1,184 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from datetime import UTC, datetime, timedelta
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from .. import metrics
+from ..config import settings
+from ..models.user import User
+from .upload_services import PROFILE_PHOTO_SIZES, variant_file_name
+from .upload_utils import UPLOAD_STAGING_PREFIX, find_s3_object, run_s3_call
+
+logger = logging.getLogger(__name__)
+
+# DeleteObjects accepts at most this many keys per request
+DELETE_BATCH_SIZE = 1000
+
+
+@dataclass
+class ReapStats:
+    listed: int = 0
+    orphaned: int = 0
+    deleted: int = 0
+    # Orphans left alone because their photo was uploaded again meanwhile
+    skipped: int = 0
+    orphaned_bytes: int = 0
+    errors: int = 0
+    seconds: float = 0.0
+
+    @property
+    def deleted_per_second(self) -> float:
+        return self.deleted / self.seconds if self.seconds else 0.0
+
+
+def photo_base(file_name: str) -> str | None:
+    """
+    Map a variant object name such as `thumbnail_photos/<hash>.webp` to the
+    profile photo key it belongs to, without its extension.
+    """
+    size, separator, rest = file_name.partition("_")
+    if not separator or size not in PROFILE_PHOTO_SIZES:
+        return None
+    base, _, _ = rest.rpartition(".")
+    return base or rest
+
+
+async def _live_photo_bases(session: AsyncSession) -> set[str]:
+    result = await session.execute(
+        select(User.profile_photo_key).where(User.profile_photo_key.is_not(None))
+    )
+    return {key.rpartition(".")[0] or key for key in result.scalars()}
+
+
+def _is_orphan(obj: dict, live_bases: set[str], now: datetime) -> bool:
+    age = now - obj["LastModified"]
+    if obj["Key"].startswith(UPLOAD_STAGING_PREFIX):
+        # Confirmed uploads are deleted once processed
+        return age > timedelta(seconds=settings.PHOTO_REAPER_STAGING_MAX_AGE)
+    base = photo_base(obj["Key"])
+    # Objects we don't recognise are never touched. Recent ones may belong to
+    # an upload whose user row isn't updated yet.
+    return (
+        base is not None
+        and base not in live_bases
+        and age > timedelta(seconds=settings.PHOTO_REAPER_MIN_AGE)
+    )
+
+
+def _original_file_name(base: str) -> str:
+    return variant_file_name(f"{base}.jpg", "original")
+
+
+async def _delete_keys(keys: list[str], stats: ReapStats) -> None:
+    for start in range(0, len(keys), DELETE_BATCH_SIZE):
+        chunk = keys[start : start + DELETE_BATCH_SIZE]
+        response = await run_s3_call(
+            "delete_objects",
+            Bucket=settings.AWS_S3_BUCKET_NAME,
+            Delete={"Objects": [{"Key": key} for key in chunk], "Quiet": True},
+        )
+        errors = response.get("Errors", [])
+        for error in errors:
+            logger.warning(f"Failed to delete {error['Key']}: {error['Message']}")
+        stats.errors += len(errors)
+        stats.deleted += len(chunk) - len(errors)
+        metrics.increment("photo_reaper.deleted", len(chunk) - len(errors))
+
+
+async def _delete_batch(
+    session: AsyncSession,
+    batch: list[dict],
+    stats: ReapStats,
+    deleted_originals: set[str],
+) -> None:
+    # Re-read live keys right before deleting, as a duplicate upload may have
+    # pointed a user at one of these objects since the listing started
+    live_bases = await _live_photo_bases(session)
+    staged = []
+    variants_by_base: dict[str, list[str]] = {}
+    for obj in batch:
+        if obj["Key"].startswith(UPLOAD_STAGING_PREFIX):
+            staged.append(obj["Key"])
+            continue
+        base = photo_base(obj["Key"])
+        if base not in live_bases:
+            variants_by_base.setdefault(base, []).append(obj["Key"])
+
+    # Uploads skip processing when a photo's original exists, taking that to
+    # mean every variant does. So a photo's original goes first, and photos
+    # whose original was rewritten since the listing are left alone.
+    now = datetime.now(UTC)
+    heads = await asyncio.gather(
+        *(find_s3_object(_original_file_name(base)) for base in variants_by_base)
+    )
+    originals, variants = [], []
+    for (base, keys), original in zip(variants_by_base.items(), heads):
+        original_name = _original_file_name(base)
+        if original is not None:
+            age = now - original["LastModified"]
+            if age <= timedelta(seconds=settings.PHOTO_REAPER_MIN_AGE):
+                stats.skipped += len(keys)
+                continue
+            originals.append(original_name)
+            if original_name not in keys:
+                # Sorted after some of its variants, so count it now and skip
+                # it if it's still listed later
+                deleted_originals.add(original_name)
+                stats.orphaned += 1
+                stats.orphaned_bytes += original["ContentLength"]
+        variants.extend(key for key in keys if key != original_name)
+
+    await _delete_keys(originals, stats)
+    await _delete_keys(staged + variants, stats)
+
+
+async def reap_orphaned_photos(
+    session: AsyncSession, dry_run: bool = False
+) -> ReapStats:
+    """
+    Delete photo variants no user points at, and abandoned direct uploads.
+
+    The bucket listing is diffed against live `User.profile_photo_key`s and
+    orphans are removed with batched DeleteObjects calls, each photo's
+    original ahead of its variants. With `dry_run`, orphans are only counted
+    and logged.
+    """
+    stats = ReapStats()
+    started = time.monotonic()
+    now = datetime.now(UTC)
+    live_bases = await _live_photo_bases(session)
+    batch: list[dict] = []
+    deleted_originals: set[str] = set()
+    params = {"Bucket": settings.AWS_S3_BUCKET_NAME}
+
+    while True:
+        page = await run_s3_call("list_objects_v2", **params)
+        for obj in page.get("Contents", []):
+            stats.listed += 1
+            if obj["Key"] in deleted_originals or not _is_orphan(obj, live_bases, now):
+                continue
+            stats.orphaned += 1
+            stats.orphaned_bytes += obj["Size"]
+            if dry_run:
+                logger.info(f"Would delete {obj['Key']}")
+                continue
+            batch.append(obj)
+            if len(batch) == DELETE_BATCH_SIZE:
+                await _delete_batch(session, batch, stats, deleted_originals)
+                batch = []
+        if not page.get("IsTruncated"):
+            break
+        params["ContinuationToken"] = page["NextContinuationToken"]
+
+    if batch:
+        await _delete_batch(session, batch, stats, deleted_originals)
+
+    stats.seconds = time.monotonic() - started
+    metrics.increment("photo_reaper.listed", stats.listed)
+    metrics.increment("photo_reaper.orphaned", stats.orphaned)
+    metrics.observe("photo_reaper.seconds", stats.seconds)
+    return stats
@@ -1,19 +1,24 @@
 import uuid
 
-from fastapi import APIRouter, Depends, File, HTTPException, Request, UploadFile
+from botocore.exceptions import ClientError
+from fastapi import APIRouter, Depends, HTTPException, Request
 from redis.asyncio import Redis
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 
-from ..auth.auth_utils import get_user_id_from_session
 from ..database import get_session
 from ..dependencies import get_redis
 from ..models.user import User
+from ..routers.utils import get_current_user_id
+from .photo_jobs import enqueue_photo_job, get_photo_job, set_profile_photo
+from .upload_schemas import ConfirmUploadRequest
 from .upload_services import (
     generate_profile_photo_upload_url,
     generate_profile_photo_view_url,
     process_and_upload_image,
 )
+from .upload_stream import receive_image_upload
+from .upload_utils import UPLOAD_STAGING_PREFIX, delete_from_s3, head_s3_object
 
 router = APIRouter()
 
@@ -25,78 +30,58 @@ def allowed_file(filename: str):
     return "." in filename and filename.rsplit(".", 1)[1].lower() in ALLOWED_EXTENSIONS
 
 
-@router.post("/upload-profile-photo")
+@router.post(
+    "/upload-profile-photo",
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {
+                "multipart/form-data": {
+                    "schema": {
+                        "type": "object",
+                        "required": ["file"],
+                        "properties": {"file": {"type": "string", "format": "binary"}},
+                    }
+                }
+            },
+        }
+    },
+)
 async def upload_profile_photo(
     request: Request,
-    file: UploadFile = File(...),
     redis: Redis = Depends(get_redis),
     session: AsyncSession = Depends(get_session),
+    user_id: int = Depends(get_current_user_id),
 ):
-    user_id = await get_user_id_from_session(redis, request.cookies.get("session_id"))
-    if not user_id:
-        raise HTTPException(
-            status_code=401, detail="Invalid session or session expired"
-        )
-
-    if not allowed_file(file.filename):
-        raise HTTPException(status_code=400, detail="File type not allowed")
-
-    file_content = await file.read()
-    if len(file_content) > MAX_FILE_SIZE:
-        raise HTTPException(
-            status_code=400, detail="File size exceeds maximum limit of 5MB"
-        )
-
-    profile_photo_key = await process_and_upload_image(
-        file_content, file.filename, user_id
-    )
+    # The body is streamed and size-checked here rather than parsed up front
+    async with receive_image_upload(
+        request, MAX_FILE_SIZE, allowed_filename=allowed_file
+    ) as upload:
+        photo = await process_and_upload_image(upload.path)
 
-    user = await session.execute(select(User).where(User.id == user_id))
-    user = user.scalar_one_or_none()
-    if not user:
+    if not await set_profile_photo(session, redis, user_id, photo):
         raise HTTPException(status_code=404, detail="User not found")
 
-    user.profile_photo_key = profile_photo_key
-    await session.commit()
-
     return {"message": "Profile photo uploaded successfully"}
 
 
 @router.delete("/remove-profile-photo")
 async def remove_profile_photo(
-    request: Request,
     redis: Redis = Depends(get_redis),
     session: AsyncSession = Depends(get_session),
+    user_id: int = Depends(get_current_user_id),
 ):
-    user_id = await get_user_id_from_session(redis, request.cookies.get("session_id"))
-    if not user_id:
-        raise HTTPException(
-            status_code=401, detail="Invalid session or session expired"
-        )
-
-    user = await session.execute(select(User).where(User.id == user_id))
-    user = user.scalar_one_or_none()
-    if not user:
+    if not await set_profile_photo(session, redis, user_id, None):
         raise HTTPException(status_code=404, detail="User not found")
 
-    user.profile_photo_key = None
-    await session.commit()
-
     return {"message": "Profile photo removed successfully"}
 
 
 @router.get("/get-profile-photo-view-url")
 async def get_profile_photo_view_url(
-    request: Request,
-    redis: Redis = Depends(get_redis),
     session: AsyncSession = Depends(get_session),
+    user_id: int = Depends(get_current_user_id),
 ):
-    user_id = await get_user_id_from_session(redis, request.cookies.get("session_id"))
-    if not user_id:
-        raise HTTPException(
-            status_code=401, detail="Invalid session or session expired"
-        )
-
     user = await session.execute(select(User).where(User.id == user_id))
     user = user.scalar_one_or_none()
     if not user:
@@ -118,15 +103,47 @@ async def get_profile_photo_view_url(
 
 @router.get("/get-profile-photo-upload-url")
 async def get_profile_photo_upload_url(
-    request: Request,
+    user_id: int = Depends(get_current_user_id),
+):
+    file_name = f"{UPLOAD_STAGING_PREFIX}user_{user_id}/{uuid.uuid4()}.jpg"
+    upload_url = await generate_profile_photo_upload_url(file_name)
+    return {"upload_url": upload_url, "file_name": file_name}
+
+
+@router.post("/confirm-profile-photo-upload", status_code=202)
+async def confirm_profile_photo_upload(
+    request: ConfirmUploadRequest,
     redis: Redis = Depends(get_redis),
+    user_id: int = Depends(get_current_user_id),
 ):
-    user_id = await get_user_id_from_session(redis, request.cookies.get("session_id"))
-    if not user_id:
+    """
+    Queue a photo PUT to an upload URL for processing. Poll
+    `/profile-photo-jobs/{job_id}` until its status is "done" or "failed".
+    """
+    if not request.file_name.startswith(f"{UPLOAD_STAGING_PREFIX}user_{user_id}/"):
+        raise HTTPException(status_code=400, detail="Invalid upload")
+
+    try:
+        upload = await head_s3_object(request.file_name)
+    except ClientError:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    if upload["ContentLength"] > MAX_FILE_SIZE:
+        await delete_from_s3(request.file_name)
         raise HTTPException(
-            status_code=401, detail="Invalid session or session expired"
+            status_code=400, detail="File size exceeds maximum limit of 5MB"
         )
 
-    file_name = f"profile_photo_{user_id}_{uuid.uuid4()}.jpg"
-    upload_url = await generate_profile_photo_upload_url(file_name)
-    return {"upload_url": upload_url, "file_name": file_name}
+    job_id = await enqueue_photo_job(redis, user_id, request.file_name)
+    return {"job_id": job_id, "status": "pending"}
+
+
+@router.get("/profile-photo-jobs/{job_id}")
+async def get_profile_photo_job(
+    job_id: str,
+    redis: Redis = Depends(get_redis),
+    user_id: int = Depends(get_current_user_id),
+):
+    job = await get_photo_job(redis, job_id)
+    if job is None or job.pop("user_id", None) != str(user_id):
+        raise HTTPException(status_code=404, detail="Job not found")
+    return {"job_id": job_id, **job}
@@ -0,0 +1,5 @@
+from pydantic import BaseModel
+
+
+class ConfirmUploadRequest(BaseModel):
+    file_name: str
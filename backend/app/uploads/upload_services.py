@@ -1,29 +1,153 @@
+import asyncio
+import hashlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import NamedTuple
 from urllib.parse import urlparse
 
 from fastapi import HTTPException
+from PIL import Image, UnidentifiedImageError
+from redis.asyncio import Redis
 
-from .upload_utils import (
-    compress_image,
-    generate_file_name,
-    generate_image_versions,
-    get_presigned_url_for_image,
-    upload_to_s3,
+from .. import metrics
+from ..cache import (
+    TTLCache,
+    publish_invalidation,
+    register_invalidation_handler,
+    register_invalidation_target,
 )
+from ..config import settings
+from .image_processing import MODERN_FORMATS, process_image
+from .upload_utils import find_s3_object, get_presigned_url_for_image, upload_to_s3
 
+MAX_IMAGE_SIZE = 5 * 1024 * 1024  # 5 MB
+PROFILE_PHOTO_SIZES = ["original", "medium", "thumbnail"]
+# Formats the resized variants can be served in, smallest first
+PHOTO_FORMAT_PREFERENCE = [*MODERN_FORMATS, "jpeg"]
 
-async def process_and_upload_image(
-    file_content: bytes, original_filename: str, user_id: int
-):
-    compressed_content = compress_image(file_content)
-    image_versions = generate_image_versions(compressed_content)
+# (profile_photo_key, format) -> {size: presigned URL}. Reusing a URL until it
+# nears expiry gives browsers a stable URL to cache.
+photo_url_cache = TTLCache(
+    "photo_urls",
+    maxsize=settings.PRESIGNED_URL_CACHE_MAX_SIZE,
+    ttl=settings.PRESIGNED_URL_EXPIRY - settings.PRESIGNED_URL_REFRESH_MARGIN,
+)
+# Registered as a target so it is cleared when invalidations may have been
+# missed; keys are tuples, so individual entries are evicted by the handler
+register_invalidation_target("photo_urls", photo_url_cache)
+
+
+def _evict_photo_urls(profile_photo_key: str) -> None:
+    for image_format in PHOTO_FORMAT_PREFERENCE:
+        photo_url_cache.delete((profile_photo_key, image_format))
+
+
+register_invalidation_handler("photo_urls", _evict_photo_urls)
+
+
+class StoredPhoto(NamedTuple):
+    key: str
+    # Comma separated formats stored besides JPEG, see User.profile_photo_formats
+    formats: str | None = None
+
+
+def variant_file_name(
+    profile_photo_key: str, size: str, image_format: str = "jpeg"
+) -> str:
+    if image_format == "jpeg":
+        return f"{size}_{profile_photo_key}"
+    base, _, _ = profile_photo_key.rpartition(".")
+    return f"{size}_{base or profile_photo_key}.{image_format}"
+
+
+# Decoding and encoding hold the GIL, so image work runs in separate processes.
+# Spawned rather than forked, as the parent already runs threads.
+image_executor = ProcessPoolExecutor(
+    max_workers=settings.IMAGE_PROCESS_WORKERS,
+    mp_context=multiprocessing.get_context("spawn"),
+)
+_pending_image_jobs = 0
 
-    base_filename = f"user_{user_id}/{generate_file_name(original_filename)}"
+metrics.register_gauge("image_process.pending", lambda: _pending_image_jobs)
 
-    for size, content in image_versions.items():
-        filename = f"{size}_{base_filename}"
-        upload_to_s3(content, filename)
 
-    return base_filename
+async def _run_image_job(func, *args):
+    global _pending_image_jobs
+    if _pending_image_jobs >= settings.IMAGE_PROCESS_MAX_PENDING:
+        metrics.increment("image_process.rejected")
+        raise HTTPException(
+            status_code=503,
+            detail="Server is busy, please try again",
+            headers={"Retry-After": "5"},
+        )
+    _pending_image_jobs += 1
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(image_executor, func, *args)
+    finally:
+        _pending_image_jobs -= 1
+
+
+def content_hash(source: bytes | str) -> str:
+    if isinstance(source, bytes):
+        return hashlib.sha256(source).hexdigest()
+    with open(source, "rb") as file:
+        return hashlib.file_digest(file, "sha256").hexdigest()
+
+
+async def process_and_upload_image(source: bytes | str) -> StoredPhoto:
+    """
+    Store the profile photo variants for `source` and return their key.
+
+    Keys are derived from the upload's content hash and shared by every
+    user, so re-uploading an image that is already stored skips processing
+    and uploading entirely.
+    """
+    digest = await asyncio.to_thread(content_hash, source)
+    profile_photo_key = f"photos/{digest}.jpg"
+    # The original is written last, so its presence means the set is complete
+    existing = await find_s3_object(variant_file_name(profile_photo_key, "original"))
+    if existing is not None:
+        metrics.increment("image_process.deduplicated")
+        return StoredPhoto(
+            profile_photo_key, existing.get("Metadata", {}).get("formats") or None
+        )
+
+    try:
+        image_versions = await _run_image_job(
+            process_image,
+            source,
+            MAX_IMAGE_SIZE,
+            settings.IMAGE_MAX_PIXELS,
+            settings.IMAGE_ORIGINAL_MAX_DIMENSION,
+        )
+    except (UnidentifiedImageError, Image.DecompressionBombError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid image: {e}")
+
+    original = image_versions.pop("original")["jpeg"]
+    await asyncio.gather(
+        *(
+            upload_to_s3(
+                content,
+                variant_file_name(profile_photo_key, size, image_format),
+                content_type=f"image/{image_format}",
+            )
+            for size, encoded in image_versions.items()
+            for image_format, content in encoded.items()
+        )
+    )
+    formats = ",".join(
+        image_format
+        for image_format in image_versions["thumbnail"]
+        if image_format != "jpeg"
+    )
+    await upload_to_s3(
+        original,
+        variant_file_name(profile_photo_key, "original"),
+        metadata={"formats": formats},
+    )
+
+    return StoredPhoto(profile_photo_key, formats or None)
 
 
 async def generate_profile_photo_view_url(image_url: str):
@@ -35,11 +159,53 @@ async def generate_profile_photo_upload_url(file_name: str):
     return get_presigned_url_for_image(file_name, "put_object")
 
 
-async def get_profile_photo_urls(profile_photo_key: str):
+def choose_photo_format(
+    profile_photo_formats: str | None, accepted_formats: list[str] | None
+) -> str:
+    """
+    Pick the smallest stored format of the resized variants that the client
+    accepts, falling back to JPEG.
+    """
+    if not profile_photo_formats or not accepted_formats:
+        return "jpeg"
+    stored = profile_photo_formats.split(",")
+    return next(
+        (
+            image_format
+            for image_format in PHOTO_FORMAT_PREFERENCE
+            if image_format in stored and image_format in accepted_formats
+        ),
+        "jpeg",
+    )
+
+
+async def get_profile_photo_urls(
+    profile_photo_key: str,
+    profile_photo_formats: str | None = None,
+    accepted_formats: list[str] | None = None,
+):
     if not profile_photo_key:
         return None
 
-    return {
-        size: get_presigned_url_for_image(f"{size}_{profile_photo_key}")
-        for size in ["original", "medium", "thumbnail"]
-    }
+    image_format = choose_photo_format(profile_photo_formats, accepted_formats)
+    urls = photo_url_cache.get((profile_photo_key, image_format))
+    if urls is None:
+        urls = {
+            size: get_presigned_url_for_image(
+                variant_file_name(
+                    profile_photo_key,
+                    size,
+                    # The original is only stored as JPEG
+                    "jpeg" if size == "original" else image_format,
+                ),
+                expiration=settings.PRESIGNED_URL_EXPIRY,
+            )
+            for size in PROFILE_PHOTO_SIZES
+        }
+        photo_url_cache.set((profile_photo_key, image_format), urls)
+    return urls
+
+
+async def invalidate_profile_photo_urls(redis: Redis, profile_photo_key: str):
+    if profile_photo_key:
+        await publish_invalidation(redis, "photo_urls", profile_photo_key)
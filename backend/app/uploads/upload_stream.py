@@ -0,0 +1,188 @@
+import asyncio
+import tempfile
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import IO, AsyncIterator, Callable
+
+import multipart
+from fastapi import HTTPException, Request
+from multipart.multipart import parse_options_header
+
+# Leading bytes of the image formats we accept
+IMAGE_SIGNATURES = {
+    b"\xff\xd8\xff": "jpeg",
+    b"\x89PNG\r\n\x1a\n": "png",
+}
+SIGNATURE_LENGTH = max(len(signature) for signature in IMAGE_SIGNATURES)
+# Allowance for boundaries, part headers and small form fields around the file
+MULTIPART_OVERHEAD = 64 * 1024
+
+
+@dataclass
+class StreamedUpload:
+    filename: str
+    image_format: str
+    size: int
+    file: IO[bytes]
+
+    @property
+    def path(self) -> str:
+        return self.file.name
+
+
+def sniff_image_format(header: bytes) -> str | None:
+    for signature, image_format in IMAGE_SIGNATURES.items():
+        if header.startswith(signature):
+            return image_format
+    return None
+
+
+class _ImageUploadParser:
+    """
+    Multipart callbacks that keep only the data of one file field, counting
+    its bytes and checking its signature as it arrives.
+    """
+
+    def __init__(
+        self,
+        field_name: str,
+        max_size: int,
+        allowed_filename: Callable[[str], bool] | None = None,
+    ):
+        self.field_name = field_name
+        self.max_size = max_size
+        self.allowed_filename = allowed_filename
+        self.filename: str | None = None
+        self.image_format: str | None = None
+        self.size = 0
+        self.header = b""
+        self.pending: list[bytes] = []
+        self._in_file_part = False
+        self._header_name = b""
+        self._header_value = b""
+        self._disposition = b""
+
+    def on_part_begin(self) -> None:
+        self._in_file_part = False
+        self._disposition = b""
+
+    def on_header_field(self, data: bytes, start: int, end: int) -> None:
+        self._header_name += data[start:end]
+
+    def on_header_value(self, data: bytes, start: int, end: int) -> None:
+        self._header_value += data[start:end]
+
+    def on_header_end(self) -> None:
+        if self._header_name.lower() == b"content-disposition":
+            self._disposition = self._header_value
+        self._header_name = b""
+        self._header_value = b""
+
+    def on_headers_finished(self) -> None:
+        _, options = parse_options_header(self._disposition)
+        if (
+            options.get(b"name", b"").decode("latin-1") == self.field_name
+            and b"filename" in options
+            and self.filename is None
+        ):
+            self.filename = options[b"filename"].decode("utf-8", "replace")
+            # Refuse before any of the file's data arrives
+            if self.allowed_filename and not self.allowed_filename(self.filename):
+                raise HTTPException(status_code=400, detail="File type not allowed")
+            self._in_file_part = True
+
+    def on_part_data(self, data: bytes, start: int, end: int) -> None:
+        if not self._in_file_part:
+            return
+        self.size += end - start
+        if self.size > self.max_size:
+            raise HTTPException(
+                status_code=400, detail="File size exceeds maximum limit of 5MB"
+            )
+        if self.image_format is None:
+            self.header += data[start : min(end, start + SIGNATURE_LENGTH)]
+            if len(self.header) >= SIGNATURE_LENGTH:
+                self._check_signature()
+        self.pending.append(data[start:end])
+
+    def on_part_end(self) -> None:
+        if self._in_file_part and self.image_format is None:
+            self._check_signature()
+        self._in_file_part = False
+
+    def _check_signature(self) -> None:
+        self.image_format = sniff_image_format(self.header)
+        if self.image_format is None:
+            raise HTTPException(status_code=400, detail="File is not a JPEG or PNG")
+
+    @property
+    def callbacks(self) -> dict:
+        return {
+            "on_part_begin": self.on_part_begin,
+            "on_part_data": self.on_part_data,
+            "on_part_end": self.on_part_end,
+            "on_header_field": self.on_header_field,
+            "on_header_value": self.on_header_value,
+            "on_header_end": self.on_header_end,
+            "on_headers_finished": self.on_headers_finished,
+        }
+
+
+@asynccontextmanager
+async def receive_image_upload(
+    request: Request,
+    max_size: int,
+    field_name: str = "file",
+    allowed_filename: Callable[[str], bool] | None = None,
+) -> AsyncIterator[StreamedUpload]:
+    """
+    Stream one image field of a multipart request body into a temporary file.
+
+    Oversized bodies are rejected on Content-Length before anything is read,
+    and otherwise as soon as the running byte count passes `max_size`, so a
+    worker never holds more than one network chunk of the upload in memory.
+    Files whose name fails `allowed_filename` are rejected as soon as their
+    part headers are parsed. The temporary file is removed on exit.
+    """
+    content_length = request.headers.get("content-length")
+    if content_length is not None and not content_length.isdigit():
+        raise HTTPException(status_code=400, detail="Invalid Content-Length")
+    if content_length and int(content_length) > max_size + MULTIPART_OVERHEAD:
+        raise HTTPException(
+            status_code=400, detail="File size exceeds maximum limit of 5MB"
+        )
+
+    _, params = parse_options_header(request.headers.get("content-type", ""))
+    boundary = params.get(b"boundary")
+    if not boundary:
+        raise HTTPException(status_code=400, detail="Expected a multipart upload")
+
+    # Named so the image worker process can open it by path
+    with tempfile.NamedTemporaryFile(prefix="upload-") as file:
+        upload_parser = _ImageUploadParser(field_name, max_size, allowed_filename)
+        parser = multipart.MultipartParser(boundary, upload_parser.callbacks)
+        received = 0
+        async for chunk in request.stream():
+            received += len(chunk)
+            # Bodies without a Content-Length still can't grow unbounded
+            if received > max_size + MULTIPART_OVERHEAD:
+                raise HTTPException(
+                    status_code=400, detail="File size exceeds maximum limit of 5MB"
+                )
+            parser.write(chunk)
+            if upload_parser.pending:
+                data = b"".join(upload_parser.pending)
+                upload_parser.pending.clear()
+                await asyncio.to_thread(file.write, data)
+        parser.finalize()
+
+        if upload_parser.filename is None or upload_parser.size == 0:
+            raise HTTPException(status_code=400, detail="No file uploaded")
+        await asyncio.to_thread(file.flush)
+
+        yield StreamedUpload(
+            filename=upload_parser.filename,
+            image_format=upload_parser.image_format,
+            size=upload_parser.size,
+            file=file,
+        )
@@ -1,24 +1,58 @@
-import io
-import uuid
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 
 import boto3
 from botocore.config import Config
-from PIL import Image
+from botocore.exceptions import ClientError
 
+from .. import metrics
 from ..config import settings
 
+logger = logging.getLogger(__name__)
+
 s3_client = boto3.client(
     "s3",
     region_name=settings.AWS_REGION,
+    endpoint_url=settings.AWS_S3_ENDPOINT_URL,
     aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
     aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY.get_secret_value(),
-    config=Config(signature_version="s3v4"),
+    config=Config(
+        signature_version="s3v4",
+        max_pool_connections=settings.S3_MAX_POOL_CONNECTIONS,
+        retries={"max_attempts": 3, "mode": "adaptive"},
+        tcp_keepalive=True,
+    ),
+)
+
+# boto3 is blocking; one thread per pooled connection drives it off the loop
+s3_executor = ThreadPoolExecutor(
+    max_workers=settings.S3_MAX_POOL_CONNECTIONS, thread_name_prefix="s3"
 )
 
 
-def generate_file_name(original_filename: str) -> str:
-    extension = original_filename.split(".")[-1]
-    return f"{uuid.uuid4()}.{extension}"
+async def run_s3_call(operation: str, **params):
+    """
+    Run a blocking `s3_client` operation on the S3 thread pool, recording its
+    latency as `s3.{operation}.seconds`.
+    """
+    loop = asyncio.get_running_loop()
+    started = time.monotonic()
+    try:
+        return await loop.run_in_executor(
+            s3_executor, partial(getattr(s3_client, operation), **params)
+        )
+    except Exception:
+        metrics.increment(f"s3.{operation}.errors")
+        raise
+    finally:
+        metrics.observe(f"s3.{operation}.seconds", time.monotonic() - started)
+
+
+# Direct uploads land here until a photo job has processed them
+UPLOAD_STAGING_PREFIX = "uploads/"
 
 
 def get_presigned_url_for_image(
@@ -34,51 +68,76 @@ def get_presigned_url_for_image(
     )
 
 
-def compress_image(image_data: bytes, max_size: int = 5 * 1024 * 1024) -> bytes:
-    img = Image.open(io.BytesIO(image_data))
-
-    if img.mode == "RGBA":
-        img = img.convert("RGB")
-
-    quality = 95
-    output = io.BytesIO()
-
-    while True:
-        output.seek(0)
-        img.save(output, format="JPEG", quality=quality)
-        if output.tell() <= max_size:
-            break
-        quality -= 5
-        if quality < 20:
-            raise ValueError("Unable to compress image to desired size")
-
-    return output.getvalue()
-
-
-def generate_image_versions(image_data: bytes):
-    img = Image.open(io.BytesIO(image_data))
-
-    medium = img.copy()
-    medium.thumbnail((300, 300))
-    medium_output = io.BytesIO()
-    medium.save(medium_output, format="JPEG", quality=85)
-
-    thumbnail = img.copy()
-    thumbnail.thumbnail((100, 100))
-    thumbnail_output = io.BytesIO()
-    thumbnail.save(thumbnail_output, format="JPEG", quality=85)
-
-    return {
-        "original": image_data,
-        "medium": medium_output.getvalue(),
-        "thumbnail": thumbnail_output.getvalue(),
-    }
-
-
-def upload_to_s3(file_data: bytes, file_name: str, content_type: str = "image/jpeg"):
-    s3_client.put_object(
+async def upload_to_s3(
+    file_data: bytes,
+    file_name: str,
+    content_type: str = "image/jpeg",
+    metadata: dict[str, str] | None = None,
+):
+    started = time.monotonic()
+    await run_s3_call(
+        "put_object",
         Bucket=settings.AWS_S3_BUCKET_NAME,
         Key=file_name,
         Body=file_data,
         ContentType=content_type,
+        Metadata=metadata or {},
+        # Keys are never reused, so browsers may keep the object for as
+        # long as its URL stays the same
+        CacheControl="private, max-age=31536000, immutable",
+    )
+    logger.info(
+        f"Uploaded {file_name} ({len(file_data)} bytes) "
+        f"in {time.monotonic() - started:.3f}s"
+    )
+
+
+async def head_s3_object(file_name: str) -> dict:
+    return await run_s3_call(
+        "head_object", Bucket=settings.AWS_S3_BUCKET_NAME, Key=file_name
+    )
+
+
+async def find_s3_object(file_name: str) -> dict | None:
+    """
+    Return the object's HEAD response, or None if it doesn't exist.
+    """
+    try:
+        return await head_s3_object(file_name)
+    except ClientError as e:
+        if e.response["Error"]["Code"] in ("404", "NoSuchKey", "NotFound"):
+            return None
+        raise
+
+
+class S3ObjectTooLarge(Exception):
+    pass
+
+
+async def download_from_s3(file_name: str, max_size: int | None = None) -> bytes:
+    """
+    Read an object into memory. With `max_size`, only that many bytes plus
+    one are requested, and larger objects raise S3ObjectTooLarge.
+    """
+    params = {"Bucket": settings.AWS_S3_BUCKET_NAME, "Key": file_name}
+    if max_size is not None:
+        params["Range"] = f"bytes=0-{max_size}"
+    try:
+        response = await run_s3_call("get_object", **params)
+    except ClientError as e:
+        # A range can't be satisfied by an empty object
+        if e.response["Error"]["Code"] == "InvalidRange":
+            return b""
+        raise
+    # Reading the streamed body blocks too
+    loop = asyncio.get_running_loop()
+    data = await loop.run_in_executor(s3_executor, response["Body"].read)
+    if max_size is not None and len(data) > max_size:
+        raise S3ObjectTooLarge(f"{file_name} exceeds {max_size} bytes")
+    return data
+
+
+async def delete_from_s3(file_name: str):
+    await run_s3_call(
+        "delete_object", Bucket=settings.AWS_S3_BUCKET_NAME, Key=file_name
     )
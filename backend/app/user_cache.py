@@ -0,0 +1,110 @@
+import json
+import uuid
+
+from redis.asyncio import Redis
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from .cache import TTLCache, publish_invalidation, register_invalidation_target
+from .config import settings
+from .models.user import User
+from .schemas.user import User as UserSchema
+from .uploads.upload_services import get_profile_photo_urls
+
+USER_SNAPSHOT_KEY_PREFIX = "user_snapshot:"
+# Changed on every write-through or invalidation, so a reader that loaded the
+# user before one happened won't cache what it read
+USER_SNAPSHOT_VERSION_KEY_PREFIX = "user_snapshot_version:"
+
+# KEYS[1] = snapshot key, KEYS[2] = version key
+# ARGV[1] = version seen before reading the database, ARGV[2] = ttl,
+# ARGV[3] = snapshot
+_FILL_SNAPSHOT_SCRIPT = """
+if (redis.call('GET', KEYS[2]) or '') ~= ARGV[1] then
+    return 0
+end
+redis.call('SET', KEYS[1], ARGV[3], 'EX', ARGV[2], 'NX')
+return 1
+"""
+
+# L1: per-worker copy of the serialized profile, keyed by str(user_id)
+user_snapshot_cache = TTLCache(
+    "user_snapshot",
+    maxsize=settings.USER_CACHE_MAX_SIZE,
+    ttl=settings.USER_CACHE_L1_TTL,
+)
+register_invalidation_target("user", user_snapshot_cache)
+
+
+async def serialize_user(user: User) -> dict:
+    user_data = user.model_dump()
+    user_data["profile_photo_urls"] = await get_profile_photo_urls(
+        user.profile_photo_key
+    )
+    return UserSchema.model_validate(user_data).model_dump(mode="json")
+
+
+async def cache_user_snapshot(redis: Redis, user: User) -> dict:
+    """
+    Serialize `user` and write it through both cache levels, evicting stale
+    copies held by other workers.
+    """
+    snapshot = await serialize_user(user)
+    async with redis.pipeline(transaction=True) as pipe:
+        pipe.setex(
+            f"{USER_SNAPSHOT_KEY_PREFIX}{user.id}",
+            settings.USER_CACHE_TTL,
+            json.dumps(snapshot),
+        )
+        _bump_version(pipe, user.id)
+        await pipe.execute()
+    await publish_invalidation(redis, "user", str(user.id))
+    user_snapshot_cache.set(str(user.id), snapshot)
+    return snapshot
+
+
+async def get_user_snapshot(
+    redis: Redis, db: AsyncSession, user_id: int
+) -> dict | None:
+    snapshot = user_snapshot_cache.get(str(user_id))
+    if snapshot is not None:
+        return snapshot
+
+    snapshot_key = f"{USER_SNAPSHOT_KEY_PREFIX}{user_id}"
+    version_key = f"{USER_SNAPSHOT_VERSION_KEY_PREFIX}{user_id}"
+    cached, version = await redis.mget(snapshot_key, version_key)
+    if cached is not None:
+        snapshot = json.loads(cached)
+        user_snapshot_cache.set(str(user_id), snapshot)
+        return snapshot
+
+    result = await db.execute(select(User).where(User.id == user_id))
+    user = result.scalar_one_or_none()
+    if user is None:
+        return None
+    snapshot = await serialize_user(user)
+    # Skip the fill if the user was written or invalidated since `version`
+    # was read, as the row we loaded may predate that change
+    filled = await redis.register_script(_FILL_SNAPSHOT_SCRIPT)(
+        keys=[snapshot_key, version_key],
+        args=[version or b"", settings.USER_CACHE_TTL, json.dumps(snapshot)],
+    )
+    if filled:
+        user_snapshot_cache.set(str(user_id), snapshot)
+    return snapshot
+
+
+def _bump_version(pipe, user_id: int) -> None:
+    pipe.setex(
+        f"{USER_SNAPSHOT_VERSION_KEY_PREFIX}{user_id}",
+        settings.USER_CACHE_TTL,
+        uuid.uuid4().hex,
+    )
+
+
+async def invalidate_user_snapshot(redis: Redis, user_id: int) -> None:
+    async with redis.pipeline(transaction=True) as pipe:
+        pipe.delete(f"{USER_SNAPSHOT_KEY_PREFIX}{user_id}")
+        _bump_version(pipe, user_id)
+        await pipe.execute()
+    await publish_invalidation(redis, "user", str(user_id))
@@ -0,0 +1,69 @@
+import os
+
+# Settings are read at import time, so required values are filled in before
+# any app module is imported. Real values from the environment win.
+for name, value in {
+    "AWS_ACCESS_KEY_ID": "testing",
+    "AWS_SECRET_ACCESS_KEY": "testing",
+    "AWS_S3_BUCKET_NAME": "deepworktimer-test",
+    "BREVO_API_KEY": "testing",
+    "GITHUB_CLIENT_ID": "testing",
+    "GITHUB_CLIENT_SECRET": "testing",
+    "GOOGLE_CLIENT_ID": "testing",
+    "FRONTEND_URL": "http://localhost:3000",
+    "DEBUG": "false",
+}.items():
+    os.environ.setdefault(name, value)
+
+import pytest
+from fakeredis.aioredis import FakeRedis
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.pool import NullPool
+
+from app.config import settings
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+async def redis():
+    # Lua scripts run through fakeredis' lupa backend
+    client = FakeRedis()
+    yield client
+    await client.flushall()
+    await client.aclose()
+
+
+@pytest.fixture
+async def db():
+    """
+    A session on the migrated Postgres database at DATABASE_HOST, run inside
+    a transaction that is rolled back afterwards. Commits only release a
+    savepoint. Skips when the database isn't reachable.
+    """
+    engine = create_async_engine(str(settings.DATABASE_URL), poolclass=NullPool)
+    try:
+        connection = await engine.connect()
+    except (OSError, SQLAlchemyError) as e:
+        await engine.dispose()
+        pytest.skip(f"Postgres is not reachable: {e}")
+    transaction = await connection.begin()
+    if await connection.scalar(text("SELECT to_regclass('studyblock')")) is None:
+        await connection.close()
+        await engine.dispose()
+        pytest.skip("Database is not migrated, run alembic upgrade head")
+    session = AsyncSession(
+        bind=connection,
+        join_transaction_mode="create_savepoint",
+        expire_on_commit=False,
+    )
+    yield session
+    await session.close()
+    await transaction.rollback()
+    await connection.close()
+    await engine.dispose()
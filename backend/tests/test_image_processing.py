@@ -0,0 +1,144 @@
+import io
+import struct
+import zlib
+
+import pytest
+from PIL import Image
+
+from app.uploads import image_processing
+from app.uploads.image_processing import (
+    MAX_QUALITY,
+    MIN_QUALITY,
+    compress_image,
+    open_image,
+    process_image,
+)
+
+
+@pytest.fixture
+def encodes(monkeypatch):
+    """
+    Record the quality of every JPEG encode.
+    """
+    qualities = []
+    encode_jpeg = image_processing.encode_jpeg
+
+    def counted(img, quality):
+        qualities.append(quality)
+        return encode_jpeg(img, quality)
+
+    monkeypatch.setattr(image_processing, "encode_jpeg", counted)
+    return qualities
+
+
+def noise(size: tuple[int, int]) -> Image.Image:
+    # Noise barely compresses, so every quality step changes the size
+    return Image.effect_noise(size, 80).convert("RGB")
+
+
+def jpeg_size(img: Image.Image, quality: int) -> int:
+    output = io.BytesIO()
+    img.save(output, format="JPEG", quality=quality)
+    return output.tell()
+
+
+@pytest.mark.parametrize("target_quality", [MIN_QUALITY, 47, 73, MAX_QUALITY - 1])
+def test_quality_search_finds_the_highest_quality_that_fits(encodes, target_quality):
+    img = noise((400, 300))
+    max_size = jpeg_size(img, target_quality)
+
+    data = compress_image(img, max_size)
+
+    assert jpeg_size(img, target_quality + 1) > max_size
+    assert len(data) == max_size
+    # One try at MAX_QUALITY, then a binary search over the other 75
+    # qualities, where stepping down by 5 takes up to 16 encodes
+    assert len(encodes) <= 1 + 7
+
+
+def test_image_that_fits_at_max_quality_is_encoded_once(encodes):
+    compress_image(noise((40, 30)), 5 * 1024 * 1024)
+
+    assert encodes == [MAX_QUALITY]
+
+
+def test_image_that_never_fits_is_refused():
+    with pytest.raises(ValueError):
+        compress_image(noise((400, 300)), 100)
+
+
+@pytest.fixture
+def resized(monkeypatch):
+    """
+    Record the size of every image passed to `resize_to_fit`.
+    """
+    sizes = []
+    resize_to_fit = image_processing.resize_to_fit
+
+    def recorded(img, size):
+        sizes.append(img.size)
+        return resize_to_fit(img, size)
+
+    monkeypatch.setattr(image_processing, "resize_to_fit", recorded)
+    return sizes
+
+
+def encoded(size: tuple[int, int], image_format: str = "JPEG") -> bytes:
+    output = io.BytesIO()
+    Image.new("RGB", size, "orange").save(output, format=image_format)
+    return output.getvalue()
+
+
+def png_header_only(size: tuple[int, int]) -> bytes:
+    """
+    A PNG that declares `size` but carries almost no pixel data, so decoding
+    it would fail rather than hit the pixel cap.
+    """
+    ihdr = struct.pack(">IIBBBBB", *size, 8, 2, 0, 0, 0)
+    data = zlib.compress(b"\0" * 16)
+
+    def chunk(kind: bytes, body: bytes) -> bytes:
+        crc = zlib.crc32(kind + body)
+        return struct.pack(">I", len(body)) + kind + body + struct.pack(">I", crc)
+
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + chunk(b"IHDR", ihdr)
+        + chunk(b"IDAT", data)
+        + chunk(b"IEND", b"")
+    )
+
+
+def test_images_over_the_pixel_cap_are_refused_before_decoding():
+    # 60 MP, under Pillow's own decompression bomb error
+    with pytest.raises(ValueError, match="exceeds 50000000 pixels"):
+        open_image(png_header_only((10_000, 6_000)), 50_000_000, 2048)
+
+
+def test_large_jpeg_is_decoded_at_reduced_scale(resized):
+    img = open_image(encoded((4000, 3000)), 50_000_000, 500)
+
+    # libjpeg's 1/4 scale is the smallest that still covers 500 px
+    assert resized == [(1000, 750)]
+    assert img.size == (500, 375)
+
+
+def test_png_is_decoded_at_full_size(resized):
+    img = open_image(encoded((1000, 750), "PNG"), 50_000_000, 500)
+
+    assert resized == [(1000, 750)]
+    assert img.size == (500, 375)
+
+
+def test_each_variant_is_resized_from_the_previous_one(resized, monkeypatch):
+    monkeypatch.setattr(image_processing, "available_modern_formats", lambda: [])
+
+    versions = process_image(encoded((4000, 3000)), 5 * 1024 * 1024, 50_000_000, 2048)
+
+    # The draft-decoded original, then medium from the original and the
+    # thumbnail from medium
+    assert resized == [(4000, 3000), (2048, 1536), (300, 225)]
+    assert {
+        name: Image.open(io.BytesIO(images["jpeg"])).size
+        for name, images in versions.items()
+    } == {"original": (2048, 1536), "medium": (300, 225), "thumbnail": (100, 75)}
@@ -0,0 +1,173 @@
+import httpx
+import pytest
+
+from app.auth.oauth_providers import (
+    GITHUB_EMAILS_URL,
+    GITHUB_TOKEN_URL,
+    GITHUB_USER_URL,
+    GOOGLE_USERINFO_URL,
+    OAuthError,
+    exchange_github_code,
+    fetch_github_userinfo,
+    fetch_google_userinfo,
+    userinfo_cache,
+)
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture(autouse=True)
+def clear_userinfo_cache():
+    userinfo_cache.clear()
+    yield
+    userinfo_cache.clear()
+
+
+class MockProvider:
+    """
+    Serves canned JSON per URL through httpx.MockTransport, recording requests.
+    """
+
+    def __init__(self, responses: dict[str, httpx.Response]):
+        self.responses = responses
+        self.requests: list[httpx.Request] = []
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append(request)
+        url = str(request.url.copy_with(query=None))
+        return self.responses.get(url, httpx.Response(404))
+
+    def client(self) -> httpx.AsyncClient:
+        return httpx.AsyncClient(transport=httpx.MockTransport(self))
+
+
+async def test_google_userinfo_is_normalized_and_cached():
+    provider = MockProvider(
+        {
+            GOOGLE_USERINFO_URL: httpx.Response(
+                200,
+                json={
+                    "sub": "123",
+                    "email": "ada@example.com",
+                    "given_name": "Ada",
+                    "family_name": "Lovelace",
+                },
+            )
+        }
+    )
+
+    async with provider.client() as client:
+        first = await fetch_google_userinfo(client, "token")
+        second = await fetch_google_userinfo(client, "token")
+
+    assert first == {
+        "social_id": "123",
+        "email": "ada@example.com",
+        "first_name": "Ada",
+        "last_name": "Lovelace",
+    }
+    assert second == first
+    [request] = provider.requests
+    assert request.headers["Authorization"] == "Bearer token"
+
+
+async def test_google_userinfo_is_cached_per_token():
+    provider = MockProvider(
+        {GOOGLE_USERINFO_URL: httpx.Response(200, json={"sub": "123"})}
+    )
+
+    async with provider.client() as client:
+        await fetch_google_userinfo(client, "token")
+        await fetch_google_userinfo(client, "other-token")
+
+    assert len(provider.requests) == 2
+
+
+async def test_google_errors_are_raised():
+    provider = MockProvider({GOOGLE_USERINFO_URL: httpx.Response(401)})
+
+    async with provider.client() as client:
+        with pytest.raises(httpx.HTTPStatusError):
+            await fetch_google_userinfo(client, "expired")
+
+
+async def test_github_code_exchange():
+    provider = MockProvider(
+        {GITHUB_TOKEN_URL: httpx.Response(200, json={"access_token": "gho_token"})}
+    )
+
+    async with provider.client() as client:
+        assert await exchange_github_code(client, "code") == "gho_token"
+
+    [request] = provider.requests
+    assert b"code=code" in request.content
+
+
+async def test_github_code_exchange_error():
+    provider = MockProvider(
+        {
+            GITHUB_TOKEN_URL: httpx.Response(
+                200,
+                json={
+                    "error": "bad_verification_code",
+                    "error_description": "The code is incorrect or expired.",
+                },
+            )
+        }
+    )
+
+    async with provider.client() as client:
+        with pytest.raises(OAuthError, match="incorrect or expired"):
+            await exchange_github_code(client, "code")
+
+
+async def test_github_userinfo_falls_back_to_primary_verified_email():
+    provider = MockProvider(
+        {
+            GITHUB_USER_URL: httpx.Response(
+                200, json={"id": 42, "login": "ada", "name": None, "email": None}
+            ),
+            GITHUB_EMAILS_URL: httpx.Response(
+                200,
+                json=[
+                    {"email": "old@example.com", "primary": False, "verified": True},
+                    {"email": "new@example.com", "primary": True, "verified": False},
+                    {"email": "ada@example.com", "primary": True, "verified": True},
+                ],
+            ),
+        }
+    )
+
+    async with provider.client() as client:
+        user_info = await fetch_github_userinfo(client, "token")
+
+    assert user_info == {
+        "social_id": "42",
+        "email": "ada@example.com",
+        "first_name": "ada",
+        "last_name": "",
+    }
+
+
+async def test_github_userinfo_with_profile_email_skips_emails_request():
+    provider = MockProvider(
+        {
+            GITHUB_USER_URL: httpx.Response(
+                200,
+                json={
+                    "id": 42,
+                    "login": "ada",
+                    "name": "Ada Lovelace",
+                    "email": "ada@example.com",
+                },
+            ),
+        }
+    )
+
+    async with provider.client() as client:
+        user_info = await fetch_github_userinfo(client, "token")
+        await fetch_github_userinfo(client, "token")
+
+    assert user_info["first_name"] == "Ada"
+    assert user_info["last_name"] == "Lovelace"
+    assert [str(request.url) for request in provider.requests] == [GITHUB_USER_URL]
@@ -0,0 +1,143 @@
+import base64
+import json
+from datetime import UTC, datetime, timedelta
+
+import httpx
+import pytest
+from fastapi import FastAPI, HTTPException, Response
+from sqlalchemy import text
+
+from app.models.study_block import StudyBlock
+from app.models.user import User
+from app.routers.study_block import query_study_blocks
+from app.routers.utils import (
+    NEXT_CURSOR_HEADER,
+    PAGE_LIMIT_QUERY,
+    decode_cursor,
+    encode_cursor,
+    page_rows,
+)
+from app.schemas.study_block import StudyBlockQuery
+
+pytestmark = pytest.mark.anyio
+
+NOW = datetime(2026, 10, 18, 12, tzinfo=UTC)
+
+
+def test_cursor_round_trip():
+    cursor = encode_cursor(NOW, 42)
+
+    assert decode_cursor(cursor, datetime, int) == (NOW, 42)
+    assert decode_cursor(encode_cursor(7), int) == (7,)
+
+
+def raw_cursor(payload) -> str:
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+
+
+@pytest.mark.parametrize(
+    "cursor",
+    [
+        "not a cursor!",
+        base64.urlsafe_b64encode(b"{not json").decode(),
+        raw_cursor({"id": 1}),
+        raw_cursor([NOW.isoformat()]),
+        raw_cursor([NOW.isoformat(), 1, 2]),
+        raw_cursor(["yesterday", 1]),
+        raw_cursor([NOW.isoformat(), "one"]),
+        raw_cursor([NOW.isoformat(), None]),
+    ],
+)
+def test_malformed_cursors_are_a_400(cursor):
+    with pytest.raises(HTTPException) as exc_info:
+        decode_cursor(cursor, datetime, int)
+
+    assert exc_info.value.status_code == 400
+
+
+def test_page_rows_trims_the_lookahead_row_and_points_past_the_page():
+    response = Response()
+
+    rows = page_rows([1, 2, 3, 4], 3, response, lambda row: (row,))
+
+    assert rows == [1, 2, 3]
+    assert decode_cursor(response.headers[NEXT_CURSOR_HEADER], int) == (3,)
+
+
+def test_last_page_has_no_next_cursor():
+    response = Response()
+
+    assert page_rows([1, 2, 3], 3, response, lambda row: (row,)) == [1, 2, 3]
+    assert NEXT_CURSOR_HEADER not in response.headers
+
+
+@pytest.mark.parametrize(
+    "limit, status_code", [(0, 422), (1, 200), (1000, 200), (1001, 422)]
+)
+async def test_page_limit_is_validated(limit, status_code):
+    app = FastAPI()
+
+    @app.get("/items")
+    async def items(limit: int = PAGE_LIMIT_QUERY):
+        return limit
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        assert (await client.get(f"/items?limit={limit}")).status_code == status_code
+
+
+@pytest.fixture
+async def user(db):
+    user = User(username="page-test", email="page-test@example.com")
+    db.add(user)
+    await db.commit()
+    await db.execute(
+        text(
+            "INSERT INTO studyblock (user_id, start_time, end_time, is_countdown) "
+            "SELECT :user_id, start_time, start_time + interval '40 minutes', true "
+            "FROM generate_series(1, 30) AS n, "
+            "LATERAL (SELECT CAST(:now AS timestamptz) - n * interval '1 hour') "
+            "AS block(start_time)"
+        ),
+        {"user_id": user.id, "now": NOW},
+    )
+    await db.commit()
+    return user
+
+
+async def page(db, user: User, **query) -> tuple[list[int], str | None]:
+    response = Response()
+    rows = await query_study_blocks(
+        response, StudyBlockQuery(limit=10, **query), db, user.id
+    )
+    return [block.id for block in rows], response.headers.get(NEXT_CURSOR_HEADER)
+
+
+async def add_newer_block(db, user: User) -> None:
+    db.add(
+        StudyBlock(
+            user_id=user.id, start_time=NOW, end_time=NOW + timedelta(minutes=30)
+        )
+    )
+    await db.commit()
+
+
+async def test_cursor_pages_are_stable_under_inserts(db, user):
+    first, cursor = await page(db, user)
+    await add_newer_block(db, user)
+
+    second, _ = await page(db, user, cursor=cursor)
+
+    assert len(second) == 10
+    assert not set(first) & set(second)
+
+
+async def test_offset_pages_shift_under_inserts(db, user):
+    # What the cursor avoids: the insert pushes the first page's last block
+    # onto the second page
+    first, _ = await page(db, user)
+    await add_newer_block(db, user)
+
+    second, _ = await page(db, user, skip=10)
+
+    assert set(first) & set(second) == {first[-1]}
@@ -0,0 +1,123 @@
+import asyncio
+import threading
+import time
+
+import pytest
+from fastapi import HTTPException
+
+from app import metrics
+from app.auth.auth_utils import _run_password_job, hash_password, verify_password
+from app.config import settings
+
+pytestmark = pytest.mark.anyio
+
+MAX_PENDING = 6
+
+
+class BlockingJob:
+    """
+    A password job that holds its worker thread until released, recording
+    how many ran at once.
+    """
+
+    def __init__(self):
+        self.release = threading.Event()
+        self._lock = threading.Lock()
+        self.running = 0
+        self.max_running = 0
+
+    def __call__(self):
+        with self._lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        try:
+            self.release.wait(timeout=10)
+        finally:
+            with self._lock:
+                self.running -= 1
+        return "done"
+
+
+@pytest.fixture
+def max_pending(monkeypatch):
+    monkeypatch.setattr(settings, "PASSWORD_HASH_MAX_PENDING", MAX_PENDING)
+    return MAX_PENDING
+
+
+async def wait_for(condition) -> None:
+    for _ in range(200):
+        if condition():
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError("condition never became true")
+
+
+async def test_saturated_executor_sheds_load(max_pending):
+    job = BlockingJob()
+    rejected = metrics.snapshot().get("password_hash.rejected", 0)
+    tasks = [asyncio.create_task(_run_password_job(job)) for _ in range(MAX_PENDING)]
+    try:
+        await wait_for(lambda: job.running == settings.PASSWORD_HASH_WORKERS)
+        gauges = metrics.snapshot()
+        assert gauges["password_hash.pending"] == MAX_PENDING
+        assert (
+            gauges["password_hash.queue_depth"]
+            == MAX_PENDING - settings.PASSWORD_HASH_WORKERS
+        )
+
+        with pytest.raises(HTTPException) as exc_info:
+            await _run_password_job(job)
+        assert exc_info.value.status_code == 503
+        assert exc_info.value.headers == {"Retry-After": "1"}
+        assert metrics.snapshot()["password_hash.rejected"] == rejected + 1
+    finally:
+        job.release.set()
+        results = await asyncio.gather(*tasks)
+
+    assert results == ["done"] * MAX_PENDING
+    # Queued jobs waited for a worker instead of starting threads of their own
+    assert job.max_running == settings.PASSWORD_HASH_WORKERS
+    gauges = metrics.snapshot()
+    assert gauges["password_hash.pending"] == gauges["password_hash.queue_depth"] == 0
+
+
+async def test_pending_count_is_released_when_a_job_fails(max_pending):
+    def failing():
+        raise ValueError("bad hash")
+
+    for _ in range(MAX_PENDING + 1):
+        with pytest.raises(ValueError):
+            await _run_password_job(failing)
+
+    assert metrics.snapshot()["password_hash.pending"] == 0
+
+
+async def test_hashing_keeps_the_event_loop_responsive():
+    hashed = await hash_password("correct horse")
+    started = time.monotonic()
+    await verify_password("correct horse", hashed)
+    single = time.monotonic() - started
+
+    lag = 0.0
+
+    async def ticker():
+        nonlocal lag
+        while True:
+            before = time.monotonic()
+            await asyncio.sleep(0.005)
+            lag = max(lag, time.monotonic() - before - 0.005)
+
+    ticking = asyncio.create_task(ticker())
+    await asyncio.sleep(0.01)
+    try:
+        results = await asyncio.gather(
+            *(verify_password("correct horse", hashed) for _ in range(8))
+        )
+        # Let the ticker see any stall that ran up to the end
+        await asyncio.sleep(0.01)
+    finally:
+        ticking.cancel()
+
+    assert all(results)
+    # Hashing on the loop would stall it for a whole verify at a time
+    assert lag < single / 2
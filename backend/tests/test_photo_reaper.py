@@ -0,0 +1,208 @@
+from datetime import datetime, timedelta
+
+import boto3
+import pytest
+from moto import mock_aws
+
+from app.config import settings
+from app.models.user import User
+from app.uploads import photo_reaper, upload_utils
+from app.uploads.photo_reaper import reap_orphaned_photos
+
+pytestmark = pytest.mark.anyio
+
+LIVE_KEY = "live.jpg"
+ORPHAN_KEY = "orphan.jpg"
+
+
+class RecordingS3Client:
+    """
+    Wraps a boto3 client, recording the keys of each DeleteObjects call.
+    """
+
+    def __init__(self, client):
+        self._client = client
+        self.deletes: list[list[str]] = []
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+    def delete_objects(self, **params):
+        self.deletes.append([obj["Key"] for obj in params["Delete"]["Objects"]])
+        return self._client.delete_objects(**params)
+
+
+class Clock(datetime):
+    """
+    Stands in for `datetime` in the reaper, running `offset` ahead of now.
+    """
+
+    offset = timedelta()
+
+    @classmethod
+    def now(cls, tz=None):
+        return datetime.now(tz) + cls.offset
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    with mock_aws():
+        client = boto3.client("s3", region_name="us-east-1")
+        client.create_bucket(Bucket=settings.AWS_S3_BUCKET_NAME)
+        recording = RecordingS3Client(client)
+        monkeypatch.setattr(upload_utils, "s3_client", recording)
+        yield recording
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    # Past the minimum age of everything uploaded during the test
+    monkeypatch.setattr(Clock, "offset", timedelta(days=2))
+    monkeypatch.setattr(photo_reaper, "datetime", Clock)
+    return Clock
+
+
+@pytest.fixture
+async def user(db):
+    user = User(username="reaper-test", email="reaper-test@example.com")
+    db.add(user)
+    await db.commit()
+    return user
+
+
+def put(s3, key: str) -> None:
+    s3.put_object(Bucket=settings.AWS_S3_BUCKET_NAME, Key=key, Body=b"x" * 10)
+
+
+def put_photo(s3, profile_photo_key: str) -> set[str]:
+    base = profile_photo_key.rpartition(".")[0]
+    keys = {
+        f"original_{profile_photo_key}",
+        f"medium_{profile_photo_key}",
+        f"medium_{base}.webp",
+        f"thumbnail_{profile_photo_key}",
+        f"thumbnail_{base}.webp",
+    }
+    for key in keys:
+        put(s3, key)
+    return keys
+
+
+def stored_keys(s3) -> set[str]:
+    response = s3.list_objects_v2(Bucket=settings.AWS_S3_BUCKET_NAME)
+    return {obj["Key"] for obj in response.get("Contents", [])}
+
+
+@pytest.fixture
+async def photos(db, s3, user):
+    """
+    A live photo, an orphaned one, a stale staged upload and an object the
+    reaper doesn't recognise.
+    """
+    user.profile_photo_key = LIVE_KEY
+    await db.commit()
+    live = put_photo(s3, LIVE_KEY)
+    orphans = put_photo(s3, ORPHAN_KEY) | {"uploads/abandoned"}
+    put(s3, "uploads/abandoned")
+    put(s3, "unrelated.txt")
+    return live | {"unrelated.txt"}, orphans
+
+
+async def test_orphans_are_deleted_originals_first(db, s3, clock, photos):
+    kept, orphans = photos
+
+    stats = await reap_orphaned_photos(db)
+
+    assert stored_keys(s3) == kept
+    assert s3.deletes[0] == [f"original_{ORPHAN_KEY}"]
+    assert set(s3.deletes[1]) == orphans - {f"original_{ORPHAN_KEY}"}
+    assert stats.orphaned == stats.deleted == len(orphans)
+    assert stats.errors == stats.skipped == 0
+
+
+async def test_originals_deleted_in_an_earlier_batch_are_not_counted_again(
+    db, s3, clock, photos, monkeypatch
+):
+    kept, orphans = photos
+    # `medium_` sorts ahead of `original_`, so its batch deletes the original
+    # before the listing reaches it
+    monkeypatch.setattr(photo_reaper, "DELETE_BATCH_SIZE", 1)
+
+    stats = await reap_orphaned_photos(db)
+
+    assert stored_keys(s3) == kept
+    deleted = [key for keys in s3.deletes for key in keys]
+    assert deleted.count(f"original_{ORPHAN_KEY}") == 1
+    assert deleted.index(f"original_{ORPHAN_KEY}") < deleted.index(
+        f"thumbnail_{ORPHAN_KEY}"
+    )
+    assert stats.orphaned == stats.deleted == len(orphans)
+
+
+async def test_dry_run_only_counts_orphans(db, s3, clock, photos):
+    kept, orphans = photos
+
+    stats = await reap_orphaned_photos(db, dry_run=True)
+
+    assert stored_keys(s3) == kept | orphans
+    assert s3.deletes == []
+    assert stats.orphaned == len(orphans)
+    assert stats.orphaned_bytes == 10 * len(orphans)
+    assert stats.deleted == 0
+
+
+async def test_recent_orphans_are_left_alone(db, s3, photos):
+    kept, orphans = photos
+
+    stats = await reap_orphaned_photos(db)
+
+    assert stored_keys(s3) == kept | orphans
+    assert stats.orphaned == 0
+
+
+async def test_photo_whose_original_was_rewritten_is_left_alone(
+    db, s3, clock, photos, monkeypatch
+):
+    kept, orphans = photos
+    delete_batch = photo_reaper._delete_batch
+
+    async def reupload_first(*args):
+        # The same photo is uploaded again after the listing
+        clock.offset = timedelta()
+        put(s3, f"original_{ORPHAN_KEY}")
+        await delete_batch(*args)
+
+    monkeypatch.setattr(photo_reaper, "_delete_batch", reupload_first)
+
+    stats = await reap_orphaned_photos(db)
+
+    assert stored_keys(s3) == kept | orphans - {"uploads/abandoned"}
+    assert stats.skipped == len(orphans) - 1
+    assert stats.deleted == 1
+
+
+async def test_photo_relinked_during_the_listing_is_left_alone(
+    db, s3, clock, photos, monkeypatch
+):
+    kept, orphans = photos
+    delete_batch = photo_reaper._delete_batch
+
+    async def relink_first(*args):
+        # A duplicate upload points another user at the orphaned photo
+        db.add(
+            User(
+                username="reaper-test-2",
+                email="reaper-test-2@example.com",
+                profile_photo_key=ORPHAN_KEY,
+            )
+        )
+        await db.commit()
+        await delete_batch(*args)
+
+    monkeypatch.setattr(photo_reaper, "_delete_batch", relink_first)
+
+    stats = await reap_orphaned_photos(db)
+
+    assert stored_keys(s3) == kept | orphans - {"uploads/abandoned"}
+    assert s3.deletes == [["uploads/abandoned"]]
+    assert stats.deleted == 1
@@ -0,0 +1,174 @@
+import time
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+from fastapi import Response
+from sqlalchemy import text
+
+from app import cache
+from app.config import settings
+from app.routers.user import parse_photo_formats, read_users, with_photo_formats
+from app.uploads import upload_services
+from app.uploads.upload_services import (
+    choose_photo_format,
+    get_profile_photo_urls,
+    invalidate_profile_photo_urls,
+    photo_url_cache,
+)
+
+pytestmark = pytest.mark.anyio
+
+PHOTO_KEY = "photos/abc.jpg"
+
+
+@pytest.fixture(autouse=True)
+def clear_photo_url_cache():
+    photo_url_cache.clear()
+    yield
+    photo_url_cache.clear()
+
+
+@pytest.fixture
+def signed(monkeypatch):
+    """
+    Record the object name of every URL signed.
+    """
+    file_names = []
+    get_presigned_url_for_image = upload_services.get_presigned_url_for_image
+
+    def recorded(file_name, *args, **kwargs):
+        file_names.append(file_name)
+        return get_presigned_url_for_image(file_name, *args, **kwargs)
+
+    monkeypatch.setattr(upload_services, "get_presigned_url_for_image", recorded)
+    return file_names
+
+
+class Clock:
+    """
+    Stands in for `time` in app.cache, running `offset` seconds ahead.
+    """
+
+    offset = 0.0
+
+    @classmethod
+    def monotonic(cls) -> float:
+        return time.monotonic() + cls.offset
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    monkeypatch.setattr(Clock, "offset", 0.0)
+    monkeypatch.setattr(cache, "time", Clock)
+    return Clock
+
+
+def expires_in(url: str) -> int:
+    return int(parse_qs(urlparse(url).query)["X-Amz-Expires"][0])
+
+
+async def test_urls_are_signed_once_and_reused(signed):
+    first = await get_profile_photo_urls(PHOTO_KEY)
+    second = await get_profile_photo_urls(PHOTO_KEY)
+
+    assert second == first
+    assert signed == [
+        "original_" + PHOTO_KEY,
+        "medium_" + PHOTO_KEY,
+        "thumbnail_" + PHOTO_KEY,
+    ]
+    assert {expires_in(url) for url in first.values()} == {
+        settings.PRESIGNED_URL_EXPIRY
+    }
+
+
+async def test_urls_are_resigned_near_expiry(signed, clock):
+    first = await get_profile_photo_urls(PHOTO_KEY)
+    reuse_for = settings.PRESIGNED_URL_EXPIRY - settings.PRESIGNED_URL_REFRESH_MARGIN
+
+    clock.offset = reuse_for - 1
+    assert await get_profile_photo_urls(PHOTO_KEY) == first
+    assert len(signed) == 3
+
+    clock.offset = reuse_for + 1
+    await get_profile_photo_urls(PHOTO_KEY)
+    assert len(signed) == 6
+
+
+async def test_invalidation_evicts_every_format(signed, redis):
+    await get_profile_photo_urls(PHOTO_KEY)
+    await get_profile_photo_urls(PHOTO_KEY, "webp", ["webp"])
+
+    await invalidate_profile_photo_urls(redis, PHOTO_KEY)
+    await get_profile_photo_urls(PHOTO_KEY)
+    await get_profile_photo_urls(PHOTO_KEY, "webp", ["webp"])
+
+    assert len(signed) == 12
+
+
+async def test_user_list_pages_reuse_signed_urls(db, signed):
+    await db.execute(
+        text(
+            'INSERT INTO "user" (username, email, timezone, is_active, '
+            "is_email_verified, created_at, profile_photo_key) "
+            "SELECT 'url-test-' || n, 'url-test-' || n || '@example.com', "
+            "'UTC', true, false, now(), 'photos/url-test-' || n || '.jpg' "
+            "FROM generate_series(1, 100) AS n"
+        )
+    )
+    await db.commit()
+
+    first = await read_users(Response(), 0, 100, None, None, db)
+    signed_first = len(signed)
+    second = await read_users(Response(), 0, 100, None, None, db)
+
+    assert signed_first == 3 * sum(1 for user in first if user["profile_photo_key"])
+    assert len(signed) == signed_first
+    assert [user["profile_photo_urls"] for user in second] == [
+        user["profile_photo_urls"] for user in first
+    ]
+
+
+@pytest.mark.parametrize(
+    "stored, accepted, chosen",
+    [
+        ("avif,webp", ["webp", "avif"], "avif"),
+        ("avif,webp", ["webp"], "webp"),
+        ("webp", ["avif", "webp"], "webp"),
+        ("webp", ["avif"], "jpeg"),
+        ("avif,webp", [], "jpeg"),
+        (None, ["avif", "webp"], "jpeg"),
+    ],
+)
+def test_smallest_stored_format_the_client_accepts_is_chosen(stored, accepted, chosen):
+    assert choose_photo_format(stored, accepted) == chosen
+
+
+def test_photo_formats_parameter_is_normalized():
+    assert parse_photo_formats(" WebP , AVIF") == ["webp", "avif"]
+    assert parse_photo_formats(None) == []
+
+
+async def test_resized_variants_use_the_chosen_format():
+    urls = await get_profile_photo_urls(PHOTO_KEY, "webp", ["webp"])
+
+    paths = {size: urlparse(url).path for size, url in urls.items()}
+    # The original is only stored as JPEG
+    assert paths["original"].endswith("/original_photos/abc.jpg")
+    assert paths["medium"].endswith("/medium_photos/abc.webp")
+    assert paths["thumbnail"].endswith("/thumbnail_photos/abc.webp")
+
+
+async def test_cached_snapshot_urls_are_swapped_for_the_accepted_format():
+    snapshot = {
+        "profile_photo_key": PHOTO_KEY,
+        "profile_photo_formats": "webp",
+        "profile_photo_urls": await get_profile_photo_urls(PHOTO_KEY),
+    }
+
+    assert await with_photo_formats(snapshot, None) is snapshot
+    negotiated = await with_photo_formats(snapshot, "avif,webp")
+    assert urlparse(negotiated["profile_photo_urls"]["thumbnail"]).path.endswith(
+        ".webp"
+    )
+    assert snapshot["profile_photo_urls"]["thumbnail"].split("?")[0].endswith(".jpg")
@@ -0,0 +1,131 @@
+import pytest
+from redis.exceptions import ConnectionError
+from starlette.requests import Request
+
+from app import rate_limit
+from app.rate_limit import POLICIES, RateLimiter, RateLimitPolicy
+
+pytestmark = pytest.mark.anyio
+
+# Start of a window, so elapsed time within it is easy to reason about
+WINDOW_START = 1_800_000_000.0
+
+
+def make_request(path: str, method: str = "GET", ip: str = "10.0.0.1") -> Request:
+    return Request(
+        {
+            "type": "http",
+            "method": method,
+            "path": path,
+            "query_string": b"",
+            "headers": [(b"x-real-ip", ip.encode())],
+            "client": ("172.18.0.5", 4321),
+        }
+    )
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [WINDOW_START]
+    monkeypatch.setattr(rate_limit.time, "time", lambda: now[0])
+    return now
+
+
+@pytest.fixture
+def limiter(redis):
+    return RateLimiter(redis, [RateLimitPolicy("test", "/", 5, 60, "user")])
+
+
+async def test_allows_requests_up_to_the_limit(limiter, clock):
+    request = make_request("/users/me")
+
+    results = [await limiter.check(request, 1) for _ in range(6)]
+
+    assert results[:5] == [None] * 5
+    assert results[5] == 60
+
+
+async def test_users_and_ips_are_counted_separately(limiter, clock):
+    for _ in range(5):
+        await limiter.check(make_request("/users/me"), 1)
+
+    assert await limiter.check(make_request("/users/me"), 1) is not None
+    assert await limiter.check(make_request("/users/me"), 2) is None
+    assert await limiter.check(make_request("/users/me"), None) is None
+
+
+async def test_previous_window_is_weighted_by_its_overlap(limiter, clock):
+    for _ in range(5):
+        await limiter.check(make_request("/users/me"), 1)
+
+    # Half of the previous window still overlaps, counting as 2.5 requests
+    clock[0] += 90
+    results = [await limiter.check(make_request("/users/me"), 1) for _ in range(3)]
+
+    assert results[:2] == [None, None]
+    # The next request fits once the overlap drops to 2 requests, 6s later
+    assert results[2] == 6
+
+
+async def test_counts_reset_after_two_windows(limiter, clock):
+    for _ in range(6):
+        await limiter.check(make_request("/users/me"), 1)
+
+    clock[0] += 120
+
+    assert await limiter.check(make_request("/users/me"), 1) is None
+
+
+async def test_fails_open_when_redis_is_unreachable(limiter, monkeypatch):
+    async def unreachable(*args, **kwargs):
+        raise ConnectionError("Redis is down")
+
+    monkeypatch.setattr(limiter, "_sliding_window", unreachable)
+
+    assert await limiter.check(make_request("/users/me"), 1) is None
+
+
+@pytest.mark.parametrize(
+    "method, path, expected",
+    [
+        ("POST", "/auth/login", "login"),
+        ("GET", "/auth/login", "auth"),
+        ("POST", "/auth/register", "register"),
+        ("GET", "/auth/validate-session", "session-check"),
+        ("POST", "/study-blocks/query", "study-block-query"),
+        ("GET", "/upload/profile-photo-jobs/abc", "upload-status"),
+        ("POST", "/upload/upload-profile-photo", "upload"),
+        ("GET", "/users/me", "api"),
+    ],
+)
+async def test_policy_matching(redis, method, path, expected):
+    policy = RateLimiter(redis).get_policy(make_request(path, method))
+
+    assert policy.name == expected
+
+
+async def test_session_checks_behind_one_proxy_ip_are_keyed_by_user(redis, clock):
+    limiter = RateLimiter(redis, POLICIES)
+
+    results = [
+        await limiter.check(make_request("/auth/validate-session"), user_id)
+        for user_id in range(200)
+    ]
+
+    assert results == [None] * 200
+
+
+async def test_logins_are_keyed_by_ip(redis, clock):
+    limiter = RateLimiter(redis, POLICIES)
+
+    results = [
+        await limiter.check(make_request("/auth/login", "POST"), None)
+        for _ in range(11)
+    ]
+
+    assert results[:10] == [None] * 10
+    assert results[10] is not None
+    assert (
+        await limiter.check(make_request("/auth/login", "POST", "10.0.0.2"), None)
+        is None
+    )
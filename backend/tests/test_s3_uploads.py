@@ -0,0 +1,188 @@
+import asyncio
+import io
+import threading
+import time
+
+import boto3
+import pytest
+from fastapi import HTTPException
+from moto import mock_aws
+from PIL import Image, UnidentifiedImageError
+
+from app import metrics
+from app.config import settings
+from app.uploads import upload_utils
+from app.uploads.image_processing import process_image
+from app.uploads.upload_services import (
+    MAX_IMAGE_SIZE,
+    PHOTO_FORMAT_PREFERENCE,
+    process_and_upload_image,
+    variant_file_name,
+)
+
+pytestmark = pytest.mark.anyio
+
+
+class RecordingS3Client:
+    """
+    Wraps a boto3 client, recording the order of `put_object` calls and how
+    many of them ran at once.
+    """
+
+    def __init__(self, client, put_delay: float = 0.05):
+        self._client = client
+        self._put_delay = put_delay
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self.max_in_flight = 0
+        self.puts: list[tuple[str, float, float]] = []
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+    def put_object(self, **params):
+        started = time.monotonic()
+        with self._lock:
+            self._in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self._in_flight)
+        try:
+            time.sleep(self._put_delay)
+            return self._client.put_object(**params)
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+                self.puts.append((params["Key"], started, time.monotonic()))
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    with mock_aws():
+        client = boto3.client("s3", region_name="us-east-1")
+        client.create_bucket(Bucket=settings.AWS_S3_BUCKET_NAME)
+        recording = RecordingS3Client(client)
+        monkeypatch.setattr(upload_utils, "s3_client", recording)
+        yield recording
+
+
+def png_bytes(color: str = "red", size: tuple[int, int] = (640, 480)) -> bytes:
+    output = io.BytesIO()
+    Image.new("RGB", size, color).save(output, format="PNG")
+    return output.getvalue()
+
+
+def stored_keys(s3) -> set[str]:
+    response = s3.list_objects_v2(Bucket=settings.AWS_S3_BUCKET_NAME)
+    return {obj["Key"] for obj in response.get("Contents", [])}
+
+
+async def test_variants_are_uploaded_concurrently_and_the_original_last(s3):
+    photo = await process_and_upload_image(png_bytes())
+
+    original = variant_file_name(photo.key, "original")
+    formats = ["jpeg", *(photo.formats.split(",") if photo.formats else [])]
+    variants = {
+        variant_file_name(photo.key, size, image_format)
+        for size in ("medium", "thumbnail")
+        for image_format in formats
+    }
+    assert stored_keys(s3) == variants | {original}
+    assert s3.max_in_flight > 1
+
+    *variant_puts, (last_key, original_started, _) = s3.puts
+    assert last_key == original
+    assert all(finished <= original_started for _, _, finished in variant_puts)
+
+    head = s3.head_object(Bucket=settings.AWS_S3_BUCKET_NAME, Key=original)
+    assert head["ContentType"] == "image/jpeg"
+    assert head["Metadata"] == {"formats": photo.formats or ""}
+    assert set(formats) <= set(PHOTO_FORMAT_PREFERENCE)
+
+
+async def test_stored_photos_are_deduplicated_by_content(s3):
+    data = png_bytes("blue")
+    first = await process_and_upload_image(data)
+    puts = len(s3.puts)
+    deduplicated = metrics.snapshot().get("image_process.deduplicated", 0)
+
+    second = await process_and_upload_image(data)
+
+    assert second == first
+    assert len(s3.puts) == puts
+    assert metrics.snapshot()["image_process.deduplicated"] == deduplicated + 1
+
+
+async def test_a_partial_set_without_its_original_is_processed_again(s3):
+    data = png_bytes("green")
+    photo = await process_and_upload_image(data)
+    s3.delete_object(
+        Bucket=settings.AWS_S3_BUCKET_NAME, Key=variant_file_name(photo.key, "original")
+    )
+    puts = len(s3.puts)
+
+    assert await process_and_upload_image(data) == photo
+    assert len(s3.puts) > puts
+
+
+async def test_processing_keeps_the_event_loop_responsive(s3):
+    output = io.BytesIO()
+    Image.effect_noise((2000, 1500), 80).convert("RGB").save(output, format="PNG")
+    data = output.getvalue()
+    started = time.monotonic()
+    process_image(data, MAX_IMAGE_SIZE, 50_000_000, 2048)
+    on_loop = time.monotonic() - started
+
+    lag = 0.0
+
+    async def ticker():
+        nonlocal lag
+        while True:
+            before = time.monotonic()
+            await asyncio.sleep(0.005)
+            lag = max(lag, time.monotonic() - before - 0.005)
+
+    ticking = asyncio.create_task(ticker())
+    await asyncio.sleep(0.01)
+    try:
+        await process_and_upload_image(data)
+        await asyncio.sleep(0.01)
+    finally:
+        ticking.cancel()
+
+    # Processing on the loop would stall it for the whole decode and encode
+    assert lag < on_loop / 2
+
+
+async def test_image_jobs_over_the_pending_cap_are_refused(s3, monkeypatch):
+    monkeypatch.setattr(settings, "IMAGE_PROCESS_MAX_PENDING", 0)
+
+    with pytest.raises(HTTPException) as exc_info:
+        await process_and_upload_image(png_bytes("white"))
+
+    assert exc_info.value.status_code == 503
+    assert s3.puts == []
+
+
+def put(s3, key: str, body: bytes) -> None:
+    s3.put_object(Bucket=settings.AWS_S3_BUCKET_NAME, Key=key, Body=body)
+
+
+@pytest.mark.parametrize("size", [0, 1, 1024])
+async def test_download_within_the_cap(s3, size):
+    put(s3, "uploads/photo", b"x" * size)
+
+    assert await upload_utils.download_from_s3("uploads/photo", 1024) == b"x" * size
+
+
+async def test_download_over_the_cap_is_refused(s3):
+    put(s3, "uploads/photo", b"x" * 2048)
+
+    with pytest.raises(upload_utils.S3ObjectTooLarge):
+        await upload_utils.download_from_s3("uploads/photo", 1024)
+
+
+def test_only_jpeg_and_png_are_decoded():
+    output = io.BytesIO()
+    Image.new("RGB", (10, 10)).save(output, format="GIF")
+
+    with pytest.raises(UnidentifiedImageError):
+        process_image(output.getvalue(), MAX_IMAGE_SIZE, 1_000_000, 2048)
@@ -0,0 +1,195 @@
+import time
+
+import pytest
+from redis.exceptions import ConnectionError
+
+from app.auth.session_store import (
+    SESSION_KEY_PREFIX,
+    USER_SESSIONS_KEY_PREFIX,
+    SessionStore,
+    SignedSessionStore,
+    session_cache,
+)
+
+pytestmark = pytest.mark.anyio
+
+EXPIRY = 1000
+REFRESH_WINDOW = 100
+
+
+@pytest.fixture(autouse=True)
+def clear_session_cache():
+    session_cache.clear()
+    yield
+    session_cache.clear()
+
+
+@pytest.fixture
+def store(redis):
+    return SessionStore(redis, expiry=EXPIRY, refresh_window=REFRESH_WINDOW)
+
+
+@pytest.fixture
+def signed_store(redis):
+    return SignedSessionStore(
+        redis, "secret", token_ttl=60, expiry=EXPIRY, refresh_window=REFRESH_WINDOW
+    )
+
+
+async def test_create_and_lookup(store, redis):
+    session_id = await store.create(42)
+
+    lookup = await store.lookup(session_id)
+
+    assert lookup.user_id == 42
+    assert not lookup.refreshed
+    assert await redis.smembers(f"{USER_SESSIONS_KEY_PREFIX}42") == {
+        session_id.encode()
+    }
+
+
+async def test_create_drops_expired_sessions_from_the_user_index(store, redis):
+    expired = await store.create(42)
+    live = await store.create(42)
+    # As if the session key had expired, leaving its id in the index
+    await redis.delete(f"{SESSION_KEY_PREFIX}{expired}")
+
+    session_id = await store.create(42)
+
+    assert await redis.smembers(f"{USER_SESSIONS_KEY_PREFIX}42") == {
+        live.encode(),
+        session_id.encode(),
+    }
+    assert await redis.ttl(f"{USER_SESSIONS_KEY_PREFIX}42") > EXPIRY - 10
+
+
+async def test_lookup_unknown_session(store):
+    assert (await store.lookup("missing")).user_id is None
+
+
+async def test_lookup_leaves_ttl_alone_outside_refresh_window(store, redis):
+    session_id = await store.create(42)
+    await redis.expire(f"{SESSION_KEY_PREFIX}{session_id}", EXPIRY - 10)
+
+    lookup = await store.lookup(session_id)
+
+    assert not lookup.refreshed
+    assert await redis.ttl(f"{SESSION_KEY_PREFIX}{session_id}") <= EXPIRY - 10
+
+
+async def test_lookup_extends_ttl_inside_refresh_window(store, redis):
+    session_id = await store.create(42)
+    await redis.expire(f"{SESSION_KEY_PREFIX}{session_id}", REFRESH_WINDOW - 10)
+    await redis.expire(f"{USER_SESSIONS_KEY_PREFIX}42", REFRESH_WINDOW - 10)
+
+    lookup = await store.lookup(session_id)
+
+    assert lookup.refreshed
+    assert await redis.ttl(f"{SESSION_KEY_PREFIX}{session_id}") > REFRESH_WINDOW
+    assert await redis.ttl(f"{USER_SESSIONS_KEY_PREFIX}42") > REFRESH_WINDOW
+
+
+async def test_lookup_is_served_from_cache(store, redis):
+    session_id = await store.create(42)
+    await store.lookup(session_id)
+    await redis.delete(f"{SESSION_KEY_PREFIX}{session_id}")
+
+    assert (await store.lookup(session_id)).user_id == 42
+
+
+async def test_delete(store, redis):
+    session_id = await store.create(42)
+    await store.lookup(session_id)
+
+    await store.delete(session_id)
+
+    assert (await store.lookup(session_id)).user_id is None
+    assert not await redis.smembers(f"{USER_SESSIONS_KEY_PREFIX}42")
+
+
+async def test_delete_all_for_user(store, redis):
+    session_ids = {await store.create(42) for _ in range(3)}
+    other_session_id = await store.create(7)
+
+    deleted = await store.delete_all_for_user(42)
+
+    assert set(deleted) == session_ids
+    for session_id in session_ids:
+        assert (await store.lookup(session_id)).user_id is None
+    assert (await store.lookup(other_session_id)).user_id == 7
+    assert not await redis.exists(f"{USER_SESSIONS_KEY_PREFIX}42")
+
+
+async def test_signed_token_is_verified_without_redis(signed_store, redis):
+    token = await signed_store.create(42)
+    await redis.flushall()
+
+    lookup = await signed_store.lookup(token)
+
+    assert lookup.user_id == 42
+    assert not lookup.refreshed
+
+
+@pytest.mark.parametrize(
+    "tamper",
+    [
+        lambda token: token[:-2] + ("AA" if token[-2:] != "AA" else "BB"),
+        lambda token: "v0" + token[2:],
+        lambda token: token.rsplit(".", 1)[0],
+        # compare_digest refuses non-ASCII str arguments
+        lambda token: token.rsplit(".", 1)[0] + ".é",
+    ],
+)
+async def test_signed_store_rejects_tampered_tokens(signed_store, tamper):
+    token = await signed_store.create(42)
+
+    assert (await signed_store.lookup(tamper(token))).user_id is None
+
+
+async def test_signed_token_is_reissued_after_half_its_lifetime(
+    signed_store, monkeypatch
+):
+    token = await signed_store.create(42)
+    monkeypatch.setattr(time, "time", lambda now=time.time(): now + 40)
+
+    lookup = await signed_store.lookup(token)
+
+    assert lookup.user_id == 42
+    assert lookup.refreshed
+    assert lookup.session_id != token
+    assert (await signed_store.lookup(lookup.session_id)).user_id == 42
+
+
+async def test_signed_token_survives_redis_outage_until_expiry(
+    signed_store, monkeypatch
+):
+    token = await signed_store.create(42)
+
+    async def unreachable(*args, **kwargs):
+        raise ConnectionError("Redis is down")
+
+    monkeypatch.setattr(signed_store, "_lookup", unreachable)
+    started = time.time()
+    monkeypatch.setattr(time, "time", lambda: started + 40)
+    assert (await signed_store.lookup(token)).user_id == 42
+
+    monkeypatch.setattr(time, "time", lambda: started + 70)
+    assert (await signed_store.lookup(token)).user_id is None
+
+
+async def test_signed_token_is_revoked_on_logout(signed_store):
+    token = await signed_store.create(42)
+
+    await signed_store.delete(token)
+
+    assert (await signed_store.lookup(token)).user_id is None
+
+
+async def test_revocations_are_loaded_from_redis(signed_store, redis):
+    token = await signed_store.create(42)
+    other_worker = SignedSessionStore(redis, "secret", token_ttl=60)
+    await other_worker.delete(token)
+
+    await signed_store.load_revocations()
+
+    assert (await signed_store.lookup(token)).user_id is None
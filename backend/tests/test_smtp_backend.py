@@ -0,0 +1,165 @@
+import asyncio
+import socket
+
+import aiosmtplib
+import pytest
+from aiosmtpd.controller import Controller
+
+from app import metrics
+from app.email import backends
+from app.email.backends import EmailMessage, SMTPBackend
+from app.email.email_outbox import EmailOutboxWorker, enqueue_email
+
+pytestmark = pytest.mark.anyio
+
+
+REFUSED_EMAIL = "refused@example.com"
+
+
+class RecordingHandler:
+    def __init__(self):
+        self.messages = []
+
+    async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+        if address == REFUSED_EMAIL:
+            return "550 No such user"
+        envelope.rcpt_tos.append(address)
+        return "250 OK"
+
+    async def handle_DATA(self, server, session, envelope):
+        self.messages.append(envelope)
+        return "250 OK"
+
+
+class SMTPServer:
+    """
+    A local aiosmtpd server that can be restarted on the same port.
+    """
+
+    hostname = "127.0.0.1"
+
+    def __init__(self, handler: RecordingHandler):
+        self.handler = handler
+        with socket.socket() as sock:
+            sock.bind((self.hostname, 0))
+            self.port = sock.getsockname()[1]
+        self.start()
+
+    def start(self) -> None:
+        self.controller = Controller(
+            self.handler, hostname=self.hostname, port=self.port
+        )
+        self.controller.start()
+
+    def stop(self) -> None:
+        self.controller.stop()
+
+    def restart(self) -> None:
+        self.stop()
+        self.start()
+
+
+@pytest.fixture
+def handler():
+    return RecordingHandler()
+
+
+@pytest.fixture
+def smtp_server(handler):
+    server = SMTPServer(handler)
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+async def backend(smtp_server):
+    backend = SMTPBackend(
+        smtp_server.hostname, smtp_server.port, start_tls=False, pool_size=2
+    )
+    yield backend
+    await backend.close()
+
+
+def connections_opened() -> float:
+    return metrics.snapshot().get("email.smtp.connections_opened", 0)
+
+
+def message(n: int, to_email: str | None = None) -> EmailMessage:
+    return EmailMessage(
+        to_email=to_email or f"user{n}@example.com",
+        subject=f"Message {n}",
+        html_content="<p>Hello</p>",
+    )
+
+
+async def test_sends_reuse_a_pooled_connection(backend, handler):
+    opened = connections_opened()
+
+    for n in range(3):
+        await backend.deliver(message(n))
+
+    assert [envelope.rcpt_tos for envelope in handler.messages] == [
+        [f"user{n}@example.com"] for n in range(3)
+    ]
+    assert connections_opened() - opened == 1
+
+
+async def test_stale_pooled_connection_is_replaced(
+    backend, handler, smtp_server, monkeypatch
+):
+    await backend.deliver(message(1))
+    # Restarting the server drops the pooled connection without the client
+    # noticing until it next talks to it
+    smtp_server.restart()
+    monkeypatch.setattr(backends, "SMTP_IDLE_CHECK_AFTER", 0)
+    opened = connections_opened()
+
+    await backend.deliver(message(2))
+
+    assert len(handler.messages) == 2
+    assert connections_opened() - opened == 1
+
+
+async def test_batch_is_spread_over_the_pool(backend, handler):
+    opened = connections_opened()
+
+    errors = await backend.deliver_many([message(n) for n in range(6)])
+
+    assert errors == [None] * 6
+    assert len(handler.messages) == 6
+    # One connection per pool slot, each sending its chunk back to back
+    assert connections_opened() - opened == 2
+
+
+async def test_refused_message_fails_alone_in_its_batch(backend, handler):
+    messages = [message(1), message(2, REFUSED_EMAIL), message(3)]
+
+    first, refused, last = await backend.deliver_many(messages)
+
+    assert first is None and last is None
+    assert isinstance(refused, aiosmtplib.SMTPRecipientsRefused)
+    assert [envelope.rcpt_tos for envelope in handler.messages] == [
+        ["user1@example.com"],
+        ["user3@example.com"],
+    ]
+
+
+async def test_outbox_worker_sends_concurrent_entries_as_one_batch(
+    backend, handler, redis
+):
+    worker = EmailOutboxWorker(redis, backend, concurrency=8, retry_base_delay=0)
+    for n in range(4):
+        await enqueue_email(redis, message(n))
+    await enqueue_email(redis, message(4, REFUSED_EMAIL))
+    batches = metrics.snapshot().get("email.smtp.batch_size.count", 0)
+
+    await worker._ensure_group()
+    await worker._poll()
+    await asyncio.wait(worker._in_flight)
+
+    assert metrics.snapshot()["email.smtp.batch_size.count"] == batches + 1
+    assert len(handler.messages) == 4
+    # Only the refused entry is retried
+    [(payload, _)] = await redis.zrange(worker.retry_key, 0, -1, withscores=True)
+    assert REFUSED_EMAIL in payload.decode()
+    assert await redis.xlen(worker.stream) == 0
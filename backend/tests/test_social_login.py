@@ -0,0 +1,101 @@
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import text
+
+from app.auth import auth_routes
+from app.auth.auth_routes import generate_unique_username, get_or_create_user
+from app.auth.auth_schemas import SocialProvider
+from app.models.user import User
+
+pytestmark = pytest.mark.anyio
+
+
+async def seed_usernames(db, base: str, count: int) -> None:
+    await db.execute(
+        text(
+            'INSERT INTO "user" (username, email, timezone, is_active, '
+            "is_email_verified, created_at) "
+            "SELECT :base || lpad(n::text, 5, '0'), "
+            "'social-test-' || n || '@example.com', 'UTC', true, false, now() "
+            "FROM generate_series(0, :count - 1) AS n"
+        ),
+        {"base": base, "count": count},
+    )
+    await db.commit()
+
+
+def count_queries(db, monkeypatch) -> list:
+    statements = []
+    execute = db.execute
+
+    async def recording_execute(statement, *args, **kwargs):
+        statements.append(statement)
+        return await execute(statement, *args, **kwargs)
+
+    monkeypatch.setattr(db, "execute", recording_execute)
+    return statements
+
+
+async def social_login(db, email: str = "new@example.com") -> User:
+    return await get_or_create_user(
+        db,
+        email=email,
+        first_name="John",
+        last_name="Smith",
+        social_provider=SocialProvider.GOOGLE,
+        social_id="google-1",
+    )
+
+
+async def test_candidates_are_checked_a_batch_per_query(db, monkeypatch):
+    # Half of the suffixes are taken, so a batch all of them taken is a
+    # one in a million event
+    await seed_usernames(db, "john", 50_000)
+    statements = count_queries(db, monkeypatch)
+
+    usernames = [await generate_unique_username(db, "John") for _ in range(20)]
+
+    assert len(statements) == 20
+    assert all(int(username.removeprefix("john")) >= 50_000 for username in usernames)
+
+
+async def test_username_taken_concurrently_is_retried(db, monkeypatch):
+    await seed_usernames(db, "john", 1)
+    candidates = iter(["john00000", "john00001"])
+
+    async def next_candidate(session, first_name):
+        return next(candidates)
+
+    monkeypatch.setattr(auth_routes, "generate_unique_username", next_candidate)
+
+    user = await social_login(db)
+
+    assert user.username == "john00001"
+    assert user.is_email_verified
+
+
+async def test_conflict_on_every_attempt_is_a_409(db, monkeypatch):
+    await seed_usernames(db, "john", 1)
+
+    async def taken(session, first_name):
+        return "john00000"
+
+    monkeypatch.setattr(auth_routes, "generate_unique_username", taken)
+
+    with pytest.raises(HTTPException) as exc_info:
+        await social_login(db)
+
+    assert exc_info.value.status_code == 409
+
+
+async def test_returning_user_keeps_their_username(db, monkeypatch):
+    user = User(username="johnny", email="johnny@example.com")
+    db.add(user)
+    await db.commit()
+
+    async def unexpected(session, first_name):
+        raise AssertionError("no username is needed for an existing user")
+
+    monkeypatch.setattr(auth_routes, "generate_unique_username", unexpected)
+
+    assert (await social_login(db, email="johnny@example.com")).username == "johnny"
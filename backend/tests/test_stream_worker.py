@@ -0,0 +1,142 @@
+import asyncio
+
+import pytest
+from redis.exceptions import ConnectionError
+
+from app import stream_worker
+from app.stream_worker import RedisStreamWorker, enqueue
+
+pytestmark = pytest.mark.anyio
+
+
+class RecordingWorker(RedisStreamWorker):
+    queue = "test_jobs"
+
+    def __init__(self, redis, failures: int = 0, **kwargs):
+        super().__init__(redis, concurrency=2, **kwargs)
+        self.failures = failures
+        self.handled: list[dict[str, str]] = []
+        self.dead_lettered: list[tuple[dict[str, str], Exception]] = []
+
+    async def handle(self, fields: dict[str, str]) -> None:
+        self.handled.append(fields)
+        if len(self.handled) <= self.failures:
+            raise ValueError(f"attempt {len(self.handled)} failed")
+
+    async def on_dead_letter(self, fields: dict[str, str], error: Exception) -> None:
+        self.dead_lettered.append((fields, error))
+
+
+async def drain(worker: RecordingWorker, polls: int) -> None:
+    """
+    Poll `polls` times, letting each round of handlers finish, as retries are
+    only requeued by the next poll.
+    """
+    await worker._ensure_group()
+    for _ in range(polls):
+        await worker._poll()
+        if worker._in_flight:
+            await asyncio.wait(worker._in_flight)
+
+
+async def test_handles_and_acknowledges_entries(redis):
+    worker = RecordingWorker(redis)
+    await enqueue(redis, worker.queue, {"n": "1"})
+    await enqueue(redis, worker.queue, {"n": "2"})
+
+    await drain(worker, polls=1)
+
+    assert worker.handled == [{"n": "1"}, {"n": "2"}]
+    assert await redis.xlen(worker.stream) == 0
+    assert (await redis.xpending(worker.stream, worker.group))["pending"] == 0
+
+
+async def test_failed_entries_are_retried_with_backoff(redis, monkeypatch):
+    now = [stream_worker.time.time()]
+    monkeypatch.setattr(stream_worker.time, "time", lambda: now[0])
+    worker = RecordingWorker(redis, failures=2, retry_base_delay=10)
+    await enqueue(redis, worker.queue, {"n": "1"})
+
+    await drain(worker, polls=1)
+    [(_, due_at)] = await redis.zrange(worker.retry_key, 0, -1, withscores=True)
+    assert 8 <= due_at - now[0] <= 12
+
+    # Not due yet, so the next poll leaves it in the retry set
+    await drain(worker, polls=1)
+    assert len(worker.handled) == 1
+
+    for _ in range(2):
+        now[0] += 3600
+        await drain(worker, polls=1)
+
+    assert worker.handled == [{"n": "1"}] * 3
+    assert not worker.dead_lettered
+    assert await redis.zcard(worker.retry_key) == 0
+    assert await redis.xlen(worker.stream) == 0
+
+
+async def test_entries_are_dead_lettered_after_max_attempts(redis):
+    worker = RecordingWorker(redis, failures=10, max_attempts=3, retry_base_delay=0)
+    await enqueue(redis, worker.queue, {"n": "1"})
+
+    await drain(worker, polls=4)
+
+    assert len(worker.handled) == 3
+    [(fields, error)] = worker.dead_lettered
+    assert fields == {"n": "1"}
+    assert str(error) == "attempt 3 failed"
+    [(_, dead_letter)] = await redis.xrange(worker.dead_letter_stream)
+    assert dead_letter == {
+        b"n": b"1",
+        b"_attempts": b"3",
+        b"_error": b"attempt 3 failed",
+    }
+    assert await redis.zcard(worker.retry_key) == 0
+    assert await redis.xlen(worker.stream) == 0
+
+
+async def test_entries_left_pending_by_a_crashed_worker_are_reclaimed(redis):
+    crashed = RecordingWorker(redis)
+    crashed.consumer = "crashed"
+    await crashed._ensure_group()
+    await enqueue(redis, crashed.queue, {"n": "1"})
+    await redis.xreadgroup(crashed.group, crashed.consumer, {crashed.stream: ">"})
+
+    worker = RecordingWorker(redis, claim_idle_ms=0)
+    await drain(worker, polls=1)
+
+    assert worker.handled == [{"n": "1"}]
+    assert (await redis.xpending(worker.stream, worker.group))["pending"] == 0
+
+
+async def test_run_keeps_retrying_until_the_group_can_be_created(redis, monkeypatch):
+    worker = RecordingWorker(redis)
+    ensure_group = worker._ensure_group
+    attempts = 0
+
+    async def flaky_ensure_group():
+        nonlocal attempts
+        attempts += 1
+        if attempts <= 2:
+            raise ConnectionError("Redis is down")
+        await ensure_group()
+
+    sleep = asyncio.sleep
+
+    async def no_sleep(delay):
+        await sleep(0)
+
+    monkeypatch.setattr(worker, "_ensure_group", flaky_ensure_group)
+    monkeypatch.setattr(stream_worker.asyncio, "sleep", no_sleep)
+    await enqueue(redis, worker.queue, {"n": "1"})
+
+    task = asyncio.create_task(worker.run())
+    try:
+        async with asyncio.timeout(5):
+            while not worker.handled:
+                await sleep(0.01)
+    finally:
+        task.cancel()
+
+    assert attempts == 3
+    assert worker.handled == [{"n": "1"}]
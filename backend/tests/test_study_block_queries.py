@@ -0,0 +1,227 @@
+import json
+from datetime import UTC, datetime, timedelta
+
+import pytest
+from fastapi import HTTPException, Response
+from sqlalchemy import text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.exc import IntegrityError
+
+from app.models.study_block import StudyBlock
+from app.models.user import User
+from app.routers.study_block import (
+    create_study_block,
+    query_study_blocks,
+    update_study_block,
+)
+from app.schemas.study_block import (
+    StudyBlockCreate,
+    StudyBlockQuery,
+    StudyBlockUpdate,
+)
+
+pytestmark = pytest.mark.anyio
+
+NOW = datetime(2026, 10, 18, 12, tzinfo=UTC)
+BLOCKS_PER_USER = 5000
+
+
+@pytest.fixture
+async def user(db):
+    user = User(username="plan-test", email="plan-test@example.com")
+    db.add(user)
+    await db.commit()
+    return user
+
+
+async def seed_history(db, user: User, other_users: int, blocks_per_user: int):
+    """
+    Add hourly 40 minute blocks going back from NOW for the user and
+    `other_users` more, plus the user's open block, and refresh the planner
+    statistics.
+    """
+    result = await db.execute(
+        text(
+            'INSERT INTO "user" (username, email, timezone, is_active, '
+            "is_email_verified, created_at) "
+            "SELECT 'plan-test-' || n, 'plan-test-' || n || '@example.com', "
+            "'UTC', true, false, now() FROM generate_series(1, :count) AS n "
+            "RETURNING id"
+        ),
+        {"count": other_users},
+    )
+    other_ids = list(result.scalars())
+    await db.execute(
+        text(
+            "INSERT INTO studyblock (user_id, start_time, end_time, is_countdown) "
+            "SELECT user_id, start_time, start_time + interval '40 minutes', true "
+            "FROM unnest(CAST(:user_ids AS integer[])) AS user_id, "
+            "generate_series(1, :count) AS n, "
+            "LATERAL (SELECT CAST(:now AS timestamptz) - n * interval '1 hour') "
+            "AS block(start_time)"
+        ),
+        {"now": NOW, "user_ids": [user.id, *other_ids], "count": blocks_per_user},
+    )
+    db.add(StudyBlock(user_id=user.id, start_time=NOW))
+    await db.commit()
+    await db.execute(text("ANALYZE studyblock"))
+
+
+@pytest.fixture
+async def history(db, user):
+    await seed_history(db, user, other_users=3, blocks_per_user=BLOCKS_PER_USER)
+    return user
+
+
+@pytest.fixture
+async def large_history(db, user):
+    # About 2.5 million blocks across 1000 users
+    await seed_history(db, user, other_users=999, blocks_per_user=2500)
+    return user
+
+
+async def run_query(db, user_id: int, query: StudyBlockQuery):
+    """
+    Run the endpoint's query, returning its rows and the executed statement.
+    """
+    statements = []
+    execute = db.execute
+
+    async def recording_execute(statement, *args, **kwargs):
+        statements.append(statement)
+        return await execute(statement, *args, **kwargs)
+
+    db.execute = recording_execute
+    try:
+        rows = await query_study_blocks(Response(), query, db, user_id)
+    finally:
+        del db.execute
+    [statement] = statements
+    return rows, statement
+
+
+async def explain(db, statement) -> dict:
+    sql = statement.compile(
+        dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}
+    )
+    result = await db.execute(text(f"EXPLAIN (ANALYZE, FORMAT JSON) {sql}"))
+    plan = result.scalar()
+    return (json.loads(plan) if isinstance(plan, str) else plan)[0]["Plan"]
+
+
+def plan_nodes(node: dict):
+    yield node
+    for child in node.get("Plans", []):
+        yield from plan_nodes(child)
+
+
+def study_block_scans(plan: dict) -> list[dict]:
+    return [
+        node for node in plan_nodes(plan) if node.get("Relation Name") == "studyblock"
+    ]
+
+
+async def assert_bounded_range_scan(db, user: User) -> None:
+    query = StudyBlockQuery(start_time=NOW - timedelta(days=30), end_time=NOW, limit=50)
+
+    rows, statement = await run_query(db, user.id, query)
+    plan = await explain(db, statement)
+
+    assert len(rows) == 50
+    assert rows[0].end_time is None
+    scans = study_block_scans(plan)
+    assert all(scan["Node Type"] != "Seq Scan" for scan in scans)
+    [range_scan] = [
+        scan
+        for scan in scans
+        if scan.get("Index Name") == "ix_studyblock_user_id_start_time"
+    ]
+    # Stops after the page, the lookahead row and one more that closes the
+    # sort on id, rather than reading the month's 720 blocks
+    assert range_scan["Actual Rows"] <= query.limit + 2
+
+
+async def test_range_query_uses_a_bounded_index_scan(db, history):
+    await assert_bounded_range_scan(db, history)
+
+
+@pytest.mark.slow
+async def test_range_query_uses_a_bounded_index_scan_at_scale(db, large_history):
+    await assert_bounded_range_scan(db, large_history)
+
+
+async def test_open_block_is_found_through_the_partial_index(db, history):
+    _, statement = await run_query(db, history.id, StudyBlockQuery(limit=10))
+    plan = await explain(db, statement)
+
+    assert "uq_studyblock_user_id_open" in {
+        scan.get("Index Name") for scan in study_block_scans(plan)
+    }
+
+
+async def test_overlap_lookup_reads_a_single_block(db, history):
+    # Starts mid-block, so the block before the range runs into it
+    start_time = NOW - timedelta(hours=10, minutes=40)
+    query = StudyBlockQuery(start_time=start_time, end_time=NOW, overlap=True)
+
+    rows, statement = await run_query(db, history.id, query)
+    plan = await explain(db, statement)
+
+    assert rows[-1].start_time < start_time < rows[-1].end_time
+    scans = study_block_scans(plan)
+    assert all(scan["Node Type"] != "Seq Scan" for scan in scans)
+    [last_before] = [
+        scan
+        for scan in scans
+        if scan.get("Index Name") == "ix_studyblock_user_id_start_time"
+        and ">=" not in scan["Index Cond"]
+    ]
+    # One block, plus the row that closes the sort on id
+    assert last_before["Actual Rows"] <= 2
+
+
+async def test_cursor_pages_cover_every_block_once(db, history):
+    query = StudyBlockQuery(start_time=NOW - timedelta(hours=25), limit=10)
+    seen = []
+    while True:
+        response = Response()
+        rows = await query_study_blocks(response, query, db, history.id)
+        seen.extend(block.id for block in rows)
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+        query = query.model_copy(update={"cursor": cursor})
+
+    # 25 finished blocks in range plus the open one
+    assert len(seen) == len(set(seen)) == 26
+
+
+async def test_second_open_block_is_refused(db, user):
+    await create_study_block(StudyBlockCreate(), db, user.id)
+
+    with pytest.raises(HTTPException) as exc_info:
+        await create_study_block(StudyBlockCreate(), db, user.id)
+
+    assert exc_info.value.status_code == 400
+
+
+async def test_other_integrity_errors_are_not_reported_as_open_blocks(db, user):
+    with pytest.raises(IntegrityError):
+        await create_study_block(
+            StudyBlockCreate(study_category_id=2**31 - 1), db, user.id
+        )
+
+
+async def test_reopening_a_block_while_another_is_open_is_refused(db, user):
+    finished = await create_study_block(StudyBlockCreate(), db, user.id)
+    await update_study_block(
+        finished.id, StudyBlockUpdate(end_time=NOW + timedelta(hours=1)), db, user.id
+    )
+    await create_study_block(StudyBlockCreate(), db, user.id)
+
+    with pytest.raises(HTTPException) as exc_info:
+        await update_study_block(
+            finished.id, StudyBlockUpdate(end_time=None), db, user.id
+        )
+
+    assert exc_info.value.status_code == 400
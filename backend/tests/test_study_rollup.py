@@ -0,0 +1,198 @@
+import importlib.util
+from datetime import UTC, date, datetime, timedelta
+from pathlib import Path
+
+import pytest
+from sqlalchemy import delete, text, update
+from sqlalchemy.future import select
+
+from app.models.daily_study_rollup import DailyStudyRollup
+from app.models.study_block import StudyBlock
+from app.models.study_category import StudyCategory
+from app.models.user import User
+from app.routers.study_block import (
+    create_study_block,
+    delete_study_block,
+    update_study_block,
+)
+from app.routers.study_category import delete_study_category
+from app.routers.user import update_current_user
+from app.schemas.study_block import StudyBlockCreate, StudyBlockUpdate
+from app.schemas.user import UserUpdate
+from app.study_rollup import (
+    apply_block_change,
+    block_contribution,
+    check_user_rollups,
+    lock_rollup_timezone,
+)
+
+pytestmark = pytest.mark.anyio
+
+# Half an hour before midnight UTC, so the local day moves with the timezone
+LATE_EVENING = datetime(2026, 10, 17, 23, 30, tzinfo=UTC)
+
+MIGRATION = (
+    Path(__file__).parent.parent
+    / "alembic"
+    / "versions"
+    / "9a6f3d2e1b57_add_daily_study_rollup_table.py"
+)
+
+
+@pytest.fixture
+async def user(db):
+    user = User(username="rollup-test", email="rollup-test@example.com")
+    db.add(user)
+    await db.commit()
+    return user
+
+
+@pytest.fixture
+async def category(db, user):
+    category = StudyCategory(title="Reading", user_id=user.id)
+    db.add(category)
+    await db.commit()
+    return category
+
+
+async def start_block(
+    db, user: User, start_time: datetime = LATE_EVENING, **fields
+) -> StudyBlock:
+    block = await create_study_block(StudyBlockCreate(**fields), db, user.id)
+    # Moving an unfinished block doesn't touch the rollup
+    await db.execute(
+        update(StudyBlock)
+        .where(StudyBlock.id == block.id)
+        .values(start_time=start_time)
+    )
+    await db.commit()
+    await db.refresh(block)
+    return block
+
+
+async def finish_block(
+    db,
+    user: User,
+    minutes: int = 40,
+    start_time: datetime = LATE_EVENING,
+    rating: float | None = None,
+    **fields,
+) -> StudyBlock:
+    block = await start_block(db, user, start_time, **fields)
+    end_time = start_time + timedelta(minutes=minutes)
+    return await update_study_block(
+        block.id, StudyBlockUpdate(end_time=end_time, rating=rating), db, user.id
+    )
+
+
+async def rollup_days(db, user: User) -> set[date]:
+    result = await db.execute(
+        select(DailyStudyRollup.local_day).where(DailyStudyRollup.user_id == user.id)
+    )
+    return set(result.scalars())
+
+
+async def assert_no_drift(db, user: User) -> None:
+    assert await check_user_rollups(db, user.id) == []
+
+
+async def test_finishing_a_block(db, user, category):
+    await finish_block(db, user, start_time=LATE_EVENING - timedelta(hours=1))
+    await finish_block(db, user, study_category_id=category.id)
+    await start_block(db, user, start_time=LATE_EVENING + timedelta(hours=1))
+
+    await assert_no_drift(db, user)
+
+
+async def test_rerating_a_block(db, user):
+    block = await finish_block(db, user)
+    await finish_block(db, user, start_time=LATE_EVENING - timedelta(hours=1))
+
+    for rating in (4, 2.5, None):
+        await update_study_block(block.id, StudyBlockUpdate(rating=rating), db, user.id)
+        await assert_no_drift(db, user)
+
+
+async def test_deleting_a_block(db, user):
+    block = await finish_block(db, user)
+    await finish_block(db, user, start_time=LATE_EVENING - timedelta(hours=1))
+
+    await delete_study_block(block.id, db, user.id)
+
+    await assert_no_drift(db, user)
+
+
+async def test_changing_a_blocks_category(db, user, category):
+    block = await finish_block(db, user, rating=3)
+    await finish_block(
+        db,
+        user,
+        start_time=LATE_EVENING - timedelta(hours=1),
+        study_category_id=category.id,
+    )
+
+    # The API has no category change, so move it the way the router would
+    timezone = await lock_rollup_timezone(db, user.id)
+    before = block_contribution(block, timezone)
+    block.study_category_id = category.id
+    await apply_block_change(db, user.id, before, block_contribution(block, timezone))
+    await db.commit()
+
+    await assert_no_drift(db, user)
+
+
+async def test_changing_timezone_across_midnight(db, user, redis):
+    await finish_block(db, user)
+    await finish_block(db, user, start_time=LATE_EVENING - timedelta(hours=2))
+    assert await rollup_days(db, user) == {date(2026, 10, 17)}
+
+    await update_current_user(UserUpdate(timezone="Asia/Tokyo"), redis, db, user.id)
+
+    assert await rollup_days(db, user) == {date(2026, 10, 18)}
+    await assert_no_drift(db, user)
+
+
+async def test_deleting_a_category(db, user, category):
+    await finish_block(db, user, study_category_id=category.id)
+    await finish_block(db, user, start_time=LATE_EVENING - timedelta(hours=1))
+
+    await delete_study_category(category.id, db, user.id)
+
+    await assert_no_drift(db, user)
+
+
+async def test_migration_backfill_matches_a_fresh_aggregate(db, user, category):
+    other = User(
+        username="rollup-test-tokyo",
+        email="rollup-test-tokyo@example.com",
+        timezone="Asia/Tokyo",
+    )
+    db.add(other)
+    await db.commit()
+    await finish_block(
+        db,
+        user,
+        start_time=LATE_EVENING - timedelta(hours=1),
+        study_category_id=category.id,
+    )
+    for owner in (user, other):
+        await finish_block(db, owner, rating=4)
+        await finish_block(
+            db,
+            owner,
+            minutes=25,
+            start_time=LATE_EVENING - timedelta(hours=3),
+            rating=2.5,
+        )
+        await finish_block(db, owner, start_time=LATE_EVENING - timedelta(days=2))
+        await start_block(db, owner, start_time=LATE_EVENING + timedelta(hours=1))
+
+    spec = importlib.util.spec_from_file_location("rollup_migration", MIGRATION)
+    migration = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(migration)
+    await db.execute(delete(DailyStudyRollup))
+    await db.execute(text(migration.BACKFILL_SQL))
+
+    for owner in (user, other):
+        await assert_no_drift(db, owner)
+    assert len(await rollup_days(db, user)) == 2
@@ -0,0 +1,182 @@
+import tracemalloc
+from typing import Iterator
+
+import pytest
+from fastapi import HTTPException
+from starlette.requests import Request
+
+from app.uploads.upload_routes import allowed_file
+from app.uploads.upload_stream import receive_image_upload
+
+pytestmark = pytest.mark.anyio
+
+BOUNDARY = b"test-boundary"
+PNG_HEADER = b"\x89PNG\r\n\x1a\n"
+MAX_SIZE = 5 * 1024 * 1024
+CHUNK_SIZE = 64 * 1024
+
+
+def multipart_body(
+    data: bytes | Iterator[bytes],
+    filename: str = "photo.png",
+    field_name: str = "file",
+) -> Iterator[bytes]:
+    """
+    Yield a multipart body with one file field, the file data itself passed
+    through chunk by chunk.
+    """
+    yield (
+        b"--" + BOUNDARY + b"\r\n"
+        b'Content-Disposition: form-data; name="note"\r\n\r\n'
+        b"hello\r\n"
+        b"--" + BOUNDARY + b"\r\n"
+        b'Content-Disposition: form-data; name="' + field_name.encode() + b'"; '
+        b'filename="' + filename.encode() + b'"\r\n'
+        b"Content-Type: application/octet-stream\r\n\r\n"
+    )
+    yield from [data] if isinstance(data, bytes) else data
+    yield b"\r\n--" + BOUNDARY + b"--\r\n"
+
+
+def make_request(chunks: Iterator[bytes], content_length: str | None = None) -> Request:
+    headers = [(b"content-type", b"multipart/form-data; boundary=" + BOUNDARY)]
+    if content_length is not None:
+        headers.append((b"content-length", content_length.encode()))
+    chunks = iter(chunks)
+
+    async def receive():
+        chunk = next(chunks, None)
+        if chunk is None:
+            return {"type": "http.request", "body": b"", "more_body": False}
+        return {"type": "http.request", "body": chunk, "more_body": True}
+
+    return Request(
+        {
+            "type": "http",
+            "method": "POST",
+            "path": "/upload/upload-profile-photo",
+            "headers": headers,
+        },
+        receive,
+    )
+
+
+def file_chunks(size: int, header: bytes = PNG_HEADER) -> Iterator[bytes]:
+    """
+    Yield `size` bytes of file data in network sized chunks, never holding
+    more than one of them.
+    """
+    yield header
+    sent = len(header)
+    while sent < size:
+        chunk = b"\0" * min(CHUNK_SIZE, size - sent)
+        sent += len(chunk)
+        yield chunk
+
+
+async def rejection(request: Request, **kwargs) -> HTTPException:
+    with pytest.raises(HTTPException) as exc_info:
+        async with receive_image_upload(request, MAX_SIZE, **kwargs):
+            pass
+    assert exc_info.value.status_code == 400
+    return exc_info.value
+
+
+async def test_streams_file_to_disk():
+    data = PNG_HEADER + b"\1" * 1000
+    request = make_request(multipart_body(data))
+
+    async with receive_image_upload(request, MAX_SIZE) as upload:
+        with open(upload.path, "rb") as file:
+            assert file.read() == data
+        assert upload.filename == "photo.png"
+        assert upload.image_format == "png"
+        assert upload.size == len(data)
+
+
+async def test_temporary_file_is_removed():
+    request = make_request(multipart_body(PNG_HEADER + b"\1" * 10))
+
+    async with receive_image_upload(request, MAX_SIZE) as upload:
+        path = upload.path
+
+    with pytest.raises(FileNotFoundError):
+        open(path)
+
+
+async def test_signature_split_across_chunks():
+    request = make_request(multipart_body(iter([b"\xff", b"\xd8", b"\xff\xe0rest"])))
+
+    async with receive_image_upload(request, MAX_SIZE) as upload:
+        assert upload.image_format == "jpeg"
+
+
+@pytest.mark.parametrize(
+    "body, detail",
+    [
+        (multipart_body(b"GIF89a" + b"\0" * 100), "File is not a JPEG or PNG"),
+        (multipart_body(b""), "File is not a JPEG or PNG"),
+        (multipart_body(PNG_HEADER, field_name="other"), "No file uploaded"),
+    ],
+)
+async def test_rejects_invalid_uploads(body, detail):
+    assert (await rejection(make_request(body))).detail == detail
+
+
+@pytest.mark.parametrize("content_length", ["abc", "-1", "1e3", ""])
+async def test_rejects_malformed_content_length(content_length):
+    request = make_request(multipart_body(PNG_HEADER), content_length)
+
+    assert (await rejection(request)).detail == "Invalid Content-Length"
+
+
+async def test_rejects_oversized_content_length_before_reading():
+    def unread_body():
+        raise AssertionError("the body should not be read")
+        yield
+
+    request = make_request(unread_body(), str(MAX_SIZE * 2))
+
+    assert "exceeds" in (await rejection(request)).detail
+
+
+async def test_rejects_disallowed_file_type_before_file_data():
+    def body():
+        yield from multipart_body(b"", filename="photo.gif")
+        raise AssertionError("the file data should not be read")
+
+    error = await rejection(make_request(body()), allowed_filename=allowed_file)
+
+    assert error.detail == "File type not allowed"
+
+
+async def test_oversized_upload_is_rejected_while_streaming():
+    received = 0
+
+    def counted(chunks):
+        nonlocal received
+        for chunk in chunks:
+            received += len(chunk)
+            yield chunk
+
+    # No Content-Length, as with chunked transfer encoding
+    request = make_request(counted(multipart_body(file_chunks(MAX_SIZE * 4))))
+
+    assert "exceeds" in (await rejection(request)).detail
+    assert received <= MAX_SIZE + 2 * CHUNK_SIZE
+
+
+async def test_peak_memory_stays_bounded_by_the_chunk_size():
+    size = 2 * 1024 * 1024
+    request = make_request(multipart_body(file_chunks(size)))
+
+    tracemalloc.start()
+    try:
+        async with receive_image_upload(request, MAX_SIZE) as upload:
+            assert upload.size == size
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    # A handful of chunks in flight, nowhere near the whole file
+    assert peak < 8 * CHUNK_SIZE
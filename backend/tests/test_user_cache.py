@@ -0,0 +1,84 @@
+import pytest
+from sqlalchemy import update
+
+from app import user_cache
+from app.models.user import User
+from app.user_cache import (
+    USER_SNAPSHOT_KEY_PREFIX,
+    get_user_snapshot,
+    invalidate_user_snapshot,
+    user_snapshot_cache,
+)
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture(autouse=True)
+def clear_user_snapshot_cache():
+    user_snapshot_cache.clear()
+    yield
+    user_snapshot_cache.clear()
+
+
+@pytest.fixture
+async def user(db):
+    user = User(username="cache-test", email="cache-test@example.com")
+    db.add(user)
+    await db.commit()
+    return user
+
+
+@pytest.fixture
+def serialized(monkeypatch):
+    """
+    Count database loads, which each serialize the user once.
+    """
+    loads = []
+    serialize_user = user_cache.serialize_user
+
+    async def counted(user):
+        loads.append(user.id)
+        return await serialize_user(user)
+
+    monkeypatch.setattr(user_cache, "serialize_user", counted)
+    return loads
+
+
+async def test_snapshot_is_filled_and_served_from_cache(db, redis, user, serialized):
+    first = await get_user_snapshot(redis, db, user.id)
+    user_snapshot_cache.clear()
+
+    assert await get_user_snapshot(redis, db, user.id) == first
+    assert await redis.exists(f"{USER_SNAPSHOT_KEY_PREFIX}{user.id}")
+    assert serialized == [user.id]
+
+
+async def test_fill_racing_an_invalidation_is_dropped(
+    db, redis, user, serialized, monkeypatch
+):
+    user_id = user.id
+    serialize_user = user_cache.serialize_user
+
+    async def invalidated_mid_fill(loaded):
+        snapshot = await serialize_user(loaded)
+        # Another request renames the user after this one read the row
+        await db.execute(
+            update(User).where(User.id == user_id).values(username="renamed")
+        )
+        await db.commit()
+        db.expire_all()
+        await invalidate_user_snapshot(redis, user_id)
+        return snapshot
+
+    monkeypatch.setattr(user_cache, "serialize_user", invalidated_mid_fill)
+    stale = await get_user_snapshot(redis, db, user_id)
+    monkeypatch.setattr(user_cache, "serialize_user", serialize_user)
+
+    assert stale["username"] == "cache-test"
+    assert not await redis.exists(f"{USER_SNAPSHOT_KEY_PREFIX}{user_id}")
+    assert user_snapshot_cache.get(str(user_id)) is None
+
+    fresh = await get_user_snapshot(redis, db, user_id)
+
+    assert fresh["username"] == "renamed"
+    assert serialized == [user_id, user_id]